@@ -2,10 +2,19 @@ import pandas as pd
 import requests
 import json
 import time
+import logging
 from typing import Dict, Any
 import os
-from config import API_CONFIG, DEFAULT_API_PROVIDER, INPUT_FILE, OUTPUT_FILE, REQUEST_DELAY, TIMEOUT, BATCH_SIZE
+from argparse import ArgumentParser
+from config import API_CONFIG, DEFAULT_API_PROVIDER, INPUT_FILE, OUTPUT_FILE, REQUEST_DELAY, TIMEOUT
 from concordance_prompt import make_concordance_prompt  # <-- Import the new prompt function
+from decomposition_concordance_pipeline.metrics import METRICS
+from decomposition_concordance_pipeline.log_utils import ProgressReporter, configure_logging, log_raw_output
+from decomposition_concordance_pipeline.structured_output import StructuredOutputError, parse_concordance, json_mode_options
+from decomposition_concordance_pipeline.token_budget import TokenBudget, PromptTooLargeError
+from decomposition_concordance_pipeline.dry_run import LatencyModel, estimate_concordance, build_report, log_report
+
+logger = logging.getLogger(__name__)
 
 # Remove the old PROMPT_TEMPLATE from this file
 
@@ -28,8 +37,12 @@ class ConcordanceChecker:
             raise ValueError(f"Unsupported API provider: {self.api_provider}. Supported providers: {list(API_CONFIG.keys())}")
         
         self.api_config = API_CONFIG[self.api_provider]
+        # Ask for JSON-only output where the provider has a JSON mode; switched off if it is rejected
+        self.json_mode = bool(json_mode_options(self.api_provider))
+        # Pre-flight prompt size check against the provider's context and budget limits
+        self.token_budget = TokenBudget(self.api_provider, self.api_config['model'])
     
-    def create_concordance_prompt(self, question: str, answer: str, ai_output: str) -> str:
+    def create_concordance_prompt(self, question: str, answer: str, ai_output: str, dav_id: str = None) -> str:
         """
         Create the prompt for checking concordance between answer and ai_output.
         
@@ -37,12 +50,18 @@ class ConcordanceChecker:
             question: The original question
             answer: The human answer
             ai_output: The AI-generated output
+            dav_id: Case id, for the token report
             
         Returns:
-            Formatted prompt string
+            Formatted prompt string, with the longest inputs shortened if it would exceed the token limit
+            
+        Raises:
+            PromptTooLargeError: if the prompt does not fit even with the inputs left out
         """
         # Use the new prompt function from concordance_prompt.py
-        return make_concordance_prompt(question, answer, ai_output)
+        return self.token_budget.fit_fields(
+            make_concordance_prompt, {'question': question, 'answer': answer, 'ai_output': ai_output},
+            'concordance', dav_id)
 
     def query_api(self, prompt: str) -> Dict[str, Any]:
         """
@@ -109,19 +128,44 @@ class ConcordanceChecker:
                 }
             }
         
+        if self.json_mode:
+            for key, value in json_mode_options(self.api_provider).items():
+                payload[key] = dict(payload.get(key, {}), **value) if isinstance(value, dict) and key in payload else value
+        
         # Prepare URL
         url = self.api_config['url']
         if self.api_provider == 'gemini':
             url = f"{url}?key={self.api_key}"
         
+        start = time.perf_counter()
         try:
             # Use json parameter for automatic JSON serialization
             response = requests.post(url, headers=headers, json=payload, timeout=TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            result = response.json()
         except requests.exceptions.RequestException as e:
-            print(f"API request failed: {e}")
+            METRICS.record_call('concordance', self.api_config['model'], time.perf_counter() - start, error=e)
+            if self.json_mode and getattr(e.response, 'status_code', None) == 400:
+                logger.info("Provider rejected JSON mode; retrying without it")
+                self.json_mode = False
+                return self.query_api(prompt)
+            logger.warning("API request failed: %s", e)
             return {'error': str(e)}
+        METRICS.record_call('concordance', self.api_config['model'], time.perf_counter() - start,
+                            usage=self._extract_usage(result))
+        return result
+
+    def _extract_usage(self, api_response: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Normalize provider-specific token usage to prompt/completion counts.
+        """
+        if self.api_provider == 'anthropic':
+            usage = api_response.get('usage', {})
+            return {'prompt_tokens': usage.get('input_tokens', 0), 'completion_tokens': usage.get('output_tokens', 0)}
+        if self.api_provider == 'gemini':
+            usage = api_response.get('usageMetadata', {})
+            return {'prompt_tokens': usage.get('promptTokenCount', 0), 'completion_tokens': usage.get('candidatesTokenCount', 0)}
+        return api_response.get('usage', {})
 
     def extract_concordance_result(self, api_response: Dict[str, Any]) -> str:
         """
@@ -154,22 +198,23 @@ class ConcordanceChecker:
         except (KeyError, IndexError) as e:
             return f"ERROR: Failed to parse API response: {e}"
 
-    def process_csv(self, input_file: str = INPUT_FILE, output_file: str = OUTPUT_FILE):
+    def process_csv(self, input_file: str = INPUT_FILE, output_file: str = OUTPUT_FILE, metrics_file: str = None):
         """
         Process the CSV file and add concordance results.
         
         Args:
             input_file: Path to the input CSV file
             output_file: Path to the output CSV file
+            metrics_file: Path for the run metrics JSON (defaults to run_metrics.json next to output_file)
         """
-        print(f"Reading CSV file: {input_file}")
-        print(f"Using API provider: {self.api_provider}")
+        logger.info(f"Reading CSV file: {input_file}")
+        logger.info(f"Using API provider: {self.api_provider}")
         
         try:
             # Read the CSV file
             df = pd.read_csv(input_file)
-            print(f"Found {len(df)} rows to process")
-            print("Columns in DataFrame:", df.columns.tolist())  # Debug print
+            logger.info(f"Found {len(df)} rows to process")
+            logger.debug("Columns in DataFrame: %s", df.columns.tolist())
             
             # Add new columns for concordance results
             df['concordant'] = ''
@@ -177,59 +222,133 @@ class ConcordanceChecker:
             df['explanation'] = ''
             
             # Process each row
-            for index, row in df.iterrows():
-                print(f"Processing row {index + 1}/{len(df)} (ID: {row['dav_id']})")
-                
-                # Create the prompt
-                prompt = self.create_concordance_prompt(
-                    question=row['question'],
-                    answer=row['answer'],
-                    ai_output=row['ai_answer']
-                )
-                
-                # Query the API
-                api_response = self.query_api(prompt)
-                
-                # Extract the result
-                concordance_result = self.extract_concordance_result(api_response)
-                
-                # Store the result
-                try:
-                    start = concordance_result.find('{')
-                    end = concordance_result.rfind('}') + 1
-                    json_str = concordance_result[start:end]
-                    parsed = json.loads(json_str)
-                    df.at[index, 'concordant'] = parsed.get('concordant', '')
-                    df.at[index, 'helpfulness'] = parsed.get('helpfulness', '')  # Extract helpfulness
-                    df.at[index, 'explanation'] = parsed.get('explanation', '')
-                except Exception as e:
-                    df.at[index, 'concordant'] = ''
-                    df.at[index, 'helpfulness'] = ''
-                    df.at[index, 'explanation'] = f'ERROR: Could not parse JSON: {e}\nRaw: {concordance_result}'
-                
-                # Add a small delay to avoid rate limiting
-                time.sleep(REQUEST_DELAY)
-                
-                # Print progress
-                if (index + 1) % BATCH_SIZE == 0:
-                    print(f"Completed {index + 1}/{len(df)} rows")
+            with METRICS.stage('concordance', items=len(df)):
+                self._process_rows(df)
             
             # Save the results
-            print(f"Saving results to: {output_file}")
+            logger.info(f"Saving results to: {output_file}")
             df.to_csv(output_file, index=False)
-            print("Processing completed successfully!")
+            metrics_file = metrics_file or os.path.join(os.path.dirname(output_file), 'run_metrics.json')
+            METRICS.write_json(metrics_file)
+            logger.info(f"Saved run metrics to: {metrics_file}")
+            token_report_file = os.path.join(os.path.dirname(metrics_file), 'token_report.json')
+            with open(token_report_file, 'w') as f:
+                json.dump(self.token_budget.report(), f, indent=2)
+            logger.info(f"Saved prompt token report to: {token_report_file}")
+            logger.info("Processing completed successfully!")
             
         except FileNotFoundError:
-            print(f"Error: Input file '{input_file}' not found.")
+            logger.error(f"Error: Input file '{input_file}' not found.")
         except Exception as e:
-            print(f"Error processing CSV: {e}")
+            logger.error(f"Error processing CSV: {e}")
+
+    def _process_rows(self, df: pd.DataFrame):
+        """
+        Query the API for every row and store the parsed results in df.
+        
+        Args:
+            df: DataFrame with question, answer and ai_answer columns
+        """
+        progress = ProgressReporter("Concordance", total=len(df), logger=logger)
+        for index, row in df.iterrows():
+            logger.debug("concordance request", extra={'row': index + 1, 'dav_id': row['dav_id']})
+            
+            # Create the prompt
+            try:
+                prompt = self.create_concordance_prompt(
+                    question=row['question'],
+                    answer=row['answer'],
+                    ai_output=row['ai_answer'],
+                    dav_id=row['dav_id']
+                )
+            except PromptTooLargeError as e:
+                df.at[index, 'explanation'] = f'ERROR: {e}'
+                logger.warning("Skipping dav_id %s: %s", row['dav_id'], e)
+                progress.update()
+                continue
+            
+            # Query the API
+            api_response = self.query_api(prompt)
+            
+            # Extract the result
+            concordance_result = self.extract_concordance_result(api_response)
+            
+            # Store the result
+            try:
+                parsed, repaired = parse_concordance(concordance_result)
+                if repaired:
+                    logger.info("Recovered truncated concordance output for dav_id %s", row['dav_id'])
+                df.at[index, 'concordant'] = parsed.get('concordant', '')
+                df.at[index, 'helpfulness'] = parsed.get('helpful', '')  # Extract helpfulness
+                df.at[index, 'explanation'] = parsed.get('explanation', '')
+            except StructuredOutputError as e:
+                df.at[index, 'concordant'] = ''
+                df.at[index, 'helpfulness'] = ''
+                df.at[index, 'explanation'] = f'ERROR: Could not parse JSON: {e}\nRaw: {concordance_result}'
+                logger.warning("Could not parse JSON for dav_id %s: %s", row['dav_id'], e)
+                log_raw_output(logger, concordance_result, dav_id=row['dav_id'])
+            
+            # Add a small delay to avoid rate limiting
+            time.sleep(REQUEST_DELAY)
+            
+            progress.update()
+        progress.close()
+
+def dry_run(input_file: str, api_provider: str, metrics_file: str = None) -> Dict[str, Any]:
+    """
+    Estimate calls, tokens, cost and wall time of a run over input_file without sending any request.
+    
+    Args:
+        input_file: Path to the input CSV file
+        api_provider: API provider name, for its model and token limits
+        metrics_file: run_metrics.json of an earlier run, to calibrate call latency
+        
+    Returns:
+        The dry-run report (see decomposition_concordance_pipeline/dry_run.py)
+    """
+    df = pd.read_csv(input_file)
+    token_budget = TokenBudget(api_provider, API_CONFIG[api_provider]['model'])
+    latency = LatencyModel.from_run_metrics(metrics_file) if metrics_file else LatencyModel()
+    estimate = estimate_concordance(df.to_dict('records'), make_concordance_prompt, token_budget, latency,
+                                    request_delay=REQUEST_DELAY)
+    # Rows are sent one at a time
+    report = build_report(len(df), {estimate.stage: estimate}, estimate.busy_seconds, token_budget, latency,
+                          request_delay_seconds=REQUEST_DELAY)
+    log_report(report)
+    return report
+
+def parse_args():
+    parser = ArgumentParser(description="Concordance Checker")
+    parser.add_argument("--input_file", type=str, default=INPUT_FILE, help="Path to the input CSV file")
+    parser.add_argument("--output_file", type=str, default=OUTPUT_FILE, help="Path to the output CSV file")
+    parser.add_argument("--dry-run", "--dry_run", dest="dry_run", action="store_true",
+                        help="Build and tokenize every prompt and estimate calls, tokens, cost and wall time "
+                             "without sending requests; writes dry_run_report.json next to the output file")
+    parser.add_argument("--dry_run_metrics", type=str, default=None,
+                        help="run_metrics.json of an earlier run; its mean call latency calibrates the dry run")
+    return parser.parse_args()
 
 def main():
     """
     Main function to run the concordance checker.
     """
+    args = parse_args()
     print("Concordance Checker (GPT-4.1, JSON output)")
     print("==================")
+    configure_logging(
+        os.getenv('LOG_LEVEL', 'INFO'),
+        json_lines=os.getenv('LOG_JSON') == '1',
+        raw_output_sample_rate=float(os.getenv('RAW_OUTPUT_SAMPLE_RATE', '0')),
+    )
+    
+    if args.dry_run:
+        # No API key needed: nothing is sent
+        report = dry_run(args.input_file, os.getenv('API_PROVIDER', DEFAULT_API_PROVIDER), args.dry_run_metrics)
+        report_file = os.path.join(os.path.dirname(args.output_file), 'dry_run_report.json')
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved dry run report to: {report_file}")
+        return
     
     # Check if environment variables are set
     api_key = os.getenv('STANFORD_API_KEY') or os.getenv('API_KEY') or os.getenv('GEMINI_API_KEY')
@@ -249,7 +368,7 @@ def main():
         checker = ConcordanceChecker(api_key=api_key, api_provider=api_provider)
         
         # Process the CSV file
-        checker.process_csv()
+        checker.process_csv(args.input_file, args.output_file)
         
     except ValueError as e:
         print(f"Configuration error: {e}")
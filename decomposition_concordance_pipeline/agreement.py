@@ -0,0 +1,255 @@
+"""
+Agreement statistics between the human raters and MedScore
+
+The human concordance ratings (``Concordance``, the best-of-3 vote, and
+``Concordance_Vishnu``, ``Concordance_Saloni``, ``Concordance_Jessica``) and
+MedScore's ``support_percentage`` thresholded into a concordance prediction
+are treated as raters of the same cases. For every pair of raters the table
+has percent agreement and Cohen's kappa. For each group in ``RATER_GROUPS``
+it has Fleiss' kappa and Krippendorff's alpha (nominal). A case a rater left
+blank is missing for that rater only:
+- pairwise statistics use the cases both raters rated
+- Fleiss' kappa uses the cases every rater of the group rated
+- Krippendorff's alpha uses every case with at least two ratings
+
+All statistics are computed from one-hot rating arrays with weights per
+case, so a bootstrap replicate is just a row of multinomial case weights. A
+batch of replicates is then a handful of matrix products. Replicates are
+split into fixed jobs with their own seeds and run on a process pool. The
+confidence intervals depend on ``--seed`` but not on ``--workers``.
+
+    python -m decomposition_concordance_pipeline.agreement --results test_results_gpt4.1/final_output.jsonl \\
+        --csv SAGE_Web_Interface_Standalone/data/GPT-4.1_Concordance_Eval_Saloni.csv --threshold 80
+"""
+
+import os
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .log_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Display name -> column, as in figs/ROC/roc_plot.py
+HUMAN_RATERS = {
+    'Best-of-3': 'Concordance',
+    'Vishnu': 'Concordance_Vishnu',
+    'Saloni': 'Concordance_Saloni',
+    'Jessica': 'Concordance_Jessica',
+}
+MEDSCORE = 'MedScore'
+# Multi-rater statistics; the best-of-3 vote is left out since it is derived from the individual raters
+RATER_GROUPS = {
+    'humans': ['Vishnu', 'Saloni', 'Jessica'],
+    'humans+MedScore': ['Vishnu', 'Saloni', 'Jessica', MEDSCORE],
+}
+CATEGORIES = (0, 1)
+# Bootstrap replicates per job (and per weight matrix held in memory)
+BOOTSTRAP_BATCH = 200
+
+
+def load_ratings(results_file: str, csv_file: Optional[str] = None, threshold: float = 80.0) -> pd.DataFrame:
+    """
+    One row per case and one column per rater, holding 0, 1 or NaN. Rater
+    columns missing from the results (MedScore's final_output.jsonl) are
+    taken from the export CSV, joined on dav_id. MedScore rates a case
+    concordant if its support percentage is at least ``threshold``. For an
+    early-stopped case that is its ``early_stop`` prediction if the run used
+    the same threshold; otherwise MedScore's rating of the case is missing.
+    """
+    results = pd.read_json(results_file, lines=True, dtype={'dav_id': str})
+    results['dav_id'] = results['dav_id'].astype(str)
+    if csv_file is not None:
+        missing = [column for column in HUMAN_RATERS.values() if column not in results.columns]
+        if missing:
+            from .medscore import CSV_ENCODING
+            export = pd.read_csv(csv_file, encoding=CSV_ENCODING, dtype={'dav_id': str},
+                                 usecols=lambda column: column == 'dav_id' or column in missing)
+            results = results.merge(export.drop_duplicates('dav_id'), on='dav_id', how='left')
+    ratings = pd.DataFrame(index=results['dav_id'].rename('dav_id'))
+    for name, column in HUMAN_RATERS.items():
+        if column not in results.columns:
+            logger.warning(f"No {column} column; leaving out rater {name}")
+            continue
+        values = pd.to_numeric(results[column], errors='coerce').to_numpy()
+        ratings[name] = np.where(np.isin(values, CATEGORIES), values, np.nan)
+    if 'support_percentage' in results.columns:
+        support = pd.to_numeric(results['support_percentage'].astype(str).str.rstrip('%'), errors='coerce').to_numpy()
+    else:
+        support = np.full(len(results), np.nan)
+    medscore = np.where(np.isnan(support), np.nan, (support >= threshold).astype(float))
+    if 'early_stop' in results.columns:
+        # Early-stopped cases have no full support percentage, only the call at the run's threshold
+        early_stop = results['early_stop'].to_numpy()
+        stopped = np.array([isinstance(record, dict) for record in early_stop])
+        same_threshold = np.array([stopped[i] and float(early_stop[i]['threshold']) == float(threshold)
+                                   for i in range(len(early_stop))], dtype=bool)
+        medscore[same_threshold] = [float(early_stop[i]['predicted_concordant']) for i in np.flatnonzero(same_threshold)]
+        medscore[stopped & ~same_threshold] = np.nan
+        excluded = int((stopped & ~same_threshold).sum())
+        if excluded:
+            logger.warning(f"Leaving out MedScore's rating of {excluded} cases early-stopped at a threshold "
+                           f"other than {threshold}")
+    ratings[MEDSCORE] = medscore
+    return ratings
+
+
+def one_hot(ratings: np.ndarray) -> np.ndarray:
+    """(cases, raters) ratings with NaN for missing -> (cases, raters, categories) indicators"""
+    return np.stack([ratings == category for category in CATEGORIES], axis=-1).astype(float)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / denominator, np.nan)
+
+
+def pairwise_statistics(indicators: np.ndarray, weights: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Percent agreement and Cohen's kappa for every rater pair, per row of
+    ``weights`` (replicates, cases). Returns (replicates, raters, raters) arrays.
+    """
+    cases, raters, k = indicators.shape
+    flat = indicators.reshape(cases, raters * k)
+    # joint[b, a, i, c, j]: weighted cases rater a put in category i and rater c in category j
+    joint = np.matmul((weights[:, :, None] * flat[None]).transpose(0, 2, 1), flat).reshape(-1, raters, k, raters, k)
+    n = joint.sum(axis=(2, 4))
+    observed = _ratio(np.einsum('baicj,ij->bac', joint, np.eye(k)), n)
+    first = _ratio(joint.sum(axis=4), n[:, :, None, :])
+    second = _ratio(joint.sum(axis=2), n[:, :, :, None])
+    expected = np.einsum('baic,baci->bac', first, second)
+    return {'n': n, 'agreement': observed, 'cohen_kappa': _ratio(observed - expected, 1 - expected)}
+
+
+def fleiss_kappa(indicators: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Fleiss' kappa over the cases every rater rated, per row of ``weights``; also returns the case count"""
+    counts = indicators.sum(axis=1)
+    raters = indicators.shape[1]
+    complete = (counts.sum(axis=1) == raters).astype(float)
+    counts = counts * complete[:, None]
+    per_case = ((counts ** 2).sum(axis=1) - raters * complete) / (raters * (raters - 1))
+    cases = weights @ complete
+    observed = _ratio(weights @ per_case, cases)
+    shares = _ratio(weights @ counts, (cases * raters)[:, None])
+    expected = (shares ** 2).sum(axis=1)
+    return _ratio(observed - expected, 1 - expected), cases
+
+
+def krippendorff_alpha(indicators: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Nominal Krippendorff's alpha over cases with at least two ratings, per row of ``weights``"""
+    counts = indicators.sum(axis=1)
+    k = counts.shape[1]
+    rated = counts.sum(axis=1)
+    pairable = np.where(rated >= 2, 1 / np.maximum(rated - 1, 1), 0.0)
+    # Coincidences contributed by each case, flattened to (cases, k * k)
+    per_case = (counts[:, :, None] * counts[:, None, :] - counts[:, :, None] * np.eye(k)) * pairable[:, None, None]
+    coincidences = (weights @ per_case.reshape(len(counts), k * k)).reshape(-1, k, k)
+    totals = coincidences.sum(axis=2)
+    n = totals.sum(axis=1)
+    off_diagonal = 1 - np.eye(k)
+    disagreement = (coincidences * off_diagonal).sum(axis=(1, 2))
+    expected = (totals[:, :, None] * totals[:, None, :] * off_diagonal).sum(axis=(1, 2))
+    return 1 - (n - 1) * _ratio(disagreement, expected), weights @ (rated >= 2).astype(float)
+
+
+def all_statistics(indicators: np.ndarray, names: List[str], weights: np.ndarray) -> Dict[str, np.ndarray]:
+    """Every statistic of the table as a (replicates,) array, keyed by table row and column"""
+    stats = {}
+    pairwise = pairwise_statistics(indicators, weights)
+    for a, b in combinations(range(len(names)), 2):
+        row = f"{names[a]} vs {names[b]}"
+        stats[(row, 'n')] = pairwise['n'][:, a, b]
+        stats[(row, 'percent_agreement')] = pairwise['agreement'][:, a, b] * 100
+        stats[(row, 'cohen_kappa')] = pairwise['cohen_kappa'][:, a, b]
+    for group, members in RATER_GROUPS.items():
+        columns = [names.index(member) for member in members if member in names]
+        if len(columns) < 2:
+            continue
+        stats[(group, 'fleiss_kappa')], stats[(group, 'n')] = fleiss_kappa(indicators[:, columns], weights)
+        stats[(group, 'krippendorff_alpha')], _ = krippendorff_alpha(indicators[:, columns], weights)
+    return stats
+
+
+def _bootstrap_job(indicators: np.ndarray, names: List[str], replicates: int,
+                   seed: np.random.SeedSequence) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    cases = len(indicators)
+    weights = rng.multinomial(cases, np.full(cases, 1.0 / cases), size=replicates).astype(float)
+    return all_statistics(indicators, names, weights)
+
+
+def bootstrap(indicators: np.ndarray, names: List[str], replicates: int = 2000, seed: int = 0,
+              workers: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Statistics of ``replicates`` case resamples, computed in jobs of BOOTSTRAP_BATCH on ``workers`` processes"""
+    sizes = [min(BOOTSTRAP_BATCH, replicates - start) for start in range(0, replicates, BOOTSTRAP_BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(indicators, names, size, job_seed) for size, job_seed in zip(sizes, seeds)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        results = [_bootstrap_job(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(_bootstrap_job, *zip(*jobs)))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def agreement_table(ratings: pd.DataFrame, replicates: int = 2000, confidence: float = 0.95, seed: int = 0,
+                    workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    The agreement table: one row per rater pair (n, percent agreement,
+    Cohen's kappa) and per rater group (n, Fleiss' kappa, Krippendorff's
+    alpha), with percentile bootstrap confidence intervals.
+    """
+    names = list(ratings.columns)
+    indicators = one_hot(ratings.to_numpy(dtype=float))
+    point = all_statistics(indicators, names, np.ones((1, len(indicators))))
+    samples = bootstrap(indicators, names, replicates, seed, workers) if replicates else {}
+    tail = (1 - confidence) / 2 * 100
+    rows = {}
+    for (row, statistic), value in point.items():
+        entry = rows.setdefault(row, {})
+        entry[statistic] = value[0]
+        if statistic != 'n' and samples:
+            with np.errstate(all='ignore'):
+                entry[f"{statistic}_low"], entry[f"{statistic}_high"] = np.nanpercentile(
+                    samples[(row, statistic)], [tail, 100 - tail])
+    table = pd.DataFrame.from_dict(rows, orient='index')
+    table.index.name = 'raters'
+    table['n'] = table['n'].astype(int)
+    return table
+
+
+def parse_args():
+    parser = ArgumentParser(description="Agreement between the human concordance raters and MedScore")
+    parser.add_argument("--results", required=True, type=str, help="final_output.jsonl of a MedScore run")
+    parser.add_argument("--csv", type=str, default=None,
+                        help="Export CSV with the rater columns, if they are not in the results file")
+    parser.add_argument("--threshold", type=float, default=80.0,
+                        help="Support percentage at or above which MedScore rates a case concordant")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="Bootstrap replicates for the CIs (0 to skip)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--seed", type=int, default=0, help="Bootstrap seed")
+    parser.add_argument("--workers", type=int, default=None, help="Bootstrap processes (default: all cores)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Path for the table as CSV (default: agreement.csv next to the results)")
+    parser.add_argument("--log_level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(args.log_level)
+    ratings = load_ratings(args.results, args.csv, args.threshold)
+    logger.info(f"Loaded {len(ratings)} cases rated by {', '.join(ratings.columns)}")
+    table = agreement_table(ratings, args.bootstrap, args.confidence, args.seed, args.workers)
+    output = args.output or os.path.join(os.path.dirname(args.results), "agreement.csv")
+    table.to_csv(output)
+    with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.precision', 3):
+        print(table)
+    logger.info(f"Saved agreement table to {output}")
@@ -1,17 +1,251 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+import backoff
 import requests
-from .config import API_CONFIG, TIMEOUT
+from .config import API_CONFIG, TIMEOUT, MAX_RETRIES
+from .metrics import METRICS, percentile
 
-def query_stanford_api(messages, api_key, model=None, max_tokens=None, temperature=None):
-    config = API_CONFIG['stanford']
-    url = config['url']
-    headers = config['headers'].copy()
-    headers['Ocp-Apim-Subscription-Key'] = api_key
-    payload = {
+
+class RateLimiter(object):
+    """
+    Spaces out requests so that at most ``requests_per_minute`` start per
+    minute. One limiter can be shared by every thread calling the same provider.
+    """
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HedgePolicy(object):
+    """
+    Hedged requests: if a call has not answered after the ``percentile``-th
+    latency of its stage so far, send a duplicate (optionally to another
+    deployment and/or model) and use whichever answers first.
+
+    Until a stage has ``min_samples`` successful calls, ``initial_delay``
+    seconds is used as the delay. Duplicates are capped at
+    ``max_extra_fraction`` of all hedge-eligible calls. A losing request cannot
+    be interrupted once it is on the wire; it is cancelled if it has not
+    started yet, and otherwise finishes in the background with its answer
+    discarded. Losers are recorded in METRICS under ``<stage>/hedged`` so
+    their tokens still count towards cost.
+    """
+    # Recompute a stage's delay after this many new latencies
+    REFRESH_EVERY = 20
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, initial_delay: float = TIMEOUT / 2,
+                 max_extra_fraction: float = 0.05, url: Optional[str] = None, model: Optional[str] = None,
+                 max_workers: int = 64):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.max_extra_fraction = max_extra_fraction
+        self.url = url
+        self.model = model
+        # Original and duplicate run here while the caller waits for the first answer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._delays = {}
+
+    def delay(self, stage: Optional[str]) -> float:
+        latencies = METRICS.latencies(stage or 'unknown')
+        with self._lock:
+            count, delay = self._delays.get(stage, (0, None))
+            if len(latencies) < self.min_samples:
+                return self.initial_delay
+            if delay is None or len(latencies) - count >= self.REFRESH_EVERY:
+                delay = percentile(latencies, self.percentile)
+                self._delays[stage] = (len(latencies), delay)
+            return delay
+
+    def count_call(self) -> None:
+        with self._lock:
+            self._calls += 1
+
+    def try_acquire(self) -> bool:
+        """Take one duplicate from the budget, if any is left"""
+        with self._lock:
+            if self._hedges + 1 > self.max_extra_fraction * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+
+def _record_loser(future, stage, model, start):
+    if future.cancelled():
+        return
+    error = future.exception()
+    usage = None if error is not None else future.result().get('usage')
+    METRICS.record_call(f"{stage or 'unknown'}/hedged", model, time.perf_counter() - start, usage=usage, error=error)
+
+
+def _hedged_post(url, headers, payload, stage, rate_limiter, hedge: HedgePolicy, post=None) -> Dict[str, Any]:
+    post = post or _post
+    start = time.perf_counter()
+    hedge.count_call()
+    primary = hedge.executor.submit(post, url, headers, payload, stage=stage, rate_limiter=rate_limiter)
+    done, _ = wait([primary], timeout=hedge.delay(stage))
+    if done or not hedge.try_acquire():
+        return primary.result()
+    hedge_payload = dict(payload, model=hedge.model) if hedge.model else payload
+    duplicate = hedge.executor.submit(post, hedge.url or url, headers, hedge_payload, stage=stage,
+                                      rate_limiter=rate_limiter)
+    METRICS.record_hedge(stage)
+    models = {primary: payload['model'], duplicate: hedge_payload['model']}
+    pending = {primary, duplicate}
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                first_error = first_error or future.exception()
+                continue
+            if future is duplicate:
+                METRICS.record_hedge(stage, won=True)
+            for loser in pending:
+                if not loser.cancel():
+                    loser.add_done_callback(lambda f: _record_loser(f, stage, models[f], start))
+            return future.result()
+    raise first_error
+
+
+def _giveup(e: requests.exceptions.RequestException) -> bool:
+    # Retry rate limits, server errors, timeouts and dropped connections only
+    response = getattr(e, 'response', None)
+    if response is None:
+        return False
+    return response.status_code != 429 and response.status_code < 500
+
+
+def _record_retry(details):
+    METRICS.record_retry(details['kwargs'].get('stage'))
+
+
+@backoff.on_exception(
+    backoff.expo,
+    requests.exceptions.RequestException,
+    max_tries=MAX_RETRIES,
+    giveup=_giveup,
+    on_backoff=_record_retry,
+)
+def _post(url, headers, payload, stage=None, rate_limiter=None):
+    # Retries go through the limiter too, so they count against the provider quota
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    response = requests.post(url, headers=headers, json=payload, timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+@backoff.on_exception(
+    backoff.expo,
+    requests.exceptions.RequestException,
+    max_tries=MAX_RETRIES,
+    giveup=_giveup,
+    on_backoff=_record_retry,
+)
+def _open_stream(url, headers, payload, stage=None, rate_limiter=None):
+    # Only opening the stream is retried; a stream that breaks midway is not replayed
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    response = requests.post(url, headers=headers, json=payload, timeout=TIMEOUT, stream=True)
+    response.raise_for_status()
+    return response
+
+
+def _build_payload(config: Dict[str, Any], messages, model, max_tokens, temperature) -> Dict[str, Any]:
+    return {
         'model': model or config['model'],
         'messages': messages,
         'max_tokens': max_tokens if max_tokens is not None else config['max_tokens'],
         'temperature': temperature if temperature is not None else config['temperature'],
     }
-    response = requests.post(url, headers=headers, json=payload, timeout=TIMEOUT)
-    response.raise_for_status()
-    return response.json() 
\ No newline at end of file
+
+
+def query_stanford_api(messages, api_key, model=None, max_tokens=None, temperature=None, stage=None,
+                       url: Optional[str] = None, rate_limiter: Optional[RateLimiter] = None, n: int = 1,
+                       response_format: Optional[dict] = None, hedge: Optional[HedgePolicy] = None,
+                       endpoint_pools: Optional[Mapping[str, Any]] = None):
+    config = API_CONFIG['stanford']
+    url = url or config['url']
+    headers = config['headers'].copy()
+    headers['Ocp-Apim-Subscription-Key'] = api_key
+    payload = _build_payload(config, messages, model, max_tokens, temperature)
+    if n > 1:
+        payload['n'] = n
+    if response_format is not None:
+        payload['response_format'] = response_format
+    # A model with an endpoint pool is load balanced across its deployments instead of using url
+    pool = endpoint_pools.get(payload['model']) if endpoint_pools else None
+    post = _post if pool is None else pool.post
+    start = time.perf_counter()
+    try:
+        if hedge is None:
+            response = post(url, headers, payload, stage=stage, rate_limiter=rate_limiter)
+        else:
+            response = _hedged_post(url, headers, payload, stage, rate_limiter, hedge, post)
+    except Exception as e:
+        METRICS.record_call(stage, payload['model'], time.perf_counter() - start, error=e)
+        raise
+    METRICS.record_call(stage, payload['model'], time.perf_counter() - start, usage=response.get('usage'))
+    return response
+
+
+def stream_stanford_api(messages, api_key, model=None, max_tokens=None, temperature=None, stage=None,
+                        url: Optional[str] = None, rate_limiter: Optional[RateLimiter] = None,
+                        response_format: Optional[dict] = None) -> Iterator[str]:
+    """
+    Streamed chat completion: yields the content deltas of an SSE
+    (``"stream": true``) response as they arrive. The call is recorded in
+    METRICS when the stream ends, including the time to the first token.
+    """
+    config = API_CONFIG['stanford']
+    url = url or config['url']
+    headers = config['headers'].copy()
+    headers['Ocp-Apim-Subscription-Key'] = api_key
+    payload = _build_payload(config, messages, model, max_tokens, temperature)
+    payload['stream'] = True
+    if response_format is not None:
+        payload['response_format'] = response_format
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    try:
+        response = _open_stream(url, headers, payload, stage=stage, rate_limiter=rate_limiter)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                # Endpoints that report usage on a stream send it with the last chunk
+                usage = event.get('usage') or usage
+                for choice in event.get('choices') or []:
+                    content = (choice.get('delta') or {}).get('content')
+                    if content:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        yield content
+    except Exception as e:
+        METRICS.record_call(stage, payload['model'], time.perf_counter() - start, error=e,
+                            first_token_latency=first_token)
+        raise
+    METRICS.record_call(stage, payload['model'], time.perf_counter() - start, usage=usage,
+                        first_token_latency=first_token)
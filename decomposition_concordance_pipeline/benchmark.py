@@ -0,0 +1,180 @@
+"""
+End-to-end throughput benchmark against the offline mock LLM server
+
+Runs MedScore.decompose / MedScore.verify and ConcordanceChecker.process_csv
+on synthetic cohorts and reports items/sec and tail latency per stage. The
+JSON report can be passed back with --baseline to flag regressions.
+
+Run from the repository root (the decomposer reads prompt/ relative to it):
+
+    python -m decomposition_concordance_pipeline.benchmark --sizes 100 1000 10000
+"""
+
+import os
+import json
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from .config import API_CONFIG
+from .metrics import METRICS
+from .medscore import MedScore, ProvidedEvidence
+from .mock_server import MockConfig, start_mock_server
+
+SUBJECTS = ['The patient', 'Her INR', 'The hemoglobin', 'The echocardiogram', 'The colonoscopy', 'His creatinine']
+PREDICATES = ['shows', 'is consistent with', 'does not suggest', 'supports', 'rules out', 'warrants follow-up for']
+OBJECTS = ['iron deficiency', 'atrial fibrillation', 'a DOAC', 'thrombophilia workup', 'renal impairment', 'anemia']
+
+
+def make_cohort(size: int, seed: int = 0, min_sentences: int = 4, max_sentences: int = 12) -> List[Dict[str, str]]:
+    """Build ``size`` synthetic cases shaped like rows of the input CSV."""
+    rng = random.Random(seed)
+
+    def sentences(k):
+        return ' '.join(f"{rng.choice(SUBJECTS)} {rng.choice(PREDICATES)} {rng.choice(OBJECTS)}." for _ in range(k))
+
+    return [
+        {
+            'id': str(100000 + i),
+            'question': sentences(3),
+            'answer': sentences(rng.randint(min_sentences, max_sentences)),
+            'ai_answer': sentences(rng.randint(min_sentences, max_sentences)),
+        }
+        for i in range(size)
+    ]
+
+
+def _stage_report(summary: Dict[str, Any], stage: str, items: int, seconds: float) -> Dict[str, Any]:
+    calls = summary['llm_calls'].get(stage, {})
+    latency = calls.get('latency_seconds', {})
+    return {
+        'items': items,
+        'seconds': seconds,
+        'items_per_second': items / seconds if seconds > 0 else None,
+        'calls': calls.get('calls', 0),
+        'errors': calls.get('errors', 0),
+        'retries': calls.get('retries', 0),
+        'latency_p50': latency.get('p50'),
+        'latency_p95': latency.get('p95'),
+        'latency_p99': latency.get('p99'),
+    }
+
+
+def bench_medscore(cohort: List[Dict[str, str]]) -> Dict[str, Any]:
+    scorer = MedScore(
+        model_name_decomposition=API_CONFIG['stanford']['model'],
+        server_decomposition=API_CONFIG['stanford']['url'],
+        model_name_verification=API_CONFIG['stanford']['model'],
+        server_verification=API_CONFIG['stanford']['url'],
+        response_key='ai_answer',
+        api_key='mock',
+    )
+    start = time.perf_counter()
+    decompositions = scorer.decompose(cohort)
+    decompose_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    verifications = scorer.verify(decompositions, ProvidedEvidence(cohort))
+    verify_seconds = time.perf_counter() - start
+    summary = METRICS.summary()
+    return {
+        'decompose': _stage_report(summary, 'decompose', len(cohort), decompose_seconds),
+        'verify': _stage_report(summary, 'verify', len(verifications), verify_seconds),
+    }
+
+
+def bench_concordance(cohort: List[Dict[str, str]], url: str) -> Optional[Dict[str, Any]]:
+    try:
+        import concordance_checker
+    except ImportError as e:
+        print(f"Skipping ConcordanceChecker benchmark: {e}")
+        return None
+    # The fixed inter-request sleep would dominate the measurement
+    concordance_checker.REQUEST_DELAY = 0
+    checker = concordance_checker.ConcordanceChecker(api_key='mock', api_provider='stanford')
+    checker.api_config = dict(checker.api_config, url=url)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'cohort.csv')
+        pd.DataFrame([{'dav_id': c['id'], 'question': c['question'], 'answer': c['answer'],
+                       'ai_answer': c['ai_answer']} for c in cohort]).to_csv(input_file, index=False)
+        start = time.perf_counter()
+        checker.process_csv(input_file, os.path.join(tmp_dir, 'cohort_out.csv'))
+        seconds = time.perf_counter() - start
+    return _stage_report(METRICS.summary(), 'concordance', len(cohort), seconds)
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List stages whose throughput dropped more than ``tolerance`` below the baseline."""
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, report in stages.items():
+            base = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if not report or not base or not base.get('items_per_second') or not report.get('items_per_second'):
+                continue
+            ratio = report['items_per_second'] / base['items_per_second']
+            if ratio < 1 - tolerance:
+                regressions.append(f"{size} cases / {stage}: {report['items_per_second']:.2f} items/s "
+                                   f"vs baseline {base['items_per_second']:.2f} ({ratio:.0%})")
+    return regressions
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark the pipeline against the mock LLM server")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[100, 1000, 10000], help="Cohort sizes to run")
+    parser.add_argument("--latency_ms", type=float, default=20.0, help="Mock server mean latency in milliseconds")
+    parser.add_argument("--jitter_ms", type=float, default=10.0, help="Mock server latency jitter in milliseconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of mock responses that are HTTP 500")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="Fraction of mock responses that are HTTP 429")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the cohort and the mock server")
+    parser.add_argument("--skip_concordance", action="store_true", help="Do not benchmark ConcordanceChecker.process_csv")
+    parser.add_argument("--output_file", type=str, default="benchmark_results.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed fractional throughput drop versus the baseline")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    mock_config = MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    server, url = start_mock_server(config=mock_config)
+    print(f"Mock LLM server running at {url}")
+    API_CONFIG['stanford']['url'] = url
+    results = {'mock': vars(mock_config), 'sizes': {}}
+    try:
+        for size in args.sizes:
+            cohort = make_cohort(size, seed=args.seed)
+            METRICS.reset()
+            stages = bench_medscore(cohort)
+            if not args.skip_concordance:
+                METRICS.reset()
+                stages['concordance'] = bench_concordance(cohort, url)
+            results['sizes'][str(size)] = stages
+    finally:
+        server.shutdown()
+    with open(args.output_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n{'cases':>7} {'stage':<12} {'items/s':>9} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'retries':>8}")
+    for size, stages in results['sizes'].items():
+        for stage, report in stages.items():
+            if not report:
+                continue
+            print(f"{size:>7} {stage:<12} {report['items_per_second'] or 0:>9.2f} {report['latency_p50'] or 0:>8.3f} "
+                  f"{report['latency_p95'] or 0:>8.3f} {report['latency_p99'] or 0:>8.3f} {report['retries']:>8}")
+    print(f"\nSaved benchmark report to {args.output_file}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            exit(1)
@@ -0,0 +1,288 @@
+"""
+Multi-model comparison runner
+
+Runs several decomposition/verification model configurations ("arms") over
+the same cohort. The CSV is read and the evidence built once and shared by all
+arms. Arms run concurrently, one thread each; calls to the same provider share
+a rate limit. Each arm writes the usual decompositions/verifications/
+final_output files (plus its run journal) to ``<output_dir>/<arm name>/``, and
+a combined summary table is written to ``<output_dir>/comparison_summary.csv``.
+
+The arms file is a JSON list, for example:
+
+    [
+      {"name": "gpt-4.1", "model": "gpt-4.1", "provider": "stanford",
+       "server": "https://.../deployments/gpt-4.1/chat/completions?api-version=2025-01-01-preview"},
+      {"name": "gpt-4.1-mini", "model": "gpt-4.1-mini", "provider": "stanford"}
+    ]
+
+``model`` / ``server`` set both stages; ``model_name_decomposition``,
+``model_name_verification``, ``server_decomposition`` and
+``server_verification`` override them per stage. Without a server the
+API_CONFIG url is used. ``provider`` picks the shared rate limit; requests
+always use the Stanford APIM format and headers (see api_utils), so it must
+be one of ``SUPPORTED_PROVIDERS``.
+
+    python -m decomposition_concordance_pipeline.compare --input_file data.csv --arms arms.json \\
+        --api_key KEY --rate_limit stanford=300
+"""
+
+import os
+import json
+import logging
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, List, Mapping, Optional
+
+import jsonlines
+import pandas as pd
+
+from .api_utils import RateLimiter
+from .medscore import (MedScore, ProvidedEvidence, iter_csv_data, format_decompositions, format_verifications,
+                       summarize_verifications)
+from .metrics import METRICS
+from .log_utils import configure_logging
+from .run_journal import RunJournal
+from .utils import chunker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = 'stanford'
+# Providers whose request format the decomposer and verifier speak
+SUPPORTED_PROVIDERS = ('stanford',)
+
+
+class ModelArm(object):
+    """
+    One model configuration in a comparison.
+    """
+    def __init__(self, name: str, model_name_decomposition: str, model_name_verification: str,
+                 provider: str = DEFAULT_PROVIDER, server_decomposition: Optional[str] = None,
+                 server_verification: Optional[str] = None):
+        self.name = name
+        self.model_name_decomposition = model_name_decomposition
+        self.model_name_verification = model_name_verification
+        self.provider = provider
+        self.server_decomposition = server_decomposition
+        self.server_verification = server_verification
+
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> 'ModelArm':
+        model = config.get('model')
+        server = config.get('server')
+        decomposition_model = config.get('model_name_decomposition', model)
+        verification_model = config.get('model_name_verification', model)
+        if not decomposition_model or not verification_model:
+            raise ValueError(f"Arm {config} needs 'model' or both 'model_name_decomposition' and 'model_name_verification'")
+        provider = config.get('provider', DEFAULT_PROVIDER)
+        if provider not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"Arm {config.get('name') or verification_model} uses provider {provider!r}; "
+                             f"only {', '.join(SUPPORTED_PROVIDERS)} requests are supported")
+        return cls(
+            name=config.get('name') or verification_model,
+            model_name_decomposition=decomposition_model,
+            model_name_verification=verification_model,
+            provider=provider,
+            server_decomposition=config.get('server_decomposition', server),
+            server_verification=config.get('server_verification', server),
+        )
+
+
+def validate_arm_names(arms: List[ModelArm]) -> None:
+    """
+    Arm names become directories under the output dir: they must be unique
+    (ignoring case, for case-insensitive filesystems) and plain file names.
+    """
+    seen = {}
+    for arm in arms:
+        name = str(arm.name)
+        if name in ('', '.', '..') or '/' in name or '\\' in name or '\0' in name:
+            raise ValueError(f"Arm name {name!r} must be a plain directory name without path separators")
+        if name.casefold() in seen:
+            raise ValueError(f"Arm names must be unique, got {seen[name.casefold()]!r} and {name!r}")
+        seen[name.casefold()] = name
+
+
+def load_arms(arms_file: str) -> List[ModelArm]:
+    with open(arms_file) as f:
+        arms = [ModelArm.from_dict(config) for config in json.load(f)]
+    validate_arm_names(arms)
+    return arms
+
+
+def parse_rate_limits(values: List[str]) -> Dict[str, RateLimiter]:
+    """Build one shared limiter per provider from ``provider=requests_per_minute`` strings."""
+    limiters = {}
+    for value in values:
+        provider, _, rpm = value.partition('=')
+        if not rpm:
+            raise ValueError(f"Rate limit must look like provider=requests_per_minute, got {value!r}")
+        limiters[provider] = RateLimiter(float(rpm))
+    return limiters
+
+
+def _parse_percentage(value: str) -> float:
+    return float(value.rstrip('%'))
+
+
+def run_arm(
+        arm: ModelArm,
+        items: List[Dict[str, str]],
+        provided_evidence: Mapping[str, str],
+        output_dir: str,
+        api_key: str,
+        chunk_size: int = 500,
+        prompt_path: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+) -> Dict[str, Any]:
+    """Decompose and verify ``items`` with one arm; returns its summary row."""
+    arm_dir = os.path.join(output_dir, arm.name)
+    os.makedirs(arm_dir, exist_ok=True)
+    # Stage labels keep each arm's calls, tokens and cost apart in the shared METRICS
+    stage_prefix = f"{arm.name}/"
+    scorer = MedScore(
+        model_name_decomposition=arm.model_name_decomposition,
+        server_decomposition=arm.server_decomposition,
+        model_name_verification=arm.model_name_verification,
+        server_verification=arm.server_verification,
+        response_key="ai_answer",
+        prompt_path=prompt_path,
+        api_key=api_key,
+        server_url_decomposition=arm.server_decomposition,
+        server_url_verification=arm.server_verification,
+        rate_limiter=rate_limiter,
+        stage_prefix=stage_prefix,
+    )
+    totals = {'Supported': 0, 'Not Supported': 0, 'Not Addressed': 0}
+    support_percentages = []
+    not_addressed_percentages = []
+    num_decompositions = num_verifications = 0
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        journal = stack.enter_context(RunJournal(arm_dir))
+        journal.start(total_cases=len(items), output_dir=arm_dir, chunk_size=chunk_size, mode="compare")
+        decomp_writer = stack.enter_context(jsonlines.open(os.path.join(arm_dir, "decompositions.jsonl"), 'w', flush=True))
+        verif_writer = stack.enter_context(jsonlines.open(os.path.join(arm_dir, "verifications.jsonl"), 'w', flush=True))
+        final_writer = stack.enter_context(jsonlines.open(os.path.join(arm_dir, "final_output.jsonl"), 'w', flush=True))
+        for batch in chunker(items, chunk_size):
+            with METRICS.stage(stage_prefix + "decompose", items=len(batch)):
+                decompositions = scorer.decompose(batch)
+            decomp_writer.write_all(format_decompositions(decompositions))
+            with METRICS.stage(stage_prefix + "verify", items=len(decompositions)):
+                verifications = scorer.verify(decompositions, provided_evidence)
+            verif_writer.write_all(format_verifications(verifications))
+            summaries = summarize_verifications(verifications)
+            final_writer.write_all(summaries)
+            for entry in summaries:
+                for verdict in totals:
+                    totals[verdict] += entry[verdict]
+                if 'support_percentage' in entry:
+                    support_percentages.append(_parse_percentage(entry['support_percentage']))
+                    not_addressed_percentages.append(_parse_percentage(entry['not_addressed_percentage']))
+            num_decompositions += len(decompositions)
+            num_verifications += len(verifications)
+            journal.chunk([item['id'] for item in batch], decompositions=len(decompositions),
+                          verifications=len(verifications))
+    wall_seconds = time.perf_counter() - start
+    calls = METRICS.summary()['llm_calls']
+    arm_calls = [calls.get(stage_prefix + stage, {}) for stage in ('decompose', 'verify')]
+    logger.info(f"Arm {arm.name} finished {len(items)} cases in {wall_seconds:.1f}s")
+    return {
+        'arm': arm.name,
+        'decomposition_model': arm.model_name_decomposition,
+        'verification_model': arm.model_name_verification,
+        'provider': arm.provider,
+        'cases': len(items),
+        'claims': num_decompositions,
+        'verified_claims': num_verifications,
+        'supported': totals['Supported'],
+        'not_supported': totals['Not Supported'],
+        'not_addressed': totals['Not Addressed'],
+        'mean_support_percentage': sum(support_percentages) / len(support_percentages) if support_percentages else None,
+        'mean_not_addressed_percentage': (sum(not_addressed_percentages) / len(not_addressed_percentages)
+                                          if not_addressed_percentages else None),
+        'llm_calls': sum(c.get('calls', 0) for c in arm_calls),
+        'llm_errors': sum(c.get('errors', 0) for c in arm_calls),
+        'estimated_cost_usd': sum(c.get('estimated_cost_usd', 0.0) for c in arm_calls),
+        'wall_seconds': wall_seconds,
+    }
+
+
+def run_comparison(
+        arms: List[ModelArm],
+        input_file: str,
+        output_dir: str,
+        api_key: str,
+        chunk_size: int = 500,
+        prompt_path: Optional[str] = None,
+        rate_limiters: Optional[Dict[str, RateLimiter]] = None,
+        max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Run every arm concurrently on the same cohort and return the summary table.
+    """
+    validate_arm_names(arms)
+    rate_limiters = rate_limiters or {}
+    logger.info(f"Loading {input_file} once for {len(arms)} arms...")
+    items = list(iter_csv_data(input_file, chunk_size))
+    provided_evidence = ProvidedEvidence(items)
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(arms), thread_name_prefix="arm") as executor:
+        futures = [
+            executor.submit(run_arm, arm, items, provided_evidence, output_dir, api_key, chunk_size, prompt_path,
+                            rate_limiters.get(arm.provider))
+            for arm in arms
+        ]
+        rows = [future.result() for future in futures]
+    total_seconds = time.perf_counter() - start
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(output_dir, "comparison_summary.csv"), index=False)
+    with open(os.path.join(output_dir, "comparison_summary.json"), 'w') as f:
+        json.dump({
+            'input_file': input_file,
+            'wall_seconds': total_seconds,
+            'sum_of_arm_seconds': sum(row['wall_seconds'] for row in rows),
+            'arms': rows,
+        }, f, indent=2)
+    logger.info(f"Compared {len(arms)} arms in {total_seconds:.1f}s "
+                f"(arms took {summary['wall_seconds'].sum():.1f}s combined)")
+    return summary
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compare several models on the same cohort")
+    parser.add_argument("--input_file", required=True, type=str, help="Path to the input CSV file")
+    parser.add_argument("--arms", required=True, type=str, help="JSON file listing the model configurations to compare")
+    parser.add_argument("--output_dir", default="./comparison", type=str, help="Directory for per-arm outputs and the summary")
+    parser.add_argument("--api_key", required=True, type=str, help="Stanford API key")
+    parser.add_argument("--prompt_path", type=str, default=None, help="Path to the decomposition prompt file")
+    parser.add_argument("--rate_limit", type=str, nargs='*', default=[],
+                        help="Per-provider limits as provider=requests_per_minute, shared by all arms of that provider")
+    parser.add_argument("--max_workers", type=int, default=None, help="Maximum number of arms running at once (default: all)")
+    parser.add_argument("--chunk_size", type=int, default=500, help="Number of cases decomposed and verified per chunk")
+    parser.add_argument("--log_level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--log_json", action="store_true", help="Emit logs as JSON lines")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(args.log_level, json_lines=args.log_json)
+    summary = run_comparison(
+        arms=load_arms(args.arms),
+        input_file=args.input_file,
+        output_dir=args.output_dir,
+        api_key=args.api_key,
+        chunk_size=args.chunk_size,
+        prompt_path=args.prompt_path,
+        rate_limiters=parse_rate_limits(args.rate_limit),
+        max_workers=args.max_workers,
+    )
+    METRICS.write_json(os.path.join(args.output_dir, "run_metrics.json"))
+    columns = ['arm', 'cases', 'claims', 'mean_support_percentage', 'mean_not_addressed_percentage',
+               'llm_calls', 'llm_errors', 'estimated_cost_usd', 'wall_seconds']
+    print(summary[columns].to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print(f"\nSaved per-arm results and comparison_summary.csv to {args.output_dir}")
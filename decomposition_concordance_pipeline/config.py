@@ -1,13 +1,20 @@
 # Configuration file for Concordance Checker
 
+import os
+
 # API Configuration
 API_CONFIG = {
     # Stanford Healthcare API
     'stanford': {
-        'url': 'https://apim.stanfordhealthcare.org/openai-eastus2/deployments/gpt-4.1-mini/chat/completions?api-version=2025-01-01-preview',
+        # STANFORD_API_URL overrides the endpoint, e.g. to point shard processes at the mock server
+        'url': os.environ.get('STANFORD_API_URL', 'https://apim.stanfordhealthcare.org/openai-eastus2/deployments/gpt-4.1-mini/chat/completions?api-version=2025-01-01-preview'),
         'model': 'gpt-4.1-mini',
         'max_tokens': 5000,
         'temperature': 0.1,
+        'supports_n': True,  # several samples per request via the 'n' parameter
+        'json_mode': True,  # response_format json_object for prompts answered with a JSON object
+        'context_window': 1047576,  # prompt + completion tokens; MODEL_CONTEXT_WINDOWS overrides per model
+        'max_prompt_tokens': 32000,  # budget per prompt; larger references are split or shortened
         'headers': {
             'Content-Type': 'application/json',
             'Ocp-Apim-Subscription-Key': ''  # Will be set dynamically
@@ -20,6 +27,8 @@ API_CONFIG = {
         'model': 'gpt-4',
         'max_tokens': 500,
         'temperature': 0.1,
+        # gpt-4's window is smaller than the shared 32000-token budget; the prompt limit is 8192 - max_tokens
+        'context_window': 8192,
         'headers': {
             'Content-Type': 'application/json'
         }
@@ -31,6 +40,8 @@ API_CONFIG = {
         'model': 'claude-3-sonnet-20240229',
         'max_tokens': 500,
         'temperature': 0.1,
+        'context_window': 200000,
+        'max_prompt_tokens': 32000,
         'headers': {
             'Content-Type': 'application/json',
             'anthropic-version': '2023-06-01'
@@ -43,6 +54,8 @@ API_CONFIG = {
         'model': 'gemini-2.0-flash-exp',
         'max_tokens': 500,
         'temperature': 0.1,
+        'context_window': 1048576,
+        'max_prompt_tokens': 32000,
         'headers': {
             'Content-Type': 'application/json'
         }
@@ -52,7 +65,27 @@ API_CONFIG = {
 # Default API provider
 DEFAULT_API_PROVIDER = 'stanford'  # Changed to Stanford as default
 
+# Estimated pricing in USD per 1M tokens, keyed by model name
+MODEL_PRICING = {
+    'gpt-4': {'prompt': 30.00, 'completion': 60.00},
+    'gpt-4.1': {'prompt': 2.00, 'completion': 8.00},
+    'gpt-4.1-mini': {'prompt': 0.40, 'completion': 1.60},
+    'claude-3-sonnet-20240229': {'prompt': 3.00, 'completion': 15.00},
+    'gemini-2.0-flash-exp': {'prompt': 0.00, 'completion': 0.00},
+}
+
+# Context window in tokens (prompt + completion), keyed by model name; used instead of
+# the provider's context_window when the run uses one of these models
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4': 8192,
+    'gpt-4.1': 1047576,
+    'gpt-4.1-mini': 1047576,
+    'claude-3-sonnet-20240229': 200000,
+    'gemini-2.0-flash-exp': 1048576,
+}
+
 # Processing Configuration
 REQUEST_DELAY = 1  # seconds between API requests
 TIMEOUT = 30  # seconds for API request timeout
 BATCH_SIZE = 10  # number of rows to process before progress update
+MAX_RETRIES = 3  # attempts per API request on rate limits, server errors and timeouts
@@ -3,12 +3,12 @@ Decomposer for Decomposition Concordance Pipeline
 """
 
 import os
+import time
 from functools import partial
 import asyncio
-from typing import List, Any, Optional, Dict
+from typing import List, Any, Optional, Dict, Iterator
 import logging
 
-from tqdm import tqdm
 import backoff
 import requests
 from openai import AsyncOpenAI
@@ -16,7 +16,14 @@ from openai.types.chat.chat_completion import ChatCompletion
 import nest_asyncio
 
 from .utils import process_claim, chunker
-from .api_utils import query_stanford_api
+from .api_utils import query_stanford_api, stream_stanford_api, RateLimiter, HedgePolicy
+from .log_utils import ProgressReporter, log_raw_output
+from .metrics import METRICS
+from .provenance import hash_text, claim_uid
+from .routing import ModelRouter, ModelRoute, LARGE
+from .config import API_CONFIG
+from .structured_output import (StructuredOutputError, IncrementalClaimParser, parse_claims, strip_code_fences,
+                                json_mode_options)
 
 logger = logging.getLogger(__name__)
 nest_asyncio.apply()
@@ -31,6 +38,12 @@ class MedScoreDecomposer(object):
             batch_size: int = 32,
             api_key: Optional[str] = None,
             *args,
+            server_url: Optional[str] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            stage: str = "decompose",
+            router: Optional[ModelRouter] = None,
+            hedge: Optional[HedgePolicy] = None,
+            endpoint_pools: Optional[Dict[str, Any]] = None,
             **kwargs
     ):
         self.model_name = model_name
@@ -38,14 +51,31 @@ class MedScoreDecomposer(object):
         self.batch_size = batch_size
         self.system_prompt = None
         self.api_key = api_key
+        # Endpoint override (API_CONFIG url when None), shared per-provider limiter, metrics label
+        self.server_url = server_url
+        self.rate_limiter = rate_limiter
+        self.stage = stage
+        # Optional duplicate requests for slow calls (not used for streamed calls)
+        self.hedge = hedge
+        # Per-model pools of equivalent deployments, load balanced (not used for streamed calls)
+        self.endpoint_pools = endpoint_pools
+        # Optional small/large model routing; the large model is this decomposer's own
+        self.router = router
+        self.large_route = ModelRoute(LARGE, model_name, server_url)
+        if router is not None:
+            router.register(stage, model_name)
         # Hardcode the prompt path
         prompt_path = 'prompt/decompose_prompt.txt'
         with open(prompt_path) as f:
             self.system_prompt = f.read().strip()
+        self.prompt_hash = hash_text(self.system_prompt)
+        # Ask for JSON-only output where the endpoint supports it; switched off if it is rejected
+        self.json_mode = API_CONFIG['stanford'].get('json_mode', False)
 
     def __call__(self, decomp_input: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         all_completions = []
-        for d in tqdm(decomp_input, desc="Decompose"):
+        progress = ProgressReporter("Decompose", total=len(decomp_input), logger=logger)
+        for d in decomp_input:
             if self.system_prompt:
                 messages = [
                     {"role": "system", "content": self.system_prompt},
@@ -55,61 +85,170 @@ class MedScoreDecomposer(object):
                 messages = [
                     {"role": "user", "content": d['ai_answer']}
                 ]
-            # Print first 30 characters of user content for debugging
-            user_content = messages[1]['content'] if len(messages) > 1 else messages[0]['content']
-            print(f"\n=== API CALL (first 30 chars) ===\n{user_content[:30]}...\n================\n")
-            response = self.batch_response([messages])[0]
+            logger.debug("decompose request", extra={'dav_id': d['id'], 'answer_chars': len(d['ai_answer'])})
+            if self.router is None:
+                response = self.batch_response([messages])[0]
+            else:
+                response = self._routed_query(d['ai_answer'], messages)
             all_completions.append(response)
+            progress.update()
+        progress.close()
         decompositions = self.format_completions(decomp_input, all_completions)
         return decompositions
 
+    def provenance(self, ai_answer: str) -> Dict[str, str]:
+        """What a decomposition depends on; stored with it for incremental runs"""
+        model = self.model_name if self.router is None else self.router.describe(self.model_name)
+        return {'prompt': self.prompt_hash, 'model': model, 'input': hash_text(ai_answer)}
+
     def format_completions(self, decomp_input: List[Dict[str, Any]], completions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        import json
         decompositions = []
-        claim_counter = 0
         for d_input, completion in zip(decomp_input, completions):
             raw_content = completion['choices'][0]['message']['content']
-            claims = []
             try:
-                # Remove code block markers if present
-                if raw_content.strip().startswith("```"):
-                    raw_content = "\n".join(line for line in raw_content.splitlines() if not line.strip().startswith("```") )
-                parsed = json.loads(raw_content)
-                if isinstance(parsed, dict) and "claims" in parsed:
-                    claims = parsed["claims"]
-                elif isinstance(parsed, list):
-                    claims = parsed
-                else:
-                    # fallback: treat as a single claim
-                    claims = [raw_content.strip()]
-            except Exception as e:
-                print(f"Warning: Could not parse LLM output as JSON: {e}")
+                claims, repaired = parse_claims(raw_content)
+                if repaired:
+                    logger.info("Recovered truncated decomposition output", extra={'dav_id': d_input['id']})
+            except StructuredOutputError as e:
+                logger.warning("Could not parse LLM output as JSON: %s", e, extra={'dav_id': d_input['id']})
+                log_raw_output(logger, raw_content, dav_id=d_input['id'])
                 # fallback to line-based splitting
-                claims = process_claim(raw_content.split("\n"))
+                claims = process_claim(strip_code_fences(raw_content).split("\n"))
+            provenance = self.provenance(d_input['ai_answer'])
             for idx, claim in enumerate(claims):
-                decomp = {k:v for k,v in d_input.items() if k not in ("context", "id", "ai_answer")}
-                decomp["claim"] = claim
-                decomp["claim_id"] = idx
-                decomp["id"] = str(claim_counter)
-                decomp["dav_id"] = d_input["id"]
-                decompositions.append(decomp)
-                claim_counter += 1
+                decompositions.append(self._claim_record(d_input, claim, idx, provenance))
             if not claims:
-                decomp = {k:v for k,v in d_input.items() if k not in ("context", "id", "ai_answer")}
-                decomp["claim"] = None
-                decomp["id"] = str(claim_counter)
-                decomp["dav_id"] = d_input["id"]
-                decompositions.append(decomp)
-                claim_counter += 1
+                decompositions.append(self._claim_record(d_input, None, None, provenance))
         return decompositions
 
+    @staticmethod
+    def _claim_record(d_input: Dict[str, Any], claim: Optional[str], claim_id: Optional[int],
+                      provenance: Dict[str, str]) -> Dict[str, Any]:
+        decomp = {k:v for k,v in d_input.items() if k not in ("context", "id", "ai_answer")}
+        decomp["claim"] = claim
+        if claim is not None:
+            decomp["claim_id"] = claim_id
+        # Derived from the case and position only, so any run order gives the same id
+        decomp["id"] = claim_uid(d_input["id"], claim_id)
+        decomp["dav_id"] = d_input["id"]
+        decomp["provenance"] = provenance
+        return decomp
+
+    def stream_claims(self, d_input: Dict[str, Any], route: Optional[ModelRoute] = None,
+                      escalated: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Decompose one answer over a streamed completion, yielding each claim
+        record as soon as its string closes in the response.
+
+        Once the stream ends the full response is parsed as usual; claims the
+        incremental parser could not see (e.g. a non-JSON answer that needs the
+        line-based fallback) are yielded then. A case without claims yields one
+        record with ``claim`` None, like ``format_completions``. With a router,
+        a small-model response is escalated only if it failed to parse before
+        any claim was handed on.
+        """
+        if self.router is not None and route is None:
+            route = self.router.decomposition_route(d_input['ai_answer'], self.large_route)
+        messages = [{"role": "user", "content": d_input['ai_answer']}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        provenance = self.provenance(d_input['ai_answer'])
+        parser = IncrementalClaimParser()
+        streamed = []
+        start = time.perf_counter()
+        for piece in self._stream_query(messages, route):
+            for claim in parser.feed(piece):
+                if not streamed:
+                    METRICS.record_timing(self.stage + "/first_claim", time.perf_counter() - start)
+                yield self._claim_record(d_input, claim, len(streamed), provenance)
+                streamed.append(claim)
+        try:
+            claims, repaired = parse_claims(parser.text)
+            if repaired:
+                logger.info("Recovered truncated decomposition output", extra={'dav_id': d_input['id']})
+        except StructuredOutputError as e:
+            if route is not None and route is not self.large_route and not streamed:
+                logger.info("Escalating decomposition to %s: %s", self.large_route.model, e,
+                            extra={'dav_id': d_input['id']})
+                yield from self.stream_claims(d_input, self.large_route, escalated=True)
+                return
+            logger.warning("Could not parse LLM output as JSON: %s", e, extra={'dav_id': d_input['id']})
+            log_raw_output(logger, parser.text, dav_id=d_input['id'])
+            claims = process_claim(strip_code_fences(parser.text).split("\n"))
+        if route is not None:
+            self.router.record(self.stage, route, escalated=escalated)
+        if claims[:len(streamed)] != streamed:
+            # Claims already handed on cannot be taken back; keep them
+            logger.warning("Streamed claims differ from the parsed response; keeping the %d streamed claims",
+                           len(streamed), extra={'dav_id': d_input['id']})
+            claims = streamed
+        for idx in range(len(streamed), len(claims)):
+            yield self._claim_record(d_input, claims[idx], idx, provenance)
+        if not claims:
+            yield self._claim_record(d_input, None, None, provenance)
+
+    def _stream_query(self, messages: List[Dict[str, str]], route: Optional[ModelRoute] = None) -> Iterator[str]:
+        kwargs = self._query_kwargs(messages, route)
+        if self.json_mode:
+            pieces = stream_stanford_api(response_format=json_mode_options('stanford')['response_format'], **kwargs)
+            try:
+                # The request is only sent once the generator starts
+                first = next(pieces, None)
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 400:
+                    raise
+                logger.info("Endpoint rejected JSON mode; continuing without it")
+                self.json_mode = False
+            else:
+                if first is not None:
+                    yield first
+                    yield from pieces
+                return
+        yield from stream_stanford_api(**kwargs)
+
     def batch_response(self, batch: List[List[Dict[str, str]]]) -> List[Dict[str, Any]]:
         completions = []
         for msg in batch:
-            response = query_stanford_api(
-                messages=msg,
-                api_key=self.api_key,
-                model=self.model_name
-            )
-            completions.append(response)
+            completions.append(self._query(msg))
         return completions
+
+    def _routed_query(self, ai_answer: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Query the routed model; a small-model answer that is not valid JSON is retried on the large model"""
+        route = self.router.decomposition_route(ai_answer, self.large_route)
+        response = self._query(messages, route)
+        if route is not self.large_route:
+            try:
+                parse_claims(response['choices'][0]['message']['content'])
+            except StructuredOutputError as e:
+                logger.info("Escalating decomposition to %s: %s", self.large_route.model, e)
+                self.router.record(self.stage, self.large_route, escalated=True)
+                return self._query(messages, self.large_route)
+        self.router.record(self.stage, route)
+        return response
+
+    def _query_kwargs(self, messages: List[Dict[str, str]], route: Optional[ModelRoute] = None) -> Dict[str, Any]:
+        kwargs = dict(
+            messages=messages,
+            api_key=self.api_key,
+            model=self.model_name,
+            stage=self.stage,
+            url=self.server_url,
+            rate_limiter=self.rate_limiter,
+        )
+        if route is not None:
+            kwargs.update(route.query_kwargs(), stage=f"{self.stage}/{route.name}")
+        return kwargs
+
+    def _query(self, messages: List[Dict[str, str]], route: Optional[ModelRoute] = None) -> Dict[str, Any]:
+        kwargs = self._query_kwargs(messages, route)
+        kwargs['hedge'] = self.hedge
+        kwargs['endpoint_pools'] = self.endpoint_pools
+        if self.json_mode:
+            try:
+                return query_stanford_api(response_format=json_mode_options('stanford')['response_format'], **kwargs)
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 400:
+                    raise
+                logger.info("Endpoint rejected JSON mode; continuing without it")
+                self.json_mode = False
+        return query_stanford_api(**kwargs)
@@ -0,0 +1,235 @@
+"""
+Dry-run cost and duration estimates
+
+``medscore.py --dry_run`` and ``concordance_checker.py --dry-run`` read the
+CSV and build every prompt the run would send, without any network access:
+the decomposer's system and user messages, the verifier's claim chunk
+prompts and the concordance prompts. The prompts are tokenized locally (see
+token_budget). Where tiktoken's encoding cannot be loaded without the network,
+token counts fall back to a characters-per-token estimate, noted in the
+report's ``assumptions.tokenizer``. What only the run itself would produce is estimated:
+
+- Claims per case come from the answer length (``TOKENS_PER_CLAIM`` answer
+  tokens per claim). The verifier prompts are built with consecutive slices
+  of the answer standing in for the claims.
+- Completion tokens use the per-stage constants below.
+- Call latency is ``LATENCY_BASE`` plus the completion at
+  ``OUTPUT_TOKENS_PER_SECOND``. Given an earlier run's run_metrics.json, that
+  run's mean latency per stage is used instead.
+
+Calls, tokens and cost are summed per stage. Wall time is projected from the
+run's parallelism (shards, streaming workers) and, with an endpoint pool,
+its requests-per-minute quota. Early stopping and model routing are not
+modelled, so such runs cost less than estimated.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .metrics import estimate_cost
+from .token_budget import TokenBudget, PromptTooLargeError, tokenizer_name
+
+logger = logging.getLogger(__name__)
+
+# Answer tokens per decomposed claim
+TOKENS_PER_CLAIM = 20
+# Decomposition output tokens per answer token (claims repeat their subject) plus the JSON around them
+DECOMPOSITION_OUTPUT_RATIO = 1.3
+JSON_OVERHEAD_TOKENS = 10
+# Verdict and one-sentence reason per claim
+VERDICT_TOKENS_PER_CLAIM = 40
+CONCORDANCE_COMPLETION_TOKENS = 90
+# Chat formatting tokens added per message
+MESSAGE_OVERHEAD_TOKENS = 4
+LATENCY_BASE = 1.0
+OUTPUT_TOKENS_PER_SECOND = 50.0
+
+
+class LatencyModel(object):
+    """Seconds per call by stage: observed means from an earlier run, else the token-rate model"""
+    def __init__(self, observed: Optional[Dict[str, float]] = None):
+        self.observed = observed or {}
+
+    @classmethod
+    def from_run_metrics(cls, path: str) -> 'LatencyModel':
+        with open(path) as f:
+            llm_calls = json.load(f)['llm_calls']
+        observed = {stage: calls['latency_seconds']['mean'] for stage, calls in llm_calls.items()
+                    if calls['latency_seconds']['mean'] is not None}
+        return cls(observed)
+
+    def __call__(self, stage: str, completion_tokens: int) -> float:
+        if stage in self.observed:
+            return self.observed[stage]
+        return LATENCY_BASE + completion_tokens / OUTPUT_TOKENS_PER_SECOND
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'observed_mean_seconds': self.observed,
+            'otherwise': f"{LATENCY_BASE}s + completion tokens at {OUTPUT_TOKENS_PER_SECOND}/s",
+        }
+
+
+class StageEstimate(object):
+    """
+    Projected calls and tokens of one stage. ``busy_seconds`` is the time the
+    stage's calls take one after another; calls sent together (samples of
+    one chunk) count once.
+    """
+    def __init__(self, stage: str, model: str):
+        self.stage = stage
+        self.model = model
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.busy_seconds = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, seconds: float, calls: int = 1) -> None:
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.busy_seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'estimated_cost_usd': estimate_cost(self.model, self.prompt_tokens, self.completion_tokens),
+            'busy_seconds': self.busy_seconds,
+        }
+
+
+def estimated_claims(answer_tokens: int) -> int:
+    return max(1, round(answer_tokens / TOKENS_PER_CLAIM))
+
+
+def stand_in_claims(answer: str, num_claims: int) -> List[str]:
+    """Consecutive slices of the answer's words, standing in for claims not decomposed yet"""
+    words = answer.split()
+    bounds = [round(i * len(words) / num_claims) for i in range(num_claims + 1)]
+    return [" ".join(words[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+
+def estimate_medscore(items: Iterable[Dict[str, str]], scorer, latency: LatencyModel, decompose: bool = True,
+                      verify: bool = True, chunk_size: int = 10) -> Dict[str, StageEstimate]:
+    """
+    Build the decomposer and verifier prompts of every case with ``scorer``'s
+    prompts and token budget (``scorer.verifier.token_budget`` must be set),
+    and project what the run would send.
+    """
+    from .medscore import format_evidence
+
+    decomposer, verifier = scorer.decomposer, scorer.verifier
+    budget = verifier.token_budget
+    estimates = {
+        decomposer.stage: StageEstimate(decomposer.stage, decomposer.model_name),
+        verifier.stage: StageEstimate(verifier.stage, verifier.model_name),
+    }
+    system_tokens = budget.count(decomposer.system_prompt or "")
+    num_samples = verifier.num_samples
+    # Samples are one request with 'n' where supported, else concurrent requests
+    calls_per_prompt = 1 if verifier.use_n else num_samples
+    for item in items:
+        answer = item['ai_answer']
+        answer_tokens = budget.count(answer)
+        if decompose:
+            prompt_tokens = system_tokens + answer_tokens + 2 * MESSAGE_OVERHEAD_TOKENS
+            completion = int(answer_tokens * DECOMPOSITION_OUTPUT_RATIO) + JSON_OVERHEAD_TOKENS
+            budget.record(decomposer.stage, prompt_tokens, item['id'])
+            estimates[decomposer.stage].add(prompt_tokens, completion, latency(decomposer.stage, completion))
+        if not verify:
+            continue
+        reference = format_evidence(item['question'], item['answer'])
+        claims = stand_in_claims(answer, estimated_claims(answer_tokens))
+        for start in range(0, len(claims), chunk_size):
+            claim_chunk = claims[start:start + chunk_size]
+            try:
+                prompts = verifier.chunk_prompts(reference, claim_chunk, item['id'])
+            except PromptTooLargeError:
+                continue
+            completion = len(claim_chunk) * VERDICT_TOKENS_PER_CLAIM
+            for prompt in prompts:
+                prompt_tokens = budget.count(prompt) + MESSAGE_OVERHEAD_TOKENS
+                estimates[verifier.stage].add(prompt_tokens * calls_per_prompt, completion * num_samples,
+                                              latency(verifier.stage, completion), calls=calls_per_prompt)
+    return estimates
+
+
+def estimate_concordance(rows: Iterable[Dict[str, Any]], render: Callable[..., str], budget: TokenBudget,
+                         latency: LatencyModel, request_delay: float = 0.0,
+                         stage: str = 'concordance') -> StageEstimate:
+    """Project a concordance run: one prompt per row, sent one after another with ``request_delay`` between"""
+    estimate = StageEstimate(stage, budget.model)
+    for row in rows:
+        fields = {'question': row['question'], 'answer': row['answer'], 'ai_output': row['ai_answer']}
+        try:
+            prompt = budget.fit_fields(render, fields, stage, row.get('dav_id'))
+        except PromptTooLargeError:
+            continue
+        estimate.add(budget.count(prompt) + MESSAGE_OVERHEAD_TOKENS, CONCORDANCE_COMPLETION_TOKENS,
+                     latency(stage, CONCORDANCE_COMPLETION_TOKENS) + request_delay)
+    return estimate
+
+
+def build_report(cases: int, estimates: Dict[str, StageEstimate], wall_seconds: float, budget: TokenBudget,
+                 latency: LatencyModel, **assumptions: Any) -> Dict[str, Any]:
+    """
+    The dry-run report. ``wall_seconds`` is the caller's projection from the
+    stage estimates, since how stages overlap depends on the run mode.
+    """
+    stages = {stage: estimate.summary() for stage, estimate in estimates.items() if estimate.calls}
+    costs = [s['estimated_cost_usd'] for s in stages.values()]
+    return {
+        'cases': cases,
+        'stages': stages,
+        'total': {
+            'calls': sum(s['calls'] for s in stages.values()),
+            'prompt_tokens': sum(s['prompt_tokens'] for s in stages.values()),
+            'completion_tokens': sum(s['completion_tokens'] for s in stages.values()),
+            'estimated_cost_usd': sum(c for c in costs if c is not None),
+            'unpriced_stages': [stage for stage, s in stages.items() if s['estimated_cost_usd'] is None],
+            'wall_seconds': wall_seconds,
+            'wall_hours': wall_seconds / 3600,
+        },
+        'assumptions': dict(
+            assumptions,
+            tokens_per_claim=TOKENS_PER_CLAIM,
+            tokenizer=tokenizer_name(budget.model),
+            latency=latency.describe(),
+        ),
+        'prompt_tokens': budget.report(),
+    }
+
+
+def rate_limited_seconds(calls: int, requests_per_minute: Optional[float]) -> float:
+    """Shortest time ``calls`` requests can take under a requests-per-minute quota"""
+    return calls * 60.0 / requests_per_minute if requests_per_minute else 0.0
+
+
+def pool_requests_per_minute(path: str, model: str) -> Optional[float]:
+    """Combined quota of ``model``'s endpoints in an endpoint pool file (see endpoint_pool), if all are limited"""
+    with open(path) as f:
+        entries = json.load(f).get(model, [])
+    limits = [entry.get('requests_per_minute') for entry in entries]
+    if not limits or any(limit is None for limit in limits):
+        return None
+    return float(sum(limits))
+
+
+def log_report(report: Dict[str, Any]) -> None:
+    for stage, entry in report['stages'].items():
+        cost = entry['estimated_cost_usd']
+        logger.info(f"Dry run {stage}: {entry['calls']} calls, {entry['prompt_tokens']} prompt + "
+                    f"{entry['completion_tokens']} completion tokens, "
+                    + (f"${cost:.2f}" if cost is not None else "no pricing for " + str(entry['model'])))
+    total = report['total']
+    tokenizer = report['assumptions']['tokenizer']
+    if tokenizer != 'tiktoken':
+        logger.warning(f"Token counts are an {tokenizer}, not tiktoken counts")
+    logger.info(f"Dry run total for {report['cases']} cases: {total['calls']} calls, "
+                f"{total['prompt_tokens'] + total['completion_tokens']} tokens, ${total['estimated_cost_usd']:.2f}, "
+                f"about " + (f"{total['wall_hours']:.1f} hours" if total['wall_hours'] >= 1
+                             else f"{total['wall_seconds'] / 60:.1f} minutes"))
@@ -0,0 +1,313 @@
+"""
+Load balancing across equivalent deployments
+
+Each APIM deployment has its own quota, so one model can be served from a
+pool of endpoints (regions, subscriptions), each with its own key and
+requests-per-minute limit. ``EndpointPool.post`` picks an endpoint per
+attempt by expected wait (observed latency, requests in flight and time until
+its quota allows another request) and retries failures on the next best
+endpoint. Besides the configured ``requests_per_minute``, the quota the
+deployment reports (``x-ratelimit-remaining-requests`` and
+``x-ratelimit-reset-requests``) counts: an endpoint whose remaining requests
+run low is preferred less, and one with none left waits for its window to
+reset. Endpoints that keep failing are taken out by a circuit breaker:
+after ``failure_threshold`` consecutive errors an endpoint is skipped for
+``cooldown`` seconds, then gets a single trial request (or an active health
+check) before it is used again.
+
+Pools are configured with a JSON file keyed by model name:
+
+    {
+      "gpt-4.1": [
+        {"name": "eastus2", "url": "https://.../openai-eastus2/deployments/gpt-4.1/chat/completions?api-version=...",
+         "api_key_env": "APIM_KEY_EAST", "requests_per_minute": 300},
+        {"name": "westus", "url": "https://.../openai-westus/deployments/gpt-4.1/chat/completions?api-version=...",
+         "api_key_env": "APIM_KEY_WEST", "requests_per_minute": 150}
+      ]
+    }
+
+``api_key`` may be given inline; without either, the run's ``--api_key`` is used.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import backoff
+import requests
+
+from .config import TIMEOUT, MAX_RETRIES
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+# Weight of the newest latency in the moving average
+LATENCY_ALPHA = 0.2
+# Seconds an endpoint is skipped after a 429 without Retry-After
+DEFAULT_THROTTLE = 10.0
+# Quota window assumed when a response has x-ratelimit-remaining-requests but no reset time
+DEFAULT_QUOTA_WINDOW = 60.0
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Seconds in a rate-limit reset header: plain seconds or durations like '6m0s', '20ms'"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class Endpoint(object):
+    """
+    One deployment in a pool and what has been observed about it. Mutable
+    state is guarded by the pool's lock.
+    """
+    def __init__(self, url: str, api_key: str, name: Optional[str] = None,
+                 requests_per_minute: Optional[float] = None, key_header: str = 'Ocp-Apim-Subscription-Key'):
+        self.url = url
+        self.api_key = api_key
+        self.name = name or url
+        self.key_header = key_header
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.next_slot = 0.0
+        self.latency = None
+        self.in_flight = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.throttled_until = 0.0
+        self.remaining_requests = None
+        self.quota_reset_at = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def reported_quota_wait(self, now: float) -> float:
+        """
+        Wait implied by the quota the deployment last reported: its remaining
+        requests (less those sent since) spread over the rest of the window,
+        or the whole rest of the window if none are left.
+        """
+        if self.remaining_requests is None or now >= self.quota_reset_at:
+            return 0.0
+        left = self.remaining_requests - self.in_flight
+        return (self.quota_reset_at - now) / max(left + 1, 1)
+
+    def expected_wait(self, now: float) -> float:
+        """Seconds until a new request here would likely be answered"""
+        quota_wait = max(0.0, self.next_slot - now, self.throttled_until - now, self.reported_quota_wait(now))
+        return quota_wait + (self.latency or 0.0) * (1 + self.in_flight)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'calls': self.calls,
+            'errors': self.errors,
+            'mean_latency_seconds': self.latency,
+            'remaining_requests': self.remaining_requests,
+        }
+
+
+def _retryable(e: requests.exceptions.RequestException) -> bool:
+    response = getattr(e, 'response', None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+class EndpointPool(object):
+    """
+    Equivalent endpoints for one model; see the module docstring.
+    """
+    def __init__(self, endpoints: List[Endpoint], failure_threshold: int = 5, cooldown: float = 30.0,
+                 max_tries: int = MAX_RETRIES):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_tries = max_tries
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    def acquire(self) -> Endpoint:
+        """
+        Choose the endpoint with the shortest expected wait, reserve its next
+        quota slot and wait for it. Open circuits are skipped; once their
+        cooldown is over one trial request is let through. If every endpoint
+        is open, the one that reopens first is tried.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.state == CLOSED or now >= e.open_until]
+            if candidates:
+                endpoint = min(candidates, key=lambda e: e.expected_wait(now))
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.open_until)
+            if endpoint.state == OPEN:
+                # Trial request; the circuit stays open for everyone else until it succeeds
+                endpoint.open_until = now + self.cooldown
+            wait = max(0.0, endpoint.next_slot - now, endpoint.throttled_until - now)
+            endpoint.next_slot = max(now + wait, endpoint.next_slot) + endpoint.interval
+            endpoint.in_flight += 1
+        if wait > 0:
+            time.sleep(wait)
+        return endpoint
+
+    def release(self, endpoint: Endpoint, latency: float, error: Optional[BaseException] = None,
+                response: Optional[requests.Response] = None) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.calls += 1
+            if response is not None and 'x-ratelimit-remaining-requests' in response.headers:
+                try:
+                    endpoint.remaining_requests = int(response.headers['x-ratelimit-remaining-requests'])
+                except ValueError:
+                    pass
+                else:
+                    reset = _parse_duration(response.headers.get('x-ratelimit-reset-requests', ''))
+                    endpoint.quota_reset_at = time.monotonic() + (reset if reset is not None else DEFAULT_QUOTA_WINDOW)
+            if error is None:
+                endpoint.latency = latency if endpoint.latency is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * endpoint.latency)
+                endpoint.consecutive_failures = 0
+                if endpoint.state != CLOSED:
+                    logger.info("Endpoint %s is healthy again", endpoint.name)
+                endpoint.state = CLOSED
+                return
+            endpoint.errors += 1
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+            if status == 429:
+                # Quota, not health: skip the endpoint until its window resets
+                retry_after = error.response.headers.get('Retry-After')
+                try:
+                    delay = float(retry_after) if retry_after else DEFAULT_THROTTLE
+                except ValueError:
+                    delay = DEFAULT_THROTTLE
+                endpoint.throttled_until = time.monotonic() + delay
+                return
+            if status is not None and status < 500:
+                # A rejected request says nothing about the endpoint's health
+                return
+            endpoint.consecutive_failures += 1
+            if endpoint.state != CLOSED or endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.state == CLOSED:
+                    logger.warning("Opening circuit for endpoint %s after %d consecutive errors",
+                                   endpoint.name, endpoint.consecutive_failures)
+                endpoint.state = OPEN
+                endpoint.open_until = time.monotonic() + self.cooldown
+
+    def post(self, url: Optional[str], headers: Dict[str, str], payload: Dict[str, Any], stage: Optional[str] = None,
+             rate_limiter=None) -> Dict[str, Any]:
+        """
+        Drop-in for api_utils._post: ``url`` and the key header are replaced
+        by the chosen endpoint's. Retryable failures (429, 5xx, timeouts,
+        dropped connections) move on to the next best endpoint. An attempt
+        that lands on an endpoint that already failed this call (always the
+        case once every endpoint has) first waits out the same jittered
+        exponential backoff as _post, so the retries are not spent in a burst.
+        """
+        last_error = None
+        failed = set()
+        delays = backoff.expo()
+        next(delays)
+        for attempt in range(self.max_tries):
+            if attempt:
+                METRICS.record_retry(stage)
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            endpoint = self.acquire()
+            if id(endpoint) in failed:
+                time.sleep(backoff.full_jitter(next(delays)))
+            endpoint_headers = dict(headers)
+            endpoint_headers.pop('Ocp-Apim-Subscription-Key', None)
+            endpoint_headers[endpoint.key_header] = endpoint.api_key
+            start = time.perf_counter()
+            response = None
+            try:
+                response = requests.post(endpoint.url, headers=endpoint_headers, json=payload, timeout=TIMEOUT)
+                response.raise_for_status()
+                body = response.json()
+            except requests.exceptions.RequestException as e:
+                self.release(endpoint, time.perf_counter() - start, error=e, response=response)
+                if not _retryable(e):
+                    raise
+                logger.debug("endpoint error", extra={'endpoint': endpoint.name, 'error': type(e).__name__})
+                failed.add(id(endpoint))
+                last_error = e
+                continue
+            self.release(endpoint, time.perf_counter() - start, response=response)
+            return body
+        raise last_error
+
+    def check_health(self, model: Optional[str] = None) -> None:
+        """Probe every open endpoint whose cooldown is over with a one-token request"""
+        now = time.monotonic()
+        with self._lock:
+            due = [e for e in self.endpoints if e.state == OPEN and now >= e.open_until]
+            for endpoint in due:
+                endpoint.open_until = now + self.cooldown
+                endpoint.in_flight += 1
+        for endpoint in due:
+            payload = {'messages': [{'role': 'user', 'content': 'ping'}], 'max_tokens': 1}
+            if model:
+                payload['model'] = model
+            start = time.perf_counter()
+            response = None
+            try:
+                response = requests.post(endpoint.url, json=payload, timeout=TIMEOUT,
+                                         headers={'Content-Type': 'application/json', endpoint.key_header: endpoint.api_key})
+                response.raise_for_status()
+                error = None
+            except requests.exceptions.RequestException as e:
+                error = e
+            self.release(endpoint, time.perf_counter() - start, error=error, response=response)
+
+    def start_health_checks(self, interval: float, model: Optional[str] = None) -> None:
+        """Run check_health every ``interval`` seconds on a daemon thread"""
+        def run():
+            while not self._stop.wait(interval):
+                self.check_health(model)
+
+        self._health_thread = threading.Thread(target=run, daemon=True, name="endpoint-health")
+        self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [endpoint.summary() for endpoint in self.endpoints]
+
+
+def load_endpoint_pools(path: str, default_api_key: Optional[str] = None, **pool_options: Any) -> Dict[str, EndpointPool]:
+    """Read a pool file (see module docstring) into one EndpointPool per model name"""
+    with open(path) as f:
+        config = json.load(f)
+    pools = {}
+    for model, entries in config.items():
+        endpoints = []
+        for entry in entries:
+            api_key = entry.get('api_key') or os.environ.get(entry.get('api_key_env', ''), '') or default_api_key
+            if not api_key:
+                raise ValueError(f"No API key for endpoint {entry.get('name') or entry['url']}")
+            endpoints.append(Endpoint(
+                url=entry['url'],
+                api_key=api_key,
+                name=entry.get('name'),
+                requests_per_minute=entry.get('requests_per_minute'),
+                key_header=entry.get('key_header', 'Ocp-Apim-Subscription-Key'),
+            ))
+        pools[model] = EndpointPool(endpoints, **pool_options)
+    return pools
@@ -0,0 +1,102 @@
+"""
+Logging helpers for the Decomposition Concordance Pipeline
+
+Hot loops log through the standard ``logging`` module so per-call detail is
+only formatted when its level is enabled. ``configure_logging`` can switch the
+output to JSON lines, ``ProgressReporter`` replaces per-item progress output
+with rate-limited updates, and ``log_raw_output`` samples raw LLM responses
+for debugging instead of dumping every one.
+"""
+
+import json
+import logging
+import random
+import sys
+import time
+from typing import Any, Optional
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_raw_output_sample_rate = 0.0
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including ``extra`` fields."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = 'INFO', json_lines: bool = False, raw_output_sample_rate: float = 0.0,
+                      stream=None) -> None:
+    """
+    Configure the root logger for a pipeline run.
+
+    Args:
+        level: Minimum level name, e.g. 'DEBUG' or 'WARNING'
+        json_lines: Emit JSON lines instead of plain text
+        raw_output_sample_rate: Fraction of raw LLM outputs logged at DEBUG level
+        stream: Output stream (stderr by default)
+    """
+    global _raw_output_sample_rate
+    _raw_output_sample_rate = raw_output_sample_rate
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+
+
+def log_raw_output(logger: logging.Logger, raw_output: str, **fields: Any) -> None:
+    """Log a raw LLM output at DEBUG level for a sampled fraction of calls."""
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= _raw_output_sample_rate:
+        return
+    logger.debug("raw LLM output", extra=dict(fields, raw_output=raw_output))
+
+
+class ProgressReporter(object):
+    """
+    Logs progress of a loop at most once every ``min_interval`` seconds,
+    with throughput and, when ``total`` is known, an ETA.
+    """
+    def __init__(self, desc: str, total: Optional[int] = None, logger: Optional[logging.Logger] = None,
+                 min_interval: float = 10.0):
+        self.desc = desc
+        self.total = total
+        self.logger = logger or logging.getLogger(__name__)
+        self.min_interval = min_interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, n: int = 1) -> None:
+        self.done += n
+        now = time.perf_counter()
+        if now - self.last_report >= self.min_interval:
+            self.last_report = now
+            self._report(now)
+
+    def close(self) -> None:
+        self._report(time.perf_counter())
+
+    def _report(self, now: float) -> None:
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        fields = {'stage': self.desc, 'done': self.done, 'total': self.total, 'items_per_second': round(rate, 3)}
+        if self.total is not None and rate > 0:
+            fields['eta_seconds'] = round((self.total - self.done) / rate, 1)
+        progress = f"{self.done}/{self.total}" if self.total is not None else str(self.done)
+        self.logger.info("%s progress: %s (%.2f items/s)", self.desc, progress, rate, extra=fields)
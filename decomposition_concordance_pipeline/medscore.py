@@ -6,18 +6,31 @@ import os
 import logging
 import json
 import pandas as pd
-from typing import List, Any, Optional, Dict
+from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import groupby
+from typing import List, Any, Optional, Dict, Iterable, Iterator, Tuple
 from argparse import ArgumentParser
 
 import jsonlines
-from tqdm import tqdm
 
-from .utils import parse_sentences
+from .utils import parse_sentences, chunker
 from .decomposer import MedScoreDecomposer
-from .verifier import ProvidedEvidenceVerifier
+from .verifier import ProvidedEvidenceVerifier, ClaimVerification, CHUNK_SIZE
+from .api_utils import RateLimiter, HedgePolicy
+from .metrics import METRICS
+from .log_utils import configure_logging
+from .run_journal import RunJournal
+from .provenance import PreviousRun, with_claim_uid
+from .routing import ModelRouter
+from .sharding import shard_of, select_shard, shard_dir
+from .endpoint_pool import EndpointPool, load_endpoint_pools
+from .token_budget import TokenBudget
+from .dry_run import (LatencyModel, estimate_medscore, build_report, rate_limited_seconds, pool_requests_per_minute,
+                      log_report)
 
-FORMAT = '%(asctime)s %(message)s'
-logging.basicConfig(level=logging.WARNING, format=FORMAT)
 logger = logging.getLogger(__name__)
 
 class MedScore(object):
@@ -28,23 +41,59 @@ class MedScore(object):
             model_name_verification: str,
             server_verification: str,
             response_key: str,
-            provided_evidence: Optional[Dict[str, str]] = None,
+            provided_evidence: Optional[Mapping[str, str]] = None,
             prompt_path: Optional[str] = None,
             api_key: Optional[str] = None,
+            server_url_decomposition: Optional[str] = None,
+            server_url_verification: Optional[str] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            stage_prefix: str = "",
+            num_samples: int = 1,
+            sample_temperature: Optional[float] = None,
+            early_stop_threshold: Optional[float] = None,
+            early_stop_chunk_size: int = 10,
+            stream_chunk_size: int = 10,
+            stream_workers: int = 8,
+            router: Optional[ModelRouter] = None,
+            hedge: Optional[HedgePolicy] = None,
+            endpoint_pools: Optional[Dict[str, EndpointPool]] = None,
+            token_budget: Optional[TokenBudget] = None,
     ):
         self.response_key = response_key
+        self.stage_prefix = stage_prefix
+        # Streaming mode: claims per verifier request, and verifier requests in flight
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_workers = stream_workers
         self.decomposer = MedScoreDecomposer(
             model_name=model_name_decomposition,
             server_path=server_decomposition,
             prompt_path=prompt_path,
-            api_key=api_key
+            api_key=api_key,
+            server_url=server_url_decomposition,
+            rate_limiter=rate_limiter,
+            stage=stage_prefix + "decompose",
+            router=router,
+            hedge=hedge,
+            endpoint_pools=endpoint_pools,
         )
         self.verifier = ProvidedEvidenceVerifier(
             model_name=model_name_verification,
             server_path=server_verification,
             id_to_evidence=provided_evidence,
-            api_key=api_key
+            api_key=api_key,
+            server_url=server_url_verification,
+            rate_limiter=rate_limiter,
+            stage=stage_prefix + "verify",
+            num_samples=num_samples,
+            sample_temperature=sample_temperature,
+            early_stop_threshold=early_stop_threshold,
+            early_stop_chunk_size=early_stop_chunk_size,
+            router=router,
+            hedge=hedge,
+            endpoint_pools=endpoint_pools,
+            token_budget=token_budget,
         )
+        self.router = router
 
     def decompose(
         self,
@@ -59,135 +108,612 @@ class MedScore(object):
         decompositions = self.decomposer(decomposer_input)
         return decompositions
 
-    def verify(self, decompositions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def verify(
+        self,
+        decompositions: List[Dict[str, Any]],
+        provided_evidence: Optional[Mapping[str, str]] = None,
+    ) -> List[ClaimVerification]:
+        if provided_evidence is not None:
+            self.verifier.id_to_evidence = provided_evidence
         non_empty_decompositions = [d for d in decompositions if d["claim"] is not None]
         verifier_output = self.verifier(non_empty_decompositions)
         return verifier_output
 
-def load_csv_data(csv_file: str) -> tuple:
-    df = pd.read_csv(csv_file, encoding='latin1')
-    required_columns = ["dav_id", "ai_answer", "answer", "question"]
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    def decompose_and_verify_streaming(
+        self,
+        dataset: List[Dict[str, Any]],
+        provided_evidence: Optional[Mapping[str, str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[ClaimVerification]]:
+        """
+        Decompose over streamed completions and verify claims while they are
+        still being generated: each case's claims are queued for verification
+        as they close in the stream and sent in chunks of ``stream_chunk_size``
+        to a pool of ``stream_workers`` threads. Verification of one case
+        overlaps with the decomposition of the next.
+        """
+        if provided_evidence is not None:
+            self.verifier.id_to_evidence = provided_evidence
+        decompositions = []
+        cases = []
+        with ThreadPoolExecutor(max_workers=self.stream_workers, thread_name_prefix="verify") as executor:
+            for item in dataset:
+                case = self.verifier.stream_case(item["id"], executor, self.stream_chunk_size)
+                for d in self.decomposer.stream_claims({"id": item["id"], "ai_answer": item[self.response_key]}):
+                    decompositions.append(d)
+                    if d["claim"] is not None:
+                        case.add(d)
+                case.finish()
+                cases.append(case)
+            verifications = []
+            for case in cases:
+                verifications.extend(case.result())
+                if case.latency is not None:
+                    METRICS.record_timing(self.stage_prefix + "case", case.latency)
+        return decompositions, verifications
+
+    def decompose_incremental(
+        self,
+        dataset: List[Dict[str, Any]],
+        previous: PreviousRun,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Like decompose, but reuses the stored claims of every case whose answer,
+        prompt and model are unchanged. Returns the decompositions in dataset
+        order and the number of reused cases.
+        """
+        reused = {}
+        todo = []
+        for item in dataset:
+            records = previous.decompositions_for(item["id"], self.decomposer.provenance(item[self.response_key]))
+            if records is None:
+                todo.append(item)
+            else:
+                reused[item["id"]] = records
+        fresh_by_case = defaultdict(list)
+        for d in (self.decompose(todo) if todo else []):
+            fresh_by_case[d["dav_id"]].append(d)
+        decompositions = []
+        for item in dataset:
+            decompositions.extend(reused[item["id"]] if item["id"] in reused else fresh_by_case[item["id"]])
+        return decompositions, len(reused)
+
+    def verify_incremental(
+        self,
+        decompositions: List[Dict[str, Any]],
+        provided_evidence: Optional[Mapping[str, str]],
+        previous: PreviousRun,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+        """
+        Like verify, but reuses the stored verdicts of every case whose
+        reference, claims, prompt, model and options are unchanged. Returns
+        formatted verification records and final-output entries in case
+        order, and the number of reused cases.
+        """
+        if provided_evidence is not None:
+            self.verifier.id_to_evidence = provided_evidence
+        claims_by_case = defaultdict(list)
+        for d in decompositions:
+            if d["claim"] is not None:
+                claims_by_case[d["dav_id"]].append(d)
+        reused = {}
+        todo = []
+        for dav_id, claims in claims_by_case.items():
+            provenance = self.verifier.case_provenance(self.verifier.id_to_evidence[dav_id], [c["claim"] for c in claims])
+            stored = previous.verifications_for(dav_id, provenance)
+            if stored is None:
+                todo.extend(claims)
+            else:
+                reused[dav_id] = stored
+        fresh = self.verifier(todo) if todo else []
+        fresh_records = defaultdict(list)
+        for record in format_verifications(fresh):
+            fresh_records[record["dav_id"]].append(record)
+        fresh_final = {entry["dav_id"]: entry for entry in summarize_verifications(fresh)}
+        records, final_entries = [], []
+        for dav_id in claims_by_case:
+            if dav_id in reused:
+                case_records, final_entry = reused[dav_id]
+            else:
+                case_records, final_entry = fresh_records[dav_id], fresh_final.get(dav_id)
+            records.extend(case_records)
+            if final_entry is not None:
+                final_entries.append(final_entry)
+        return records, final_entries, len(reused)
+
+REQUIRED_COLUMNS = ["dav_id", "ai_answer", "answer", "question"]
+CSV_ENCODING = 'latin1'
+
+
+def format_evidence(question: str, answer: str) -> str:
+    return f"Question: {question}\nReference Answer: {answer}"
+
+
+class ProvidedEvidence(Mapping):
+    """
+    Maps dav_id to the reference evidence for that case.
+
+    Only the raw question/answer pair is held per case; the formatted evidence
+    string is built when the verifier looks it up.
+    """
+    def __init__(self, items: Iterable[Dict[str, str]] = ()):
+        self._sources = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item: Dict[str, str]) -> None:
+        self._sources[item["id"]] = (item["question"], item["answer"])
+
+    def __getitem__(self, item_id: str) -> str:
+        question, answer = self._sources[item_id]
+        return format_evidence(question, answer)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+def iter_csv_data(csv_file: str, chunksize: int = 1000) -> Iterator[Dict[str, str]]:
+    """
+    Lazily yield one item per CSV row.
+
+    The file is read ``chunksize`` rows at a time and only the required
+    columns are parsed, all as strings, so memory use does not grow with the
+    size of the export.
+    """
+    header = pd.read_csv(csv_file, encoding=CSV_ENCODING, nrows=0)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in header.columns]
     if missing_columns:
         raise ValueError(f"Missing required columns: {missing_columns}")
+    reader = pd.read_csv(
+        csv_file,
+        encoding=CSV_ENCODING,
+        usecols=REQUIRED_COLUMNS,
+        dtype={col: str for col in REQUIRED_COLUMNS},
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        # Empty cells were previously stringified as "nan"; keep that behaviour
+        chunk = chunk.fillna("nan")
+        for item_id, ai_answer, answer, question in zip(
+                chunk["dav_id"], chunk["ai_answer"], chunk["answer"], chunk["question"]):
+            yield {
+                "id": item_id,
+                "ai_answer": ai_answer,
+                "answer": answer,
+                "question": question
+            }
+
+
+def count_csv_cases(csv_file: str, chunksize: int = 100000, shard: Optional[Tuple[int, int]] = None) -> int:
+    """Count CSV rows (of one ``(shard_index, num_shards)`` shard) by parsing only the ``dav_id`` column."""
+    chunks = pd.read_csv(csv_file, encoding=CSV_ENCODING, usecols=["dav_id"], dtype=str, chunksize=chunksize)
+    if shard is None:
+        return sum(len(chunk) for chunk in chunks)
+    return sum(1 for chunk in chunks for dav_id in chunk["dav_id"].fillna("nan") if shard_of(dav_id, shard[1]) == shard[0])
+
+
+def load_csv_data(csv_file: str) -> tuple:
     dataset = []
-    provided_evidence = {}
-    for _, row in df.iterrows():
-        item_id = str(row["dav_id"])
-        ai_answer = str(row["ai_answer"])
-        answer = str(row["answer"])
-        question = str(row["question"])
+    provided_evidence = ProvidedEvidence()
+    for item in iter_csv_data(csv_file):
         dataset.append({
-            "id": item_id,
-            "ai_answer": ai_answer
+            "id": item["id"],
+            "ai_answer": item["ai_answer"]
         })
-        provided_evidence[item_id] = f"Question: {question}\nReference Answer: {answer}"
+        provided_evidence.add(item)
     return dataset, provided_evidence
 
+
+def iter_decomposition_batches(decomp_file: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Stream a decompositions file, yielding the claims of up to ``batch_size``
+    cases at a time. Claims of one case are never split across batches.
+    """
+    with jsonlines.open(decomp_file, 'r') as reader:
+        # Older outputs numbered claims with a running counter; use the stable ids
+        grouped = groupby((with_claim_uid(d) for d in reader.iter()), key=lambda d: d.get('dav_id'))
+        for case_batch in chunker((list(claims) for _, claims in grouped), batch_size):
+            yield [d for claims in case_batch for d in claims]
+
+
+def format_decompositions(decompositions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    formatted_decompositions = []
+    for d in decompositions:
+        formatted = {
+            'dav_id': d.get('dav_id'),
+            'claim_id': d.get('claim_id'),
+            'id': d.get('id'),
+            'claim': d.get('claim')
+        }
+        if d.get('provenance') is not None:
+            formatted['provenance'] = d['provenance']
+        formatted_decompositions.append(formatted)
+    return formatted_decompositions
+
+
+def format_verifications(verifications: List[ClaimVerification]) -> List[Dict[str, Any]]:
+    formatted_verifications = []
+    for v in verifications:
+        formatted = {
+            'dav_id': v.dav_id,
+            'claim_id': v.claim_id,
+            'id': v.id,
+            'claim': v.claim,
+            'evidence': (v.reference[:20] + '...') if v.reference else '',
+            'score': v.score,
+            'reason': v.reason
+        }
+        if v.confidence is not None:
+            formatted['confidence'] = v.confidence
+            formatted['entropy'] = v.entropy
+        if v.case.provenance is not None:
+            formatted['provenance'] = v.case.provenance
+        formatted_verifications.append(formatted)
+    return formatted_verifications
+
+
+def summarize_verifications(verifications: List[ClaimVerification]) -> List[Dict[str, Any]]:
+    """
+    One final_output entry per case with verdict counts and support /
+    not-addressed fractions and percentages. An early-stopped case has no
+    percentages over all its claims: its counts go under ``verified_*`` keys
+    and its concordance call at the run's threshold is in ``early_stop``, so
+    consumers of ``support_percentage`` never mistake a partial value for a
+    full one.
+    """
+    # Build a mapping from dav_id to counts of each score
+    david_counts = {}
+    confidences = {}
+    early_stops = {}
+    for verif in verifications:
+        dav_id = verif.dav_id
+        score = verif.score
+        if dav_id is None or score is None:
+            continue
+        if dav_id not in david_counts:
+            david_counts[dav_id] = {'Supported': 0, 'Not Supported': 0, 'Not Addressed': 0}
+        if score in david_counts[dav_id]:
+            david_counts[dav_id][score] += 1
+        if verif.confidence is not None:
+            confidences.setdefault(dav_id, []).append(verif.confidence)
+        if verif.case.early_stop is not None:
+            early_stops[dav_id] = verif.case.early_stop
+    # Prepare output as a list of dicts
+    summary_output = []
+    for dav_id, counts in david_counts.items():
+        entry = {'dav_id': dav_id}
+        entry.update(counts)
+        supported = counts['Supported']
+        not_supported = counts['Not Supported']
+        not_addressed = counts['Not Addressed']
+        total = supported + not_supported + not_addressed
+        support_denom = supported + not_supported
+        # Percentages of an early-stopped case cover the verified claims only
+        prefix = 'verified_' if dav_id in early_stops else ''
+        # Report as 'numerator/denominator' strings
+        entry[prefix + 'support_fraction'] = f"{supported}/{support_denom}" if support_denom > 0 else "0/0"
+        entry[prefix + 'support_percentage'] = f"{supported/support_denom*100}%" if support_denom > 0 else "0%"
+        entry[prefix + 'not_addressed_fraction'] = f"{not_addressed}/{total}" if total > 0 else "0/0"
+        entry[prefix + 'not_addressed_percentage'] = f"{not_addressed/total*100}%" if total > 0 else "0%"
+        if dav_id in confidences:
+            entry['mean_confidence'] = sum(confidences[dav_id]) / len(confidences[dav_id])
+        if dav_id in early_stops:
+            entry['early_stop'] = early_stops[dav_id]
+        summary_output.append(entry)
+    return summary_output
+
+def dry_run(args) -> Dict[str, Any]:
+    """Project the run described by the CLI ``args`` without sending any request; see dry_run.py"""
+    latency = LatencyModel.from_run_metrics(args.dry_run_metrics) if args.dry_run_metrics else LatencyModel()
+    token_budget = TokenBudget(model=args.model_name_verification, max_prompt_tokens=args.max_prompt_tokens,
+                               enforce=args.max_prompt_tokens is not None)
+    scorer = MedScore(
+        model_name_decomposition=args.model_name_decomposition,
+        server_decomposition=args.server_decomposition,
+        model_name_verification=args.model_name_verification,
+        server_verification=args.server_verification,
+        response_key="ai_answer",
+        prompt_path=args.prompt_path,
+        num_samples=args.num_samples,
+        sample_temperature=args.sample_temperature,
+        token_budget=token_budget,
+    )
+    if args.stream_decomposition:
+        chunk_size = args.stream_chunk_size
+    elif args.early_stop_threshold is not None:
+        chunk_size = args.early_stop_chunk_size
+    else:
+        chunk_size = CHUNK_SIZE
+    logger.info(f"Dry run: building and tokenizing the prompts for {args.input_file}...")
+    estimates = estimate_medscore(iter_csv_data(args.input_file, args.chunk_size), scorer, latency,
+                                  decompose=not args.verify_only, verify=not args.decompose_only, chunk_size=chunk_size)
+    decompose, verify = estimates[scorer.decomposer.stage], estimates[scorer.verifier.stage]
+    if args.stream_decomposition:
+        # Verification runs alongside decomposition on stream_workers threads
+        busy_seconds = max(decompose.busy_seconds, verify.busy_seconds / args.stream_workers)
+    else:
+        busy_seconds = decompose.busy_seconds + verify.busy_seconds
+    # Shards run in parallel; every call of a shard is sequential
+    wall_seconds = busy_seconds / args.num_shards
+    if args.endpoint_pool:
+        calls_by_model = defaultdict(int)
+        for estimate in estimates.values():
+            calls_by_model[estimate.model] += estimate.calls
+        wall_seconds = max([wall_seconds] + [
+            rate_limited_seconds(calls, pool_requests_per_minute(args.endpoint_pool, model))
+            for model, calls in calls_by_model.items()])
+    report = build_report(
+        count_csv_cases(args.input_file), estimates, wall_seconds, token_budget, latency,
+        num_shards=args.num_shards,
+        stream_workers=args.stream_workers if args.stream_decomposition else None,
+        num_samples=args.num_samples,
+        claims_per_verifier_request=chunk_size,
+    )
+    log_report(report)
+    return report
+
+
 def parse_args():
     parser = ArgumentParser(description="Decomposition Concordance Pipeline")
     parser.add_argument("--input_file", required=True, type=str, help="Path to the input CSV file")
     parser.add_argument("--output_dir", default="./results", type=str, help="Path to output directory")
     parser.add_argument("--prompt_path", type=str, default="prompt/MedScore_prompt.txt", help="Path to the decomposition prompt file")
-    parser.add_argument("--api_key", required=True, type=str, help="Stanford API key")
+    parser.add_argument("--api_key", type=str, default=None, help="Stanford API key (required unless --dry_run)")
     parser.add_argument("--decompose_only", action="store_true", help="Only run decomposition step")
     parser.add_argument("--verify_only", action="store_true", help="Only run verification step")
     parser.add_argument("--model_name_decomposition", type=str, default="gpt-4", help="Model for decomposition")
     parser.add_argument("--server_decomposition", type=str, default="https://apim.stanfordhealthcare.org/openai20/deployments/gpt-4/chat/completions?api-version=2023-05-15", help="Server for decomposition")
     parser.add_argument("--model_name_verification", type=str, default="gpt-4", help="Model for verification")
     parser.add_argument("--server_verification", type=str, default="https://apim.stanfordhealthcare.org/openai20/deployments/gpt-4/chat/completions?api-version=2023-05-15", help="Server for verification")
-    return parser.parse_args()
+    parser.add_argument("--metrics_file", type=str, default=None, help="Path for the run metrics JSON (default: <output_dir>/run_metrics.json)")
+    parser.add_argument("--prometheus_file", type=str, default=None, help="Also write run metrics in Prometheus text format to this path")
+    parser.add_argument("--log_level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--log_json", action="store_true", help="Emit logs as JSON lines")
+    parser.add_argument("--raw_output_sample_rate", type=float, default=0.0, help="Fraction of raw LLM outputs logged at DEBUG level")
+    parser.add_argument("--chunk_size", type=int, default=500, help="Number of cases read, decomposed and verified per chunk")
+    parser.add_argument("--num_samples", type=int, default=1, help="Verifier samples per claim chunk; >1 majority-votes each claim")
+    parser.add_argument("--sample_temperature", type=float, default=0.7, help="Sampling temperature used when --num_samples > 1")
+    parser.add_argument("--early_stop_threshold", type=float, default=None,
+                        help="Support percentage threshold (e.g. 80); stop verifying a case once its prediction at it is decided")
+    parser.add_argument("--early_stop_chunk_size", type=int, default=10,
+                        help="Claims per verifier request in early-stop mode; smaller chunks can stop sooner but cost more requests")
+    parser.add_argument("--stream_decomposition", action="store_true",
+                        help="Stream decomposition responses and verify claims as they arrive instead of after each chunk")
+    parser.add_argument("--stream_chunk_size", type=int, default=10,
+                        help="Claims per verifier request in streaming mode; smaller chunks start sooner but cost more requests")
+    parser.add_argument("--stream_workers", type=int, default=8, help="Verifier requests in flight in streaming mode")
+    parser.add_argument("--route_small_model", type=str, default=None,
+                        help="Route short answers and every claim chunk to this cheaper model first (e.g. gpt-4.1-mini), "
+                             "escalating failures to the main models")
+    parser.add_argument("--route_small_server", type=str, default=None,
+                        help="Chat completion URL of the small model (default: the API_CONFIG url)")
+    parser.add_argument("--route_max_answer_chars", type=int, default=1500,
+                        help="Longest answer (in characters) decomposed by the small model")
+    parser.add_argument("--route_min_confidence", type=float, default=0.8,
+                        help="With --num_samples > 1, escalate claim chunks with any claim below this vote confidence")
+    parser.add_argument("--hedge_percentile", type=float, default=None,
+                        help="Send a duplicate request when a call is slower than this latency percentile of its stage (e.g. 95)")
+    parser.add_argument("--hedge_budget", type=float, default=0.05,
+                        help="Maximum duplicate requests as a fraction of all calls")
+    parser.add_argument("--hedge_min_samples", type=int, default=20,
+                        help="Calls a stage needs before its percentile is used; until then --hedge_initial_delay applies")
+    parser.add_argument("--hedge_initial_delay", type=float, default=15.0, help="Hedge delay in seconds before enough calls are seen")
+    parser.add_argument("--hedge_server", type=str, default=None, help="Send duplicates to this chat completion URL instead")
+    parser.add_argument("--hedge_model", type=str, default=None, help="Model name for duplicate requests (default: the original's)")
+    parser.add_argument("--endpoint_pool", type=str, default=None,
+                        help="JSON file of equivalent deployments per model to load balance across")
+    parser.add_argument("--endpoint_failure_threshold", type=int, default=5,
+                        help="Consecutive errors before an endpoint's circuit opens")
+    parser.add_argument("--endpoint_cooldown", type=float, default=30.0,
+                        help="Seconds an endpoint with an open circuit is skipped before it is tried again")
+    parser.add_argument("--endpoint_health_interval", type=float, default=None,
+                        help="Probe endpoints with open circuits every this many seconds")
+    parser.add_argument("--num_shards", type=int, default=1,
+                        help="Split the cohort by dav_id hash into this many shards and run only --shard_index")
+    parser.add_argument("--shard_index", type=int, default=0,
+                        help="Shard to run; outputs go to <output_dir>/shard-<i>-of-<N> (merge them with sharding.py)")
+    parser.add_argument("--max_prompt_tokens", type=int, default=None,
+                        help="Split references so each verifier prompt fits this many tokens (capped by the model's "
+                             "context window). Without it prompts are sent whole and only measured")
+    parser.add_argument("--dry_run", "--dry-run", action="store_true",
+                        help="Build and tokenize every prompt and estimate calls, tokens, cost and wall time "
+                             "without sending requests; writes <output_dir>/dry_run_report.json")
+    parser.add_argument("--dry_run_metrics", type=str, default=None,
+                        help="run_metrics.json of an earlier run; its mean call latencies calibrate the dry run, and "
+                             "the routing report's large-model latency when this run times no large-model calls")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse results in output_dir whose prompt, model and input are unchanged; recompute the rest")
+    args = parser.parse_args()
+    if args.stream_decomposition and (args.decompose_only or args.verify_only or args.incremental
+                                      or args.early_stop_threshold is not None):
+        parser.error("--stream_decomposition runs both stages and cannot be combined with "
+                     "--decompose_only, --verify_only, --incremental or --early_stop_threshold")
+    if not args.api_key and not args.dry_run:
+        parser.error("--api_key is required unless --dry_run is given")
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard_index must be between 0 and --num_shards - 1")
+    return args
 
 if __name__ == '__main__':
     args = parse_args()
+    configure_logging(args.log_level, json_lines=args.log_json, raw_output_sample_rate=args.raw_output_sample_rate)
+    if args.dry_run:
+        report = dry_run(args)
+        os.makedirs(args.output_dir, exist_ok=True)
+        report_file = os.path.join(args.output_dir, "dry_run_report.json")
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved dry run report to {report_file}")
+        exit(0)
+    shard = None
+    if args.num_shards > 1:
+        shard = (args.shard_index, args.num_shards)
+        args.output_dir = shard_dir(args.output_dir, args.shard_index, args.num_shards)
+        logger.info(f"Running shard {args.shard_index} of {args.num_shards} into {args.output_dir}")
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir, exist_ok=True)
-    print(f"Loading data from {args.input_file}...")
-    dataset, provided_evidence = load_csv_data(args.input_file)
-    print(f"Loaded {len(dataset)} items from CSV")
+    router = None
+    if args.route_small_model:
+        router = ModelRouter(args.route_small_model, args.route_small_server,
+                             max_answer_chars=args.route_max_answer_chars, min_confidence=args.route_min_confidence)
+    hedge = None
+    if args.hedge_percentile is not None:
+        hedge = HedgePolicy(percentile=args.hedge_percentile, min_samples=args.hedge_min_samples,
+                            initial_delay=args.hedge_initial_delay, max_extra_fraction=args.hedge_budget,
+                            url=args.hedge_server, model=args.hedge_model)
+    endpoint_pools = None
+    if args.endpoint_pool:
+        endpoint_pools = load_endpoint_pools(args.endpoint_pool, default_api_key=args.api_key,
+                                             failure_threshold=args.endpoint_failure_threshold,
+                                             cooldown=args.endpoint_cooldown)
+        for model, pool in endpoint_pools.items():
+            logger.info(f"Load balancing {model} across {len(pool.endpoints)} endpoints")
+            if args.endpoint_health_interval:
+                pool.start_health_checks(args.endpoint_health_interval, model)
+    token_budget = TokenBudget(model=args.model_name_verification, max_prompt_tokens=args.max_prompt_tokens,
+                               enforce=args.max_prompt_tokens is not None)
     scorer = MedScore(
         model_name_decomposition=args.model_name_decomposition,
         server_decomposition=args.server_decomposition,
         model_name_verification=args.model_name_verification,
         server_verification=args.server_verification,
         response_key="ai_answer",
-        provided_evidence=provided_evidence,
         prompt_path=args.prompt_path,
-        api_key=args.api_key
+        api_key=args.api_key,
+        num_samples=args.num_samples,
+        sample_temperature=args.sample_temperature,
+        early_stop_threshold=args.early_stop_threshold,
+        early_stop_chunk_size=args.early_stop_chunk_size,
+        stream_chunk_size=args.stream_chunk_size,
+        stream_workers=args.stream_workers,
+        router=router,
+        hedge=hedge,
+        endpoint_pools=endpoint_pools,
+        token_budget=token_budget,
     )
     decomp_output_file = os.path.join(args.output_dir, "decompositions.jsonl")
     verif_output_file = os.path.join(args.output_dir, "verifications.jsonl")
     output_file = os.path.join(args.output_dir, "final_output.jsonl")
-    if not args.verify_only:
-        print("Running decomposition...")
-        decompositions = scorer.decompose(dataset)
-        # Reformat decompositions for output
-        formatted_decompositions = []
-        for d in decompositions:
-            formatted = {
-                'dav_id': d.get('dav_id'),
-                'claim_id': d.get('claim_id'),
-                'id': d.get('id'),
-                'claim': d.get('claim')
-            }
-            formatted_decompositions.append(formatted)
-        with jsonlines.open(decomp_output_file, 'w') as writer:
-            writer.write_all(formatted_decompositions)
-        print(f"Saved {len(decompositions)} decompositions to {decomp_output_file}")
-        if args.decompose_only:
-            print("Decomposition complete. Exiting.")
-            exit(0)
+    previous = None
+    if args.incremental:
+        # Read before the writers below truncate the files
+        previous = PreviousRun(args.output_dir, load_decompositions=not args.verify_only)
+    csv_items = iter_csv_data(args.input_file, args.chunk_size)
+    if shard is not None:
+        csv_items = select_shard(csv_items, *shard)
     if args.verify_only:
-        print(f"Loading decompositions from {decomp_output_file}...")
-        with jsonlines.open(decomp_output_file, 'r') as reader:
-            decompositions = [item for item in reader.iter()]
-    print("Running verification...")
-    verifications = scorer.verify(decompositions)
-    with jsonlines.open(verif_output_file, 'w') as writer:
-        # Reformat verifications for output
-        formatted_verifications = []
-        for v in verifications:
-            formatted = {
-                'dav_id': v.get('dav_id'),
-                'claim_id': v.get('claim_id'),
-                'id': v.get('id'),
-                'claim': v.get('claim'),
-                'evidence': (v.get('reference', '')[:20] + '...') if v.get('reference') else '',
-                'score': v.get('score'),
-                'reason': v.get('reason')
-            }
-            formatted_verifications.append(formatted)
-        writer.write_all(formatted_verifications)
-    print(f"Saved {len(verifications)} verifications to {verif_output_file}")
-    print("Combining results...")
-    # Build a mapping from dav_id to counts of each score
-    david_counts = {}
-    for verif in verifications:
-        dav_id = verif.get('dav_id')
-        score = verif.get('score')
-        if dav_id is None or score is None:
-            continue
-        if dav_id not in david_counts:
-            david_counts[dav_id] = {'Supported': 0, 'Not Supported': 0, 'Not Addressed': 0}
-        if score in david_counts[dav_id]:
-            david_counts[dav_id][score] += 1
-    # Prepare output as a list of dicts
-    summary_output = []
-    for dav_id, counts in david_counts.items():
-        entry = {'dav_id': dav_id}
-        entry.update(counts)
-        supported = counts['Supported']
-        not_supported = counts['Not Supported']
-        not_addressed = counts['Not Addressed']
-        total = supported + not_supported + not_addressed
-        support_denom = supported + not_supported
-        # Report as 'numerator/denominator' strings
-        entry['support_fraction'] = f"{supported}/{support_denom}" if support_denom > 0 else "0/0"
-        entry['support_percentage'] = f"{supported/support_denom*100}%" if support_denom > 0 else "0%"
-        entry['not_addressed_fraction'] = f"{not_addressed}/{total}" if total > 0 else "0/0"
-        entry['not_addressed_percentage'] = f"{not_addressed/total*100}%" if total > 0 else "0%"
-        summary_output.append(entry)
-    with jsonlines.open(output_file, 'w') as writer:
-        writer.write_all(summary_output)
-    print(f"Saved final results to {output_file}")
-    print("Pipeline complete!") 
\ No newline at end of file
+        # Only the raw question/answer pairs are kept; evidence strings are built per lookup
+        logger.info(f"Loading evidence from {args.input_file}...")
+        provided_evidence = ProvidedEvidence(csv_items)
+        logger.info(f"Loading decompositions from {decomp_output_file}...")
+        batches = ((decompositions, provided_evidence)
+                   for decompositions in iter_decomposition_batches(decomp_output_file, args.chunk_size))
+        total_cases = len(provided_evidence)
+    else:
+        logger.info(f"Streaming data from {args.input_file} in chunks of {args.chunk_size}...")
+        batches = ((items, ProvidedEvidence(items)) for items in chunker(csv_items, args.chunk_size))
+        total_cases = count_csv_cases(args.input_file, shard=shard)
+    # Each chunk holds complete cases, so all three outputs can be appended chunk by chunk.
+    # Writers flush per line so the review app can show finished cases during the run.
+    with ExitStack() as stack:
+        journal = stack.enter_context(RunJournal(args.output_dir))
+        journal.start(total_cases=total_cases, input_file=args.input_file, output_dir=args.output_dir,
+                      chunk_size=args.chunk_size,
+                      mode=("verify_only" if args.verify_only else "decompose_only" if args.decompose_only
+                            else "stream" if args.stream_decomposition else "full"))
+        decomp_writer = None if args.verify_only else stack.enter_context(jsonlines.open(decomp_output_file, 'w', flush=True))
+        verif_writer = None if args.decompose_only else stack.enter_context(jsonlines.open(verif_output_file, 'w', flush=True))
+        final_writer = None if args.decompose_only else stack.enter_context(jsonlines.open(output_file, 'w', flush=True))
+        num_items = num_decompositions = num_verifications = 0
+        reused_decompositions = reused_verifications = 0
+        for batch, provided_evidence in batches:
+            if args.verify_only:
+                decompositions = batch
+                dav_ids = list(dict.fromkeys(d['dav_id'] for d in batch))
+            else:
+                dav_ids = [item['id'] for item in batch]
+                num_items += len(batch)
+                if args.stream_decomposition:
+                    logger.info(f"Running streamed decomposition and verification on {len(batch)} items "
+                                f"({num_items} so far)...")
+                    with METRICS.stage("decompose+verify", items=len(batch)):
+                        decompositions, results = scorer.decompose_and_verify_streaming(batch, provided_evidence)
+                    decomp_writer.write_all(format_decompositions(decompositions))
+                    num_decompositions += len(decompositions)
+                    verifications = format_verifications(results)
+                    verif_writer.write_all(verifications)
+                    num_verifications += len(verifications)
+                    final_writer.write_all(summarize_verifications(results))
+                    journal.chunk(dav_ids, decompositions=len(decompositions), verifications=len(verifications))
+                    continue
+                logger.info(f"Running decomposition on {len(batch)} items ({num_items} so far)...")
+                with METRICS.stage("decompose", items=len(batch)):
+                    if previous is None:
+                        decompositions = scorer.decompose(batch)
+                    else:
+                        decompositions, reused = scorer.decompose_incremental(batch, previous)
+                        reused_decompositions += reused
+                decomp_writer.write_all(format_decompositions(decompositions))
+                num_decompositions += len(decompositions)
+            if args.decompose_only:
+                journal.chunk(dav_ids, decompositions=len(decompositions))
+                continue
+            logger.info("Running verification...")
+            with METRICS.stage("verify", items=len(decompositions)):
+                if previous is None:
+                    results = scorer.verify(decompositions, provided_evidence)
+                    verifications = format_verifications(results)
+                    final_entries = summarize_verifications(results)
+                else:
+                    verifications, final_entries, reused = scorer.verify_incremental(
+                        decompositions, provided_evidence, previous)
+                    reused_verifications += reused
+            verif_writer.write_all(verifications)
+            num_verifications += len(verifications)
+            final_writer.write_all(final_entries)
+            journal.chunk(dav_ids, decompositions=len(decompositions), verifications=len(verifications))
+    metrics_file = args.metrics_file or os.path.join(args.output_dir, "run_metrics.json")
+    run_metrics = METRICS.write_json(metrics_file)
+    if args.prometheus_file:
+        METRICS.write_prometheus(args.prometheus_file)
+    if hedge is not None and 'hedges' in run_metrics['total']:
+        logger.info(f"Hedging sent {run_metrics['total']['hedges']['sent']} duplicate requests, "
+                    f"{run_metrics['total']['hedges']['won']} answered first")
+    if endpoint_pools is not None:
+        pool_report = {model: pool.summary() for model, pool in endpoint_pools.items()}
+        with open(os.path.join(args.output_dir, "endpoint_pool_report.json"), 'w') as f:
+            json.dump(pool_report, f, indent=2)
+        for model, endpoints in pool_report.items():
+            logger.info(f"Endpoints for {model}: " + ", ".join(
+                f"{e['name']} {e['calls']} calls/{e['errors']} errors ({e['state']})" for e in endpoints))
+    if not args.decompose_only:
+        token_report = token_budget.report()
+        with open(os.path.join(args.output_dir, "token_report.json"), 'w') as f:
+            json.dump(token_report, f, indent=2)
+        for stage, entry in token_report['stages'].items():
+            logger.info(f"Prompt tokens for {stage}: p50 {entry['prompts']['p50']:.0f}, max {entry['prompts']['max']}, "
+                        f"{entry['split']} split and {entry['over_limit']} over the {token_report['prompt_token_limit']} "
+                        f"token limit")
+    if router is not None:
+        routing_latency = LatencyModel.from_run_metrics(args.dry_run_metrics) if args.dry_run_metrics else None
+        routing_report = router.report(run_metrics, routing_latency)
+        with open(os.path.join(args.output_dir, "routing_report.json"), 'w') as f:
+            json.dump(routing_report, f, indent=2)
+        for stage, entry in routing_report.items():
+            logger.info(f"Routing {stage}: {entry['items']}, estimated ${entry.get('estimated_cost_saved_usd', 0.0):.2f} "
+                        f"and {entry.get('estimated_call_seconds_saved', 0.0):.0f} call-seconds saved")
+    logger.info(f"Saved run metrics to {metrics_file} "
+          f"({run_metrics['total']['calls']} LLM calls, ${run_metrics['total']['estimated_cost_usd']:.2f} estimated)")
+    if previous is not None:
+        logger.info(f"Incremental run reused {reused_decompositions} decomposed and "
+                    f"{reused_verifications} verified cases from the previous run")
+    if not args.verify_only:
+        logger.info(f"Saved {num_decompositions} decompositions from {num_items} items to {decomp_output_file}")
+    if args.decompose_only:
+        logger.info("Decomposition complete. Exiting.")
+        exit(0)
+    logger.info(f"Saved {num_verifications} verifications to {verif_output_file}")
+    logger.info(f"Saved final results to {output_file}")
+    logger.info("Pipeline complete!")
@@ -0,0 +1,226 @@
+"""
+Run instrumentation for the Decomposition Concordance Pipeline
+
+Records latency, token usage, retries and errors for every LLM call, and wall
+time for every pipeline stage. The collected numbers are written as a
+machine-readable ``run_metrics.json`` and, optionally, in the Prometheus text
+exposition format for the node_exporter textfile collector.
+"""
+
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .config import MODEL_PRICING
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile of ``values`` (q in [0, 100])."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost of a call, or None if the model has no pricing entry."""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    return (prompt_tokens * pricing['prompt'] + completion_tokens * pricing['completion']) / 1_000_000
+
+
+def _distribution(values: List[float]) -> Dict[str, Any]:
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': max(values) if values else None,
+    }
+
+
+class MetricsRecorder(object):
+    """
+    Thread-safe collector for per-call and per-stage measurements.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.calls = defaultdict(list)
+            self.retries = defaultdict(int)
+            self.stages = defaultdict(lambda: {'seconds': 0.0, 'runs': 0, 'items': 0})
+            self.timings = defaultdict(list)
+            self.hedges = defaultdict(lambda: {'sent': 0, 'won': 0})
+
+    def record_call(
+            self,
+            stage: Optional[str],
+            model: Optional[str],
+            latency: float,
+            usage: Optional[Dict[str, Any]] = None,
+            error: Optional[BaseException] = None,
+            first_token_latency: Optional[float] = None,
+    ) -> None:
+        usage = usage or {}
+        record = {
+            'model': model,
+            'latency': latency,
+            'first_token_latency': first_token_latency,
+            'prompt_tokens': usage.get('prompt_tokens', 0) or 0,
+            'completion_tokens': usage.get('completion_tokens', 0) or 0,
+            'error': type(error).__name__ if error is not None else None,
+        }
+        with self._lock:
+            self.calls[stage or 'unknown'].append(record)
+
+    def record_retry(self, stage: Optional[str]) -> None:
+        with self._lock:
+            self.retries[stage or 'unknown'] += 1
+
+    def record_hedge(self, stage: Optional[str], won: bool = False) -> None:
+        """Count a duplicate (hedged) request, or that one answered before the original."""
+        with self._lock:
+            self.hedges[stage or 'unknown']['won' if won else 'sent'] += 1
+
+    def record_timing(self, name: str, seconds: float) -> None:
+        """Record a latency that is not a single LLM call, e.g. time to a case's first claim."""
+        with self._lock:
+            self.timings[name].append(seconds)
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0):
+        """Time a pipeline stage; ``items`` is the number of inputs it handles."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name]['seconds'] += elapsed
+                self.stages[name]['runs'] += 1
+                self.stages[name]['items'] += items
+
+    def latencies(self, stage: str) -> List[float]:
+        with self._lock:
+            return [c['latency'] for c in self.calls.get(stage, []) if c['error'] is None]
+
+    def _summarize_calls(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = [r['latency'] for r in records if r['error'] is None]
+        errors = defaultdict(int)
+        for r in records:
+            if r['error'] is not None:
+                errors[r['error']] += 1
+        prompt_tokens = sum(r['prompt_tokens'] for r in records)
+        completion_tokens = sum(r['completion_tokens'] for r in records)
+        costs = [estimate_cost(r['model'], r['prompt_tokens'], r['completion_tokens']) for r in records]
+        first_token = [r['first_token_latency'] for r in records if r.get('first_token_latency') is not None]
+        summary = {
+            'calls': len(records),
+            'errors': sum(errors.values()),
+            'errors_by_type': dict(errors),
+            'latency_seconds': {
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies) if latencies else None,
+            },
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated_cost_usd': sum(c for c in costs if c is not None),
+            'unpriced_calls': sum(1 for c in costs if c is None),
+        }
+        if first_token:
+            # Streamed calls only
+            summary['time_to_first_token_seconds'] = _distribution(first_token)
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = {stage: list(records) for stage, records in self.calls.items()}
+            retries = dict(self.retries)
+            stages = {name: dict(values) for name, values in self.stages.items()}
+            started_at = self.started_at
+            timings = {name: list(values) for name, values in self.timings.items()}
+            hedges = {stage: dict(values) for stage, values in self.hedges.items()}
+        by_model = defaultdict(list)
+        for records in calls.values():
+            for r in records:
+                by_model[r['model']].append(r)
+        llm_calls = {}
+        for stage, records in calls.items():
+            llm_calls[stage] = self._summarize_calls(records)
+            llm_calls[stage]['retries'] = retries.get(stage, 0)
+            if stage in hedges:
+                llm_calls[stage]['hedges'] = hedges[stage]
+        for name, values in stages.items():
+            values['items_per_second'] = values['items'] / values['seconds'] if values['seconds'] > 0 else None
+        total = self._summarize_calls([r for records in calls.values() for r in records])
+        total['retries'] = sum(retries.values())
+        if hedges:
+            total['hedges'] = {key: sum(h[key] for h in hedges.values()) for key in ('sent', 'won')}
+        return {
+            'started_at': started_at,
+            'wall_seconds': time.time() - started_at,
+            'stages': stages,
+            'llm_calls': llm_calls,
+            'models': {str(model): self._summarize_calls(records) for model, records in by_model.items()},
+            'total': total,
+            'timings': {name: _distribution(values) for name, values in timings.items()},
+        }
+
+    def write_json(self, path: str) -> Dict[str, Any]:
+        summary = self.summary()
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the summary in Prometheus text format (textfile collector)."""
+        summary = self.summary()
+        lines = [
+            '# TYPE medscore_llm_calls_total counter',
+            '# TYPE medscore_llm_errors_total counter',
+            '# TYPE medscore_llm_retries_total counter',
+            '# TYPE medscore_llm_tokens_total counter',
+            '# TYPE medscore_llm_cost_usd_total counter',
+            '# TYPE medscore_llm_latency_seconds gauge',
+            '# TYPE medscore_llm_hedges_total counter',
+            '# TYPE medscore_stage_seconds_total counter',
+            '# TYPE medscore_stage_items_total counter',
+        ]
+        for stage, s in summary['llm_calls'].items():
+            label = f'stage="{stage}"'
+            lines.append(f'medscore_llm_calls_total{{{label}}} {s["calls"]}')
+            lines.append(f'medscore_llm_errors_total{{{label}}} {s["errors"]}')
+            lines.append(f'medscore_llm_retries_total{{{label}}} {s["retries"]}')
+            lines.append(f'medscore_llm_tokens_total{{{label},kind="prompt"}} {s["prompt_tokens"]}')
+            lines.append(f'medscore_llm_tokens_total{{{label},kind="completion"}} {s["completion_tokens"]}')
+            lines.append(f'medscore_llm_cost_usd_total{{{label}}} {s["estimated_cost_usd"]}')
+            if 'hedges' in s:
+                lines.append(f'medscore_llm_hedges_total{{{label},outcome="sent"}} {s["hedges"]["sent"]}')
+                lines.append(f'medscore_llm_hedges_total{{{label},outcome="won"}} {s["hedges"]["won"]}')
+            for q, quantile in (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')):
+                value = s['latency_seconds'][q]
+                if value is not None:
+                    lines.append(f'medscore_llm_latency_seconds{{{label},quantile="{quantile}"}} {value}')
+        for name, values in summary['stages'].items():
+            lines.append(f'medscore_stage_seconds_total{{stage="{name}"}} {values["seconds"]}')
+            lines.append(f'medscore_stage_items_total{{stage="{name}"}} {values["items"]}')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+# Shared recorder used by the API helpers and the pipeline stages
+METRICS = MetricsRecorder()
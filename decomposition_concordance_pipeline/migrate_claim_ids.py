@@ -0,0 +1,74 @@
+"""
+Migrate pipeline outputs to stable claim ids
+
+Outputs written before claim ids were derived from ``dav_id`` and
+``claim_id`` numbered claims with a running counter, which a chunked,
+sharded or resumed run could reuse. This rewrites ``decompositions.jsonl``
+and ``verifications.jsonl`` in each given directory so every record's ``id``
+is ``provenance.claim_uid(dav_id, claim_id)``. Both files carry ``dav_id``
+and ``claim_id``, so each record is converted on its own and joins between
+the files stay intact. Already migrated files are left unchanged.
+
+    python -m decomposition_concordance_pipeline.migrate_claim_ids test_results_gpt4.1 SAGE_Web_Interface_Standalone/data
+"""
+
+import os
+import logging
+import shutil
+from argparse import ArgumentParser
+from typing import Dict
+
+import jsonlines
+
+from .log_utils import configure_logging
+from .provenance import with_claim_uid
+
+logger = logging.getLogger(__name__)
+
+MIGRATED_FILES = ("decompositions.jsonl", "verifications.jsonl")
+
+
+def migrate_file(path: str, backup: bool = True) -> int:
+    """Rewrite one JSONL file with stable ids; returns the number of records whose id changed."""
+    changed = 0
+    tmp_path = path + ".tmp"
+    with jsonlines.open(path, 'r') as reader, jsonlines.open(tmp_path, 'w') as writer:
+        for record in reader:
+            old_id = record.get('id')
+            record = with_claim_uid(record)
+            changed += record.get('id') != old_id
+            writer.write(record)
+    if not changed:
+        os.remove(tmp_path)
+        return 0
+    if backup:
+        shutil.copy2(path, path + ".bak")
+    os.replace(tmp_path, path)
+    return changed
+
+
+def migrate_dir(output_dir: str, backup: bool = True) -> Dict[str, int]:
+    counts = {}
+    for filename in MIGRATED_FILES:
+        path = os.path.join(output_dir, filename)
+        if os.path.exists(path):
+            counts[filename] = migrate_file(path, backup)
+    return counts
+
+
+def parse_args():
+    parser = ArgumentParser(description="Rewrite pipeline outputs with stable claim ids")
+    parser.add_argument("output_dirs", nargs='+', help="Directories holding decompositions.jsonl / verifications.jsonl")
+    parser.add_argument("--no_backup", action="store_true", help="Do not keep the original files as *.jsonl.bak")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging()
+    for output_dir in args.output_dirs:
+        counts = migrate_dir(output_dir, backup=not args.no_backup)
+        if not counts:
+            logger.warning(f"No outputs to migrate in {output_dir}")
+        for filename, changed in counts.items():
+            logger.info(f"{os.path.join(output_dir, filename)}: {changed} ids updated")
@@ -0,0 +1,257 @@
+"""
+Offline mock of an OpenAI-compatible chat completion endpoint
+
+Answers decomposition, verification and concordance prompts with plausible
+JSON so the pipeline can be exercised and benchmarked without spending API
+quota. Latency, stalled requests, server errors, 429 rate limiting and non-JSON
+answers (per model, to exercise routing escalations) are configurable.
+``stream_piece_ms`` simulates generation time: the completion is produced in
+pieces of ``stream_piece_chars`` characters, each taking that long. Requests
+with ``"stream": true`` receive the pieces as server-sent events as they are
+produced; other requests get the whole completion once the last is done.
+
+    python -m decomposition_concordance_pipeline.mock_server --port 8089 --latency_ms 200 --rate_limit_rate 0.02
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+VERDICTS = ['Supported', 'Not Supported', 'Not Addressed']
+VERDICT_WEIGHTS = [0.6, 0.15, 0.25]
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 50.0
+    # Per-model mean latency overriding latency_ms, e.g. a faster small model
+    model_latency_ms: Optional[Dict[str, float]] = None
+    jitter_ms: float = 25.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+    # Fraction of requests that stall for slow_ms instead (stragglers, for hedging)
+    slow_rate: float = 0.0
+    slow_ms: float = 5000.0
+    # Fraction of completions answered with prose instead of JSON, optionally only for some models
+    malformed_rate: float = 0.0
+    malformed_models: Tuple[str, ...] = ()
+    # Simulated generation time per piece of the completion, and characters per piece
+    stream_piece_ms: float = 0.0
+    stream_piece_chars: int = 16
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _stable_choice(text: str) -> str:
+    # Hash the claim so repeated runs produce the same verdicts
+    rng = random.Random(zlib.crc32(text.encode('utf-8')))
+    return rng.choices(VERDICTS, weights=VERDICT_WEIGHTS)[0]
+
+
+def _extract_claims(prompt: str) -> List[str]:
+    # The verifier prompt ends with "'claims': <json list>\n}"
+    tail = prompt.rsplit("'claims':", 1)[1]
+    tail = tail[:tail.rfind(']') + 1]
+    try:
+        claims = json.loads(tail)
+    except ValueError:
+        return []
+    return claims if isinstance(claims, list) else []
+
+
+def mock_completion_content(messages: List[Dict[str, str]]) -> str:
+    """Build a plausible completion for the pipeline prompt in ``messages``."""
+    prompt = messages[-1].get('content', '')
+    system = messages[0].get('content', '') if len(messages) > 1 else ''
+    if "'claims':" in prompt:
+        claims = _extract_claims(prompt)
+        verdicts = []
+        for claim in claims:
+            verdict = _stable_choice(str(claim))
+            verdicts.append({'verdict': verdict, 'reason': f'Mock verdict: the reference is treated as {verdict.lower()}.'})
+        return json.dumps(verdicts)
+    if 'Answer A:' in prompt and 'Answer B:' in prompt:
+        concordant = int(_stable_choice(prompt) != 'Not Supported')
+        return json.dumps({
+            'concordant': concordant,
+            'helpful': concordant,
+            'explanation': 'Mock explanation comparing the human answer with the AI output.'
+        })
+    if 'atomic claims' in system:
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', prompt) if s.strip()]
+        return json.dumps({'claims': sentences})
+    return json.dumps({'text': 'Mock response.'})
+
+
+MALFORMED_CONTENT = "I am not able to give a structured answer to this request."
+
+
+def mock_completion(payload: Dict[str, Any], malformed: bool = False) -> Dict[str, Any]:
+    messages = payload.get('messages', [])
+    content = MALFORMED_CONTENT if malformed else mock_completion_content(messages)
+    n = int(payload.get('n', 1) or 1)
+    prompt_tokens = sum(_approx_tokens(m.get('content', '')) for m in messages)
+    return {
+        'id': f'mock-{time.time_ns()}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': payload.get('model', 'mock'),
+        'choices': [
+            {'index': i, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}
+            for i in range(n)
+        ],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': _approx_tokens(content) * n,
+            'total_tokens': prompt_tokens + _approx_tokens(content) * n,
+        },
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'MockLLM/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        config = self.server.config
+        rng = self.server.rng
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+        with self.server.rng_lock:
+            roll_limit = rng.random()
+            roll_error = rng.random()
+            roll_malformed = rng.random()
+            latency_ms = (config.model_latency_ms or {}).get(payload.get('model'), config.latency_ms)
+            delay = max(0.0, latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0
+            if rng.random() < config.slow_rate:
+                delay = config.slow_ms / 1000.0
+        if roll_limit < config.rate_limit_rate:
+            self._send_json(429, {'error': {'message': 'Rate limit exceeded'}}, {'Retry-After': str(config.retry_after)})
+            return
+        time.sleep(delay)
+        if roll_error < config.error_rate:
+            self._send_json(500, {'error': {'message': 'Mock server error'}})
+            return
+        malformed = roll_malformed < config.malformed_rate and (
+            not config.malformed_models or payload.get('model') in config.malformed_models)
+        if payload.get('stream'):
+            self._send_stream(payload, malformed)
+            return
+        completion = mock_completion(payload, malformed)
+        if config.stream_piece_ms > 0:
+            pieces = -(-len(completion['choices'][0]['message']['content']) // max(1, config.stream_piece_chars))
+            time.sleep(pieces * config.stream_piece_ms / 1000.0)
+        self._send_json(200, completion)
+
+    def _send_stream(self, payload: Dict[str, Any], malformed: bool = False):
+        config = self.server.config
+        completion = mock_completion(payload, malformed)
+        content = completion['choices'][0]['message']['content']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        step = max(1, config.stream_piece_chars)
+        for i in range(0, len(content), step):
+            time.sleep(config.stream_piece_ms / 1000.0)
+            chunk = {
+                'id': completion['id'],
+                'object': 'chat.completion.chunk',
+                'model': completion['model'],
+                'choices': [{'index': 0, 'delta': {'content': content[i:i + step]}, 'finish_reason': None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        final = {'id': completion['id'], 'object': 'chat.completion.chunk', 'model': completion['model'],
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': completion['usage']}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+def start_mock_server(host: str = '127.0.0.1', port: int = 0, config: Optional[MockConfig] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the mock server on a daemon thread.
+
+    Returns the server (call ``shutdown()`` to stop it) and its chat completion URL.
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.config = config or MockConfig()
+    server.rng = random.Random(server.config.seed)
+    server.rng_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://{server.server_address[0]}:{server.server_address[1]}/chat/completions'
+    return server, url
+
+
+def parse_args():
+    parser = ArgumentParser(description="Mock OpenAI-compatible chat completion server")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on")
+    parser.add_argument("--latency_ms", type=float, default=50.0, help="Mean response latency in milliseconds")
+    parser.add_argument("--model_latency_ms", type=str, nargs='*', default=[],
+                        help="Per-model mean latency as model=milliseconds")
+    parser.add_argument("--jitter_ms", type=float, default=25.0, help="Uniform latency jitter in milliseconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--slow_rate", type=float, default=0.0, help="Fraction of requests that stall for --slow_ms")
+    parser.add_argument("--slow_ms", type=float, default=5000.0, help="Latency of stalled requests in milliseconds")
+    parser.add_argument("--malformed_rate", type=float, default=0.0, help="Fraction of completions that are not JSON")
+    parser.add_argument("--malformed_models", type=str, nargs='*', default=[],
+                        help="Only these models give malformed completions (default: all)")
+    parser.add_argument("--stream_piece_ms", type=float, default=0.0,
+                        help="Simulated generation time per 16-character piece of a completion")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for latency and error injection")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        model_latency_ms={model: float(ms) for model, _, ms in (v.partition('=') for v in args.model_latency_ms)},
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        stream_piece_ms=args.stream_piece_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        malformed_rate=args.malformed_rate,
+        malformed_models=tuple(args.malformed_models),
+    )
+    server, url = start_mock_server(args.host, args.port, config)
+    print(f"Mock LLM server listening at {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,96 @@
+"""
+Provenance tags for incremental runs
+
+Every stored decomposition and verification carries a ``provenance`` dict with
+hashes of what produced it: the prompt file, the model and the input text
+(the AI answer for decompositions; the reference and the case's claims for
+verifications). ``PreviousRun`` loads the outputs of an earlier run so an
+``--incremental`` run can reuse every case whose provenance is unchanged and
+send only the rest to the LLM.
+
+Claim ids are ``claim_uid(dav_id, claim_id)``, so they do not depend on the
+order, chunking or sharding of the run that produced them. Outputs written
+with the older running-counter ids are converted by ``migrate_claim_ids.py``,
+and are converted on the fly when loaded as a previous run.
+"""
+
+import os
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import jsonlines
+
+logger = logging.getLogger(__name__)
+
+
+def hash_text(text: Optional[str]) -> str:
+    """Short, stable content hash"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()[:16]
+
+
+def hash_json(value: Any) -> str:
+    return hash_text(json.dumps(value, sort_keys=True, ensure_ascii=False))
+
+
+def claim_uid(dav_id: Any, claim_id: Optional[int]) -> str:
+    """
+    Stable id of a claim: ``<dav_id>:<claim_id>``, where claim_id is the
+    claim's position in its case's decomposition. The placeholder record of
+    a case without claims is ``<dav_id>:none``.
+    """
+    return f"{dav_id}:{'none' if claim_id is None else claim_id}"
+
+
+def with_claim_uid(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a decomposition or verification record's id with its claim_uid"""
+    if 'dav_id' in record and 'id' in record:
+        record['id'] = claim_uid(record['dav_id'], record.get('claim_id'))
+    return record
+
+
+def _read_grouped(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    grouped = defaultdict(list)
+    if not os.path.exists(path):
+        return grouped
+    with jsonlines.open(path, 'r') as reader:
+        for record in reader:
+            grouped[record.get('dav_id')].append(with_claim_uid(record))
+    return grouped
+
+
+class PreviousRun(object):
+    """
+    Outputs of an earlier run in ``output_dir``, grouped by case.
+
+    Must be loaded before the new run opens (and truncates) the output files.
+    A case is reused only if every stored record of the stage has exactly the
+    provenance the current run would produce.
+    """
+    def __init__(self, output_dir: str, load_decompositions: bool = True):
+        self.decompositions = (_read_grouped(os.path.join(output_dir, "decompositions.jsonl"))
+                               if load_decompositions else {})
+        self.verifications = _read_grouped(os.path.join(output_dir, "verifications.jsonl"))
+        self.final_output = {entry.get('dav_id'): entry
+                             for entries in _read_grouped(os.path.join(output_dir, "final_output.jsonl")).values()
+                             for entry in entries}
+        logger.info(f"Loaded previous run from {output_dir}: {len(self.decompositions)} decomposed cases, "
+                    f"{len(self.verifications)} verified cases")
+
+    @staticmethod
+    def _matches(records: List[Dict[str, Any]], provenance: Dict[str, str]) -> bool:
+        return bool(records) and all(r.get('provenance') == provenance for r in records)
+
+    def decompositions_for(self, dav_id: str, provenance: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+        records = self.decompositions.get(dav_id, [])
+        return records if self._matches(records, provenance) else None
+
+    def verifications_for(self, dav_id: str,
+                          provenance: Dict[str, str]) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """Stored verification records and final-output entry of a case, if still valid"""
+        records = self.verifications.get(dav_id, [])
+        if not self._matches(records, provenance) or dav_id not in self.final_output:
+            return None
+        return records, self.final_output[dav_id]
@@ -0,0 +1,142 @@
+"""
+Cost- and latency-aware model routing
+
+Sends the easy work to a cheaper, faster model and keeps the large model for
+the rest. Answers up to ``max_answer_chars`` characters are decomposed by the
+small model and longer ones go straight to the large model. Every verifier
+claim chunk goes to the small model first. Work the small model gets wrong
+is escalated to the large model: a decomposition or verification it could
+not format as the requested JSON, or (with self-consistency sampling) a
+chunk where some claim's vote confidence is below ``min_confidence``.
+
+Routed calls are recorded in METRICS under ``<stage>/small`` and
+``<stage>/large``. ``ModelRouter.report`` turns those into per-route counts
+and an estimate of the cost and latency saved against sending everything to
+the large model. If the run made no large-model calls to time, the large
+model's latency comes from a ``dry_run.LatencyModel`` (an earlier run's
+run_metrics.json, or the token-rate model).
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dry_run import LatencyModel
+from .metrics import estimate_cost
+
+SMALL = 'small'
+LARGE = 'large'
+
+
+class ModelRoute(object):
+    """A model and (optionally) its endpoint; API_CONFIG's url is used without one."""
+    def __init__(self, name: str, model: str, url: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.url = url
+
+    def query_kwargs(self) -> Dict[str, Any]:
+        return {'model': self.model, 'url': self.url}
+
+
+class ModelRouter(object):
+    """
+    Routing policy for one pipeline stage pair, plus thread-safe counts of
+    where each item went. One router is shared by the decomposer and the
+    verifier; each passes its own large model.
+    """
+    def __init__(self, small_model: str, small_url: Optional[str] = None, max_answer_chars: int = 1500,
+                 min_confidence: float = 0.8):
+        self.small = ModelRoute(SMALL, small_model, small_url)
+        self.max_answer_chars = max_answer_chars
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.counts = defaultdict(lambda: {SMALL: 0, LARGE: 0, 'escalated': 0})
+        # Large model of each stage, for pricing the calls the small model took over
+        self.large_models = {}
+
+    def register(self, stage: str, large_model: str) -> None:
+        self.large_models[stage] = large_model
+
+    def describe(self, large_model: str) -> str:
+        """Stands in for the model name in provenance: routed results depend on the whole policy"""
+        return (f"route({self.small.model}->{large_model},chars<={self.max_answer_chars},"
+                f"confidence>={self.min_confidence})")
+
+    def decomposition_route(self, ai_answer: str, large: ModelRoute) -> ModelRoute:
+        return self.small if len(ai_answer or '') <= self.max_answer_chars else large
+
+    def needs_escalation(self, verdicts: Optional[List[Dict[str, Any]]]) -> bool:
+        """A small-model verifier result is escalated if unparsed or not confident enough"""
+        if not verdicts:
+            return True
+        return any(v.get('confidence') is not None and v['confidence'] < self.min_confidence for v in verdicts)
+
+    def record(self, stage: str, route: ModelRoute, escalated: bool = False) -> None:
+        """Count one item (a case or a claim chunk) finished on ``route``"""
+        with self._lock:
+            self.counts[stage][route.name] += 1
+            if escalated:
+                self.counts[stage]['escalated'] += 1
+
+    def report(self, metrics_summary: Dict[str, Any], latency: Optional[LatencyModel] = None) -> Dict[str, Any]:
+        """
+        Per-stage route counts and the estimated savings against an all-large
+        run. Small-model calls of escalated items are charged as waste; the
+        rest are priced and timed as if the large model had handled them,
+        using the large model's observed mean latency, or ``latency``'s
+        estimate for it when this run has none. ``large_latency_source``
+        says which was used.
+        """
+        latency = latency or LatencyModel()
+        calls = metrics_summary['llm_calls']
+        with self._lock:
+            counts = {stage: dict(values) for stage, values in self.counts.items()}
+        report = {}
+        for stage, stage_counts in counts.items():
+            small_calls = calls.get(f"{stage}/{SMALL}", {})
+            large_calls = calls.get(f"{stage}/{LARGE}", {})
+            small_items = stage_counts[SMALL] + stage_counts['escalated']
+            # Share of small-model work that was kept rather than escalated
+            kept = stage_counts[SMALL] / small_items if small_items else 0.0
+            entry = {
+                'items': stage_counts,
+                'small_model_share': stage_counts[SMALL] / max(1, stage_counts[SMALL] + stage_counts[LARGE]),
+                'small_calls': small_calls.get('calls', 0),
+                'large_calls': large_calls.get('calls', 0),
+                'actual_cost_usd': small_calls.get('estimated_cost_usd', 0.0) + large_calls.get('estimated_cost_usd', 0.0),
+            }
+            as_large = estimate_cost(self.large_models.get(stage), int(small_calls.get('prompt_tokens', 0) * kept),
+                                     int(small_calls.get('completion_tokens', 0) * kept))
+            if as_large is not None:
+                entry['estimated_cost_saved_usd'] = as_large - small_calls.get('estimated_cost_usd', 0.0)
+            small_latency = (small_calls.get('latency_seconds') or {}).get('mean')
+            large_latency, source = self._large_latency(stage, large_calls, small_calls, latency)
+            if small_latency is None:
+                entry['estimated_call_seconds_saved'] = 0.0
+                entry['large_latency_source'] = 'not needed: no small-model calls were timed'
+            else:
+                kept_calls = small_calls['calls'] * kept
+                wasted_calls = small_calls['calls'] - kept_calls
+                entry['estimated_call_seconds_saved'] = (kept_calls * (large_latency - small_latency)
+                                                         - wasted_calls * small_latency)
+                entry['large_latency_seconds'] = large_latency
+                entry['large_latency_source'] = source
+            report[stage] = entry
+        return report
+
+    @staticmethod
+    def _large_latency(stage: str, large_calls: Dict[str, Any], small_calls: Dict[str, Any],
+                       latency: LatencyModel) -> Tuple[float, str]:
+        """Mean large-model call latency for ``stage`` and where it came from"""
+        observed = (large_calls.get('latency_seconds') or {}).get('mean')
+        if observed is not None:
+            return observed, 'observed'
+        # An earlier routed run times large calls under <stage>/large, an unrouted one under <stage>
+        for key in (f"{stage}/{LARGE}", stage):
+            if key in latency.observed:
+                return latency.observed[key], f"earlier run ({key})"
+        # Same completions as the small model produced, at the token-rate model's speed
+        completion = small_calls.get('completion_tokens', 0) / max(1, small_calls.get('calls', 0))
+        return latency(stage, int(completion)), 'token-rate model (no large-model calls timed)'
+
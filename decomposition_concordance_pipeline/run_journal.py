@@ -0,0 +1,57 @@
+"""
+Run journal for the Decomposition Concordance Pipeline
+
+medscore.py appends one JSON line per event to ``run_journal.jsonl`` in the
+output directory: a ``start`` event with the cohort size, a ``chunk`` event
+after each chunk's results are written, and an ``end`` event. Each line is
+flushed as it is written, so the review app can tail the journal by byte
+offset to report progress while a run is still going.
+"""
+
+import json
+import os
+import time
+from typing import Any, Iterable, Optional
+
+JOURNAL_FILE = "run_journal.jsonl"
+
+
+class RunJournal(object):
+    """
+    Appends progress events for one pipeline run.
+    """
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, JOURNAL_FILE)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self.cases_done = 0
+
+    def write(self, event: str, **fields: Any) -> None:
+        entry = {'event': event, 'ts': time.time()}
+        entry.update(fields)
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def start(self, total_cases: Optional[int] = None, **fields: Any) -> None:
+        self.write('start', total_cases=total_cases, **fields)
+
+    def chunk(self, dav_ids: Iterable[str], **fields: Any) -> None:
+        dav_ids = list(dav_ids)
+        self.cases_done += len(dav_ids)
+        self.write('chunk', cases_done=self.cases_done, dav_ids=dav_ids, **fields)
+
+    def end(self, status: str = 'finished', error: Optional[str] = None) -> None:
+        self.write('end', status=status, cases_done=self.cases_done, error=error)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.end()
+        else:
+            self.end(status='failed', error=f"{exc_type.__name__}: {exc}")
+        self.close()
+        return False
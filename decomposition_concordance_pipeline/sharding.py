@@ -0,0 +1,182 @@
+"""
+Sharded execution of MedScore runs
+
+A cohort is split deterministically by a hash of ``dav_id`` into N shards.
+Each shard is an ordinary ``medscore.py`` run with ``--num_shards N
+--shard_index i``, which can be a separate process or machine; it reads the
+whole CSV but keeps only its own cases, and writes to
+``<output_dir>/shard-<i>-of-<N>/``. ``merge`` then combines the shard outputs
+into the standard ``decompositions.jsonl``, ``verifications.jsonl`` and
+``final_output.jsonl`` in ``output_dir``. Claim ids are derived from
+``dav_id`` and ``claim_id`` (see provenance.claim_uid), so they are already
+unique across shards.
+
+Run all shards as local processes and merge:
+
+    python -m decomposition_concordance_pipeline.sharding run --num_shards 4 -- \\
+        --input_file data.csv --output_dir results --api_key KEY
+
+Merge shards that ran elsewhere (their directories copied under ``results``):
+
+    python -m decomposition_concordance_pipeline.sharding merge --output_dir results --num_shards 4 \\
+        --input_file data.csv
+"""
+
+import os
+import sys
+import json
+import heapq
+import logging
+import subprocess
+import zlib
+from argparse import ArgumentParser
+from itertools import chain, groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import jsonlines
+import pandas as pd
+
+from .log_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FILES = ("decompositions.jsonl", "verifications.jsonl", "final_output.jsonl")
+
+
+def shard_of(dav_id: Any, num_shards: int) -> int:
+    """Shard of a case; crc32 is stable across processes and machines, unlike hash()"""
+    return zlib.crc32(str(dav_id).encode('utf-8')) % num_shards
+
+
+def select_shard(items: Iterable[Dict[str, Any]], shard_index: int, num_shards: int,
+                 key: str = "id") -> Iterator[Dict[str, Any]]:
+    return (item for item in items if shard_of(item[key], num_shards) == shard_index)
+
+
+def shard_dir(output_dir: str, shard_index: int, num_shards: int) -> str:
+    return os.path.join(output_dir, f"shard-{shard_index:03d}-of-{num_shards:03d}")
+
+
+def _iter_cases(path: str) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """(dav_id, records) per case of a shard output file; each case's records are contiguous"""
+    if not os.path.exists(path):
+        return
+    with jsonlines.open(path, 'r') as reader:
+        for dav_id, records in groupby(reader.iter(), key=lambda r: r.get('dav_id')):
+            yield dav_id, list(records)
+
+
+def _tagged_cases(shard: int, path: str) -> Iterator[Tuple[int, str, List[Dict[str, Any]]]]:
+    for dav_id, records in _iter_cases(path):
+        yield shard, dav_id, records
+
+
+def _input_order(input_file: str, chunksize: int = 100000) -> Dict[str, int]:
+    """Row position of every dav_id in the input CSV"""
+    from .medscore import CSV_ENCODING
+    order = {}
+    for chunk in pd.read_csv(input_file, encoding=CSV_ENCODING, usecols=["dav_id"], dtype=str, chunksize=chunksize):
+        for dav_id in chunk["dav_id"].fillna("nan"):
+            order.setdefault(dav_id, len(order))
+    return order
+
+
+def _merged_cases(dirs: List[str], filename: str,
+                  order: Optional[Dict[str, int]]) -> Iterator[Tuple[int, str, List[Dict[str, Any]]]]:
+    """
+    (shard, dav_id, records) across all shards. With the input order, the shard
+    streams (each already in input order) are merged into it; otherwise the
+    shards are concatenated.
+    """
+    streams = [_tagged_cases(shard, os.path.join(d, filename)) for shard, d in enumerate(dirs)]
+    if order is None:
+        return chain.from_iterable(streams)
+    return heapq.merge(*streams, key=lambda case: order.get(case[1], len(order)))
+
+
+def merge_shards(output_dir: str, num_shards: int, input_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Combine the shard outputs under ``output_dir`` into the standard output
+    files there. Returns a summary of the merge.
+    """
+    dirs = [shard_dir(output_dir, i, num_shards) for i in range(num_shards)]
+    missing = [d for d in dirs if not os.path.isdir(d)]
+    if missing:
+        raise FileNotFoundError(f"Missing shard directories: {missing}")
+    order = _input_order(input_file) if input_file else None
+    counts = {filename: 0 for filename in OUTPUT_FILES}
+    for filename in OUTPUT_FILES:
+        with jsonlines.open(os.path.join(output_dir, filename), 'w') as writer:
+            for _, _, records in _merged_cases(dirs, filename, order):
+                writer.write_all(records)
+                counts[filename] += len(records)
+    shards = []
+    for shard, d in enumerate(dirs):
+        metrics_path = os.path.join(d, "run_metrics.json")
+        entry = {'shard': shard, 'dir': d}
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                total = json.load(f)['total']
+            entry.update(llm_calls=total['calls'], llm_errors=total['errors'],
+                         estimated_cost_usd=total['estimated_cost_usd'])
+        shards.append(entry)
+    summary = {
+        'num_shards': num_shards,
+        'records': counts,
+        'llm_calls': sum(s.get('llm_calls', 0) for s in shards),
+        'estimated_cost_usd': sum(s.get('estimated_cost_usd', 0.0) for s in shards),
+        'shards': shards,
+    }
+    with open(os.path.join(output_dir, "merge_summary.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Merged {num_shards} shards into {output_dir}: " +
+                ", ".join(f"{count} lines in {name}" for name, count in counts.items()))
+    return summary
+
+
+def run_shards(num_shards: int, medscore_args: List[str], input_file: Optional[str], output_dir: str) -> int:
+    """Run every shard as a local medscore.py process, then merge if all succeeded"""
+    processes = []
+    for shard_index in range(num_shards):
+        command = [sys.executable, "-m", "decomposition_concordance_pipeline.medscore", *medscore_args,
+                   "--num_shards", str(num_shards), "--shard_index", str(shard_index)]
+        processes.append(subprocess.Popen(command))
+    failed = [i for i, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        logger.error(f"Shards {failed} failed; not merging")
+        return 1
+    merge_shards(output_dir, num_shards, input_file)
+    return 0
+
+
+def parse_args():
+    parser = ArgumentParser(description="Run or merge a sharded MedScore run")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Run all shards as local processes, then merge")
+    run.add_argument("--num_shards", type=int, required=True, help="Number of shards (processes)")
+    run.add_argument("medscore_args", nargs='*', help="Arguments for medscore.py, after --")
+    merge = subparsers.add_parser("merge", help="Merge finished shard outputs")
+    merge.add_argument("--output_dir", required=True, type=str, help="Output directory holding the shard directories")
+    merge.add_argument("--num_shards", type=int, required=True, help="Number of shards")
+    merge.add_argument("--input_file", type=str, default=None, help="Input CSV; restores its case order in the merged files")
+    for sub in (run, merge):
+        sub.add_argument("--log_level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    args = parser.parse_args()
+    if args.num_shards < 2:
+        # medscore.py writes a single shard straight into --output_dir, with nothing to merge
+        parser.error("--num_shards must be at least 2; run medscore.py directly for an unsharded run")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(args.log_level)
+    if args.command == "merge":
+        merge_shards(args.output_dir, args.num_shards, args.input_file)
+    else:
+        # Read the paths the shards write to from the medscore.py arguments
+        path_parser = ArgumentParser(add_help=False)
+        path_parser.add_argument("--input_file", type=str)
+        path_parser.add_argument("--output_dir", type=str, default="./results")
+        paths, _ = path_parser.parse_known_args(args.medscore_args)
+        sys.exit(run_shards(args.num_shards, args.medscore_args, paths.input_file, paths.output_dir))
@@ -0,0 +1,291 @@
+"""
+Structured-output parsing for LLM responses
+
+One parser for the JSON the decomposer, the verifier and the concordance
+checker ask for. ``parse_json`` strips code fences and surrounding prose,
+decodes with orjson when it is installed, and recovers a truncated response
+(cut off by ``max_tokens`` or a dropped stream) by closing it after the last
+complete element instead of re-requesting. The result is then checked
+against a small JSON Schema; the same schemas describe the expected output
+when a provider's JSON mode is requested. ``IncrementalClaimParser`` yields
+decomposition claims one by one while a streamed response is still arriving.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+try:
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+except ImportError:
+    import json
+
+    def _loads(text: str) -> Any:
+        return json.loads(text)
+
+VERDICTS = ('Supported', 'Not Supported', 'Not Addressed')
+
+DECOMPOSITION_SCHEMA = {
+    'type': 'object',
+    'properties': {'claims': {'type': 'array', 'items': {'type': 'string'}}},
+    'required': ['claims'],
+}
+
+VERDICT_SCHEMA = {
+    'type': 'object',
+    'properties': {'verdict': {'type': 'string', 'enum': list(VERDICTS)}, 'reason': {'type': 'string'}},
+    'required': ['verdict'],
+}
+
+CONCORDANCE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'concordant': {'type': 'integer', 'enum': [0, 1]},
+        'helpful': {'type': 'integer', 'enum': [0, 1]},
+        'explanation': {'type': 'string'},
+    },
+    'required': ['concordant'],
+}
+
+_CLOSERS = {'{': '}', '[': ']'}
+# Candidate cut points tried when recovering a truncated response
+MAX_REPAIR_ATTEMPTS = 8
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'number': (int, float),
+    'integer': int,
+}
+
+
+class StructuredOutputError(ValueError):
+    """The response could not be turned into the expected structure."""
+
+
+def strip_code_fences(text: str) -> str:
+    if text.lstrip().startswith("```"):
+        return "\n".join(line for line in text.splitlines() if not line.strip().startswith("```"))
+    return text
+
+
+def repair_truncated_json(text: str) -> List[str]:
+    """
+    Candidate completions of a truncated JSON document, most complete first.
+
+    Scans ``text`` (which starts at ``{`` or ``[``) tracking open brackets and
+    strings, and records each point where an element may have just finished:
+    before a comma, after a closing bracket and after a closing quote. Each
+    candidate is the text up to such a point with the open brackets closed.
+    """
+    stack = []
+    in_string = escaped = False
+    cuts = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                # A value string completes an element; a key string does not, which loads() will reject
+                cuts.append((i + 1, list(stack)))
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            cuts.append((i + 1, list(stack)))
+            if not stack:
+                break
+        elif char == ',' and stack:
+            cuts.append((i, list(stack)))
+    return [text[:end] + ''.join(reversed(open_brackets)) for end, open_brackets in reversed(cuts)]
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """
+    Decode the JSON value in an LLM response.
+
+    Returns:
+        Tuple of (value, repaired), where repaired is True if the response was
+        truncated and had to be closed after its last complete element
+
+    Raises:
+        StructuredOutputError: if no JSON value can be recovered
+    """
+    text = strip_code_fences(text or '').strip()
+    try:
+        return _loads(text), False
+    except ValueError:
+        pass
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        raise StructuredOutputError("No JSON object or array in response")
+    body = text[min(starts):]
+    closer = '}' if body[0] == '{' else ']'
+    end = body.rfind(closer)
+    if end >= 0:
+        try:
+            return _loads(body[:end + 1]), False
+        except ValueError:
+            pass
+    for repaired in repair_truncated_json(body)[:MAX_REPAIR_ATTEMPTS]:
+        try:
+            return _loads(repaired), True
+        except ValueError:
+            continue
+    raise StructuredOutputError("Response is not valid JSON and could not be repaired")
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = '$') -> None:
+    """
+    Check ``value`` against the subset of JSON Schema used here: type,
+    properties, required, items and enum.
+
+    Raises:
+        StructuredOutputError: naming the first offending path
+    """
+    expected = schema.get('type')
+    if expected is not None:
+        python_type = _TYPES[expected]
+        if not isinstance(value, python_type) or (expected in ('integer', 'number') and isinstance(value, bool)):
+            raise StructuredOutputError(f"{path}: expected {expected}, got {type(value).__name__}")
+    if 'enum' in schema and value not in schema['enum']:
+        raise StructuredOutputError(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get('required', []):
+            if key not in value:
+                raise StructuredOutputError(f"{path}: missing required key {key!r}")
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    if isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            validate(item, schema['items'], f"{path}[{i}]")
+
+
+def parse_claims(text: str) -> Tuple[List[str], bool]:
+    """Claims from a decomposition response ({"claims": [...]} or a bare list)."""
+    value, repaired = parse_json(text)
+    if isinstance(value, list):
+        value = {'claims': value}
+    validate(value, DECOMPOSITION_SCHEMA)
+    return value['claims'], repaired
+
+
+class IncrementalClaimParser(object):
+    """
+    Pulls claims out of a decomposition response while it is still streaming.
+
+    ``feed`` takes the next piece of text and returns the claims whose string
+    closed in it. Only string elements of the first JSON array are claims,
+    which covers both {"claims": [...]} and a bare list. The full response
+    should still go through ``parse_claims`` once the stream ends.
+    """
+    def __init__(self):
+        self.text = ''
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._array_depth = None
+        self._claim_start = None
+
+    def feed(self, chunk: str) -> List[str]:
+        self.text += chunk
+        claims = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._claim_start is not None:
+                        try:
+                            claim = _loads(text[self._claim_start:i + 1])
+                        except ValueError:
+                            claim = None
+                        if isinstance(claim, str):
+                            claims.append(claim)
+                        self._claim_start = None
+                continue
+            if char == '"':
+                self._in_string = True
+                if self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._claim_start = i
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+                if char == '[' and self._array_depth is None:
+                    self._array_depth = len(self._stack)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if self._array_depth is not None and len(self._stack) < self._array_depth:
+                    self.done = True
+        self._pos = len(text)
+        return claims
+
+
+def _normalize_verdict(verdict: Dict[str, Any]) -> Dict[str, Any]:
+    label = verdict.get('verdict')
+    if isinstance(label, str):
+        for known in VERDICTS:
+            if label.strip().lower() == known.lower():
+                return dict(verdict, verdict=known)
+    return verdict
+
+
+def parse_verdicts(text: str, num_claims: int) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    One verdict per claim from a verification response. A single verdict
+    object applies to every claim; verdict labels are matched case-insensitively.
+    """
+    value, repaired = parse_json(text)
+    if isinstance(value, dict):
+        value = [value for _ in range(num_claims)]
+    validate(value, {'type': 'array'})
+    if len(value) != num_claims:
+        raise StructuredOutputError(f"Output JSON has {len(value)} verdicts for {num_claims} claims")
+    verdicts = [_normalize_verdict(v) if isinstance(v, dict) else v for v in value]
+    validate(verdicts, {'type': 'array', 'items': VERDICT_SCHEMA})
+    return verdicts, repaired
+
+
+def parse_concordance(text: str) -> Tuple[Dict[str, Any], bool]:
+    """Concordance judgement; the prompt asks for "helpful", older outputs used "helpfulness"."""
+    value, repaired = parse_json(text)
+    if isinstance(value, dict) and 'helpful' not in value and 'helpfulness' in value:
+        value = dict(value, helpful=value['helpfulness'])
+    if isinstance(value, dict):
+        # Accept "1"/"0" and true/false for the binary fields
+        for key in ('concordant', 'helpful'):
+            if isinstance(value.get(key), (str, bool)) and str(value[key]).strip().lower() in ('0', '1', 'true', 'false'):
+                value[key] = 1 if str(value[key]).strip().lower() in ('1', 'true') else 0
+    validate(value, CONCORDANCE_SCHEMA)
+    return value, repaired
+
+
+def json_mode_options(provider: str) -> Dict[str, Any]:
+    """
+    Extra request fields asking ``provider`` for JSON-only output, for prompts
+    whose answer is a JSON object. Empty for providers without a JSON mode.
+    """
+    if provider in ('stanford', 'openai'):
+        return {'response_format': {'type': 'json_object'}}
+    if provider == 'gemini':
+        return {'generationConfig': {'responseMimeType': 'application/json'}}
+    return {}
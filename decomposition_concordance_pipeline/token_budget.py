@@ -0,0 +1,250 @@
+"""
+Pre-flight token budgeting for LLM prompts
+
+Prompts are counted locally before they are sent, with tiktoken when it is
+installed and an estimate of ``CHARS_PER_TOKEN`` characters per token
+otherwise. tiktoken downloads its encoding files on first use. If that fails
+(e.g. offline), the estimate is used too, and the report says so. The limit for one prompt comes from ``API_CONFIG``. It is the
+model's context window minus the completion's ``max_tokens``, capped by the
+provider's ``max_prompt_tokens`` budget. ``MODEL_CONTEXT_WINDOWS`` overrides
+the provider's context window for known models.
+
+A prompt over the limit is made to fit instead of being sent to fail:
+- The verifier splits an oversized reference at paragraph and sentence
+  boundaries (``split_text``) and verifies the claims against every piece.
+- The concordance prompt has to show both answers whole, so its longest
+  field is shortened to its beginning and end (``shorten_text``).
+
+A budget built with ``enforce=False`` only measures: prompts are sent whole
+and the ones over the limit are counted. medscore enforces the limit only
+when ``--max_prompt_tokens`` is given, since splitting changes verdicts.
+
+``TokenBudget`` also records the size of every prompt. ``report`` gives the
+cohort's token distribution per stage and counts how many prompts were split,
+shortened or still over the limit. The first prompt of a stage that is split,
+shortened or over the limit is logged as a warning.
+"""
+
+import re
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import API_CONFIG, MODEL_CONTEXT_WINDOWS
+from .metrics import _distribution, estimate_cost
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+# Estimate used without tiktoken; English clinical text averages about 4 characters per token
+CHARS_PER_TOKEN = 4
+# Cases with the largest prompts listed in the report
+REPORT_LARGEST = 10
+
+_PARAGRAPH = re.compile(r'\n\s*\n')
+_SENTENCE = re.compile(r'(?<=[.!?])\s+')
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    """tiktoken encoding for ``model``, or None if tiktoken is missing or cannot load it"""
+    if tiktoken is None:
+        return None
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        # Encoding files are fetched over the network on first use
+        logger.warning(f"Could not load the tiktoken encoding for {model} ({e}); "
+                       f"estimating {CHARS_PER_TOKEN} characters per token")
+        return None
+
+
+def tokenizer_name(model: Optional[str] = None) -> str:
+    """How count_tokens counts for ``model``"""
+    return 'tiktoken' if _encoding(model) is not None else f"estimate ({CHARS_PER_TOKEN} chars/token)"
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Prompt tokens of ``text`` for ``model`` (an estimate without a tiktoken encoding)"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def prompt_limit(provider: str = 'stanford', model: Optional[str] = None,
+                 max_prompt_tokens: Optional[int] = None) -> int:
+    """Most prompt tokens one request to ``provider``/``model`` may use"""
+    config = API_CONFIG[provider]
+    context = MODEL_CONTEXT_WINDOWS.get(model or config['model'], config['context_window'])
+    limit = context - config['max_tokens']
+    budget = max_prompt_tokens or config.get('max_prompt_tokens')
+    return min(limit, budget) if budget else limit
+
+
+def _hard_split(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """Cut text without usable boundaries into pieces of at most ``max_tokens``"""
+    pieces = []
+    while text:
+        end = len(text)
+        tokens = count(text)
+        while end > 1 and tokens > max_tokens:
+            # Shrink in proportion to the overshoot, and by at least one character
+            end = max(1, min(end - 1, int(end * max_tokens / tokens)))
+            tokens = count(text[:end])
+        pieces.append(text[:end])
+        text = text[end:]
+    return pieces
+
+
+def split_text(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """
+    Split ``text`` into consecutive pieces of at most ``max_tokens`` (as
+    measured by ``count``). Paragraphs are kept together where they fit, then
+    sentences; only a sentence longer than the limit is cut mid-text.
+    """
+    if count(text) <= max_tokens:
+        return [text]
+    units = []
+    for paragraph in _PARAGRAPH.split(text):
+        if count(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE.split(paragraph):
+            units.extend([sentence] if count(sentence) <= max_tokens else _hard_split(sentence, max_tokens, count))
+    pieces = []
+    current = None
+    for unit in units:
+        candidate = unit if current is None else current + "\n\n" + unit
+        if current is not None and count(candidate) > max_tokens:
+            pieces.append(current)
+            candidate = unit
+        current = candidate
+    if current is not None:
+        pieces.append(current)
+    return pieces
+
+
+def shorten_text(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Keep the beginning and end of ``text`` within ``max_tokens``, marking what was left out"""
+    if count(text) <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / count(text))
+    while keep > 0:
+        head, tail = text[:keep // 2], text[len(text) - (keep - keep // 2):]
+        shortened = f"{head}\n[... {len(text) - keep} characters omitted ...]\n{tail}"
+        if count(shortened) <= max_tokens:
+            return shortened
+        keep = int(keep * 0.9)
+    return ''
+
+
+class PromptTooLargeError(ValueError):
+    """A prompt cannot be made to fit the token limit."""
+
+
+class TokenBudget(object):
+    """
+    Token limit for the prompts of one provider and model, and a thread-safe
+    record of the prompt sizes seen; see the module docstring. With
+    ``enforce=False`` callers send prompts over the limit unchanged.
+    """
+    def __init__(self, provider: str = 'stanford', model: Optional[str] = None,
+                 max_prompt_tokens: Optional[int] = None, enforce: bool = True):
+        self.provider = provider
+        self.model = model or API_CONFIG[provider]['model']
+        self.limit = prompt_limit(provider, self.model, max_prompt_tokens)
+        self.enforce = enforce
+        self._lock = threading.Lock()
+        self.tokens = defaultdict(list)
+        # Largest prompt per case
+        self.largest = defaultdict(dict)
+        self.actions = defaultdict(lambda: defaultdict(int))
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def fits(self, prompt: str) -> bool:
+        return self.count(prompt) <= self.limit
+
+    def record(self, stage: str, tokens: int, dav_id: Any = None, action: Optional[str] = None) -> None:
+        """Record one prompt sent for ``stage``; ``action`` is 'split', 'shortened' or 'over_limit'"""
+        with self._lock:
+            self.tokens[stage].append(tokens)
+            largest = self.largest[stage]
+            largest[str(dav_id)] = max(tokens, largest.get(str(dav_id), 0))
+            first = False
+            if action is not None:
+                self.actions[stage][action] += 1
+                first = self.actions[stage][action] == 1
+        if action is not None and first:
+            logger.warning(f"{stage} prompt for {dav_id} {action.replace('_', ' ')} (limit {self.limit} tokens); "
+                           f"later ones are only counted in the token report")
+
+    def fit_fields(self, render: Callable[..., str], fields: Dict[str, str], stage: str,
+                   dav_id: Any = None) -> str:
+        """
+        ``render(**fields)``, with the longest fields shortened until the
+        prompt fits the limit.
+
+        Raises:
+            PromptTooLargeError: if the prompt is too large even with every field emptied
+        """
+        fields = {name: str(value) for name, value in fields.items()}
+        prompt = render(**fields)
+        tokens = self.count(prompt)
+        if tokens <= self.limit:
+            self.record(stage, tokens, dav_id)
+            return prompt
+        while tokens > self.limit:
+            sizes = {name: self.count(value) for name, value in fields.items()}
+            name = max(sizes, key=sizes.get)
+            if sizes[name] == 0:
+                self.record(stage, tokens, dav_id, 'over_limit')
+                raise PromptTooLargeError(f"{stage} prompt for {dav_id} has {tokens} tokens without any input "
+                                          f"(limit {self.limit})")
+            fields[name] = shorten_text(fields[name], max(sizes[name] - (tokens - self.limit), 0), self.count)
+            prompt = render(**fields)
+            tokens = self.count(prompt)
+        self.record(stage, tokens, dav_id, 'shortened')
+        return prompt
+
+    def report(self) -> Dict[str, Any]:
+        """Per-stage prompt token distribution, totals and the largest prompts"""
+        with self._lock:
+            tokens = {stage: list(values) for stage, values in self.tokens.items()}
+            largest = {stage: heapq.nlargest(REPORT_LARGEST, values.items(), key=lambda item: item[1])
+                       for stage, values in self.largest.items()}
+            actions = {stage: dict(values) for stage, values in self.actions.items()}
+        report = {
+            'provider': self.provider,
+            'model': self.model,
+            'tokenizer': tokenizer_name(self.model),
+            'prompt_token_limit': self.limit,
+            'limit_enforced': self.enforce,
+            'stages': {},
+        }
+        for stage, values in tokens.items():
+            report['stages'][stage] = {
+                'prompts': _distribution(values),
+                'total_prompt_tokens': sum(values),
+                'estimated_prompt_cost_usd': estimate_cost(self.model, sum(values), 0),
+                'split': actions.get(stage, {}).get('split', 0),
+                'shortened': actions.get(stage, {}).get('shortened', 0),
+                'over_limit': actions.get(stage, {}).get('over_limit', 0),
+                'largest_cases': [{'dav_id': dav_id, 'tokens': count} for dav_id, count in largest[stage]],
+            }
+        return report
@@ -1,20 +1,182 @@
 """Verifier for Decomposition Concordance Pipeline"""
 
 import os
+import logging
 import asyncio
 import json
 import pathlib
-from typing import List, Dict, Any, Optional
+import sys
+import time
+from typing import List, Dict, Any, Optional, Tuple, Union
 
-from tqdm import tqdm
 import nest_asyncio
-import inspect
+import numpy as np
+import requests
+from concurrent.futures import Executor, ThreadPoolExecutor
 
-from .utils import chunker
-from .api_utils import query_stanford_api
+from .config import API_CONFIG
+from .api_utils import query_stanford_api, RateLimiter, HedgePolicy
+from .log_utils import ProgressReporter, log_raw_output
+from .provenance import hash_text, hash_json
+from .routing import ModelRouter, ModelRoute, LARGE
+from .structured_output import VERDICTS, StructuredOutputError, parse_verdicts
+from .token_budget import TokenBudget, PromptTooLargeError, split_text
 
+logger = logging.getLogger(__name__)
 nest_asyncio.apply()
 
+# Score of claims left unverified because the case's prediction was already decided
+SKIPPED_VERDICT = 'Skipped'
+CHUNK_SIZE = 10
+
+
+def support_bounds(supported: int, not_supported: int, remaining: int) -> Tuple[float, float]:
+    """
+    Lowest and highest support percentage (supported / (supported + not
+    supported), 0 when empty) a case can still end with, given the verdicts
+    so far and the number of claims not yet verified.
+    """
+    if supported == 0:
+        low = 0.0
+    else:
+        low = supported / (supported + not_supported + remaining) * 100
+    if supported + remaining == 0:
+        high = 0.0
+    else:
+        high = (supported + remaining) / (supported + not_supported + remaining) * 100
+    return low, high
+
+
+def decided_prediction(supported: int, not_supported: int, remaining: int, threshold: float) -> Optional[int]:
+    """Concordance prediction (support percentage >= threshold) if it can no longer change, else None."""
+    low, high = support_bounds(supported, not_supported, remaining)
+    if low >= threshold:
+        return 1
+    if high < threshold:
+        return 0
+    return None
+
+
+def aggregate_votes(samples: List[Optional[List[Dict[str, Any]]]], num_claims: int) -> List[Dict[str, Any]]:
+    """
+    Majority vote over k sampled verdict lists for one claim chunk.
+
+    ``samples`` holds one parsed verdict list per sample (None if the sample
+    could not be parsed). Votes are counted as a (claims x verdicts) array;
+    each claim gets the majority verdict, a confidence (majority share of its
+    valid votes) and the entropy of its vote distribution in bits. Ties go to
+    the verdict listed first in VERDICTS. The reason is taken from the first
+    sample that voted for the majority verdict.
+    """
+    valid = [sample for sample in samples if sample is not None]
+    if not valid:
+        return []
+    # votes[s, c] = index into VERDICTS, -1 for anything else
+    votes = np.array([[VERDICTS.index(v.get('verdict')) if v.get('verdict') in VERDICTS else -1 for v in sample]
+                      for sample in valid])
+    counts = np.stack([(votes == i).sum(axis=0) for i in range(len(VERDICTS))], axis=1)
+    totals = counts.sum(axis=1)
+    majority = counts.argmax(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.where(totals[:, None] > 0, counts / totals[:, None], 0.0)
+        entropy = np.where(shares > 0, -shares * np.log2(shares), 0.0).sum(axis=1)
+    confidence = np.where(totals > 0, counts.max(axis=1) / np.maximum(totals, 1), 0.0)
+    # First sample agreeing with the majority, per claim
+    agreeing = (votes == majority[None, :]).argmax(axis=0)
+    aggregated = []
+    for c in range(num_claims):
+        source = valid[agreeing[c]][c] if totals[c] > 0 else valid[0][c]
+        aggregated.append({
+            'verdict': VERDICTS[majority[c]] if totals[c] > 0 else source.get('verdict', ''),
+            'reason': source.get('reason', ''),
+            'confidence': float(confidence[c]),
+            'entropy': float(entropy[c]),
+            'votes': int(totals[c]),
+        })
+    return aggregated
+
+
+def merge_piece_verdicts(piece_verdicts: List[Optional[List[Dict[str, Any]]]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Combine the verdicts for one claim chunk checked against each piece of a
+    split reference. A claim is Supported if any piece supports it, and Not
+    Addressed only if no piece addresses it. Pieces whose output could not be
+    parsed are left out; None if none could be.
+    """
+    valid = [verdicts for verdicts in piece_verdicts if verdicts]
+    if not valid:
+        return None
+    rank = lambda v: VERDICTS.index(v['verdict']) if v.get('verdict') in VERDICTS else len(VERDICTS)
+    return [min(claim_verdicts, key=rank) for claim_verdicts in zip(*valid)]
+
+
+class CaseEvidence(object):
+    """
+    Per-case data shared by all claim verifications of that case: the
+    reference evidence and the raw LLM output of each claim chunk.
+    """
+    __slots__ = ('dav_id', 'reference', 'raw_outputs', 'early_stop', 'provenance')
+
+    def __init__(self, dav_id: str, reference: str):
+        self.dav_id = dav_id
+        self.reference = reference
+        self.raw_outputs = []
+        # Set when verification stopped once the threshold prediction was decided
+        self.early_stop = None
+        # Hashes of the prompt, model, options and inputs that produced the verdicts
+        self.provenance = None
+
+
+class ClaimVerification(object):
+    """
+    Verdict for a single claim. The reference and raw output are not copied
+    into the record; they are read through the shared CaseEvidence.
+    """
+    __slots__ = ('case', 'chunk_index', 'claim_id', 'id', 'claim', 'score', 'reason', 'confidence', 'entropy')
+
+    def __init__(self, case: CaseEvidence, chunk_index: Optional[int], claim_id: Optional[int], id: Optional[str],
+                 claim: str, score: str, reason: str, confidence: Optional[float] = None,
+                 entropy: Optional[float] = None):
+        self.case = case
+        self.chunk_index = chunk_index
+        self.claim_id = claim_id
+        self.id = id
+        self.claim = claim
+        self.score = score
+        self.reason = reason
+        # Only set when several samples were voted on
+        self.confidence = confidence
+        self.entropy = entropy
+
+    @property
+    def dav_id(self) -> str:
+        return self.case.dav_id
+
+    @property
+    def reference(self) -> str:
+        return self.case.reference
+
+    @property
+    def raw(self) -> Union[str, List[str], None]:
+        if self.case.raw_outputs is None or self.chunk_index is None:
+            return None
+        return self.case.raw_outputs[self.chunk_index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'dav_id': self.dav_id,
+            'claim_id': self.claim_id,
+            'id': self.id,
+            'claim': self.claim,
+            'raw': self.raw,
+            'score': self.score,
+            'reason': self.reason,
+            'reference': self.reference,
+            'confidence': self.confidence,
+            'entropy': self.entropy,
+        }
+
+
 class ProvidedEvidenceVerifier(object):
     """
     Verifies claims against reference evidence using an LLM API.
@@ -28,6 +190,19 @@ class ProvidedEvidenceVerifier(object):
             batch_size: int = 32,
             api_key: Optional[str] = None,
             prompt_path: Optional[str] = None,
+            *,
+            server_url: Optional[str] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            stage: str = "verify",
+            keep_raw_outputs: bool = False,
+            num_samples: int = 1,
+            sample_temperature: Optional[float] = None,
+            early_stop_threshold: Optional[float] = None,
+            early_stop_chunk_size: int = CHUNK_SIZE,
+            router: Optional[ModelRouter] = None,
+            hedge: Optional[HedgePolicy] = None,
+            endpoint_pools: Optional[Dict[str, Any]] = None,
+            token_budget: Optional[TokenBudget] = None,
             **kwargs,
     ):
         self.model_name = model_name
@@ -35,12 +210,37 @@ class ProvidedEvidenceVerifier(object):
         self.random_state = random_state
         self.batch_size = batch_size
         self.api_key = api_key
+        # Endpoint override (API_CONFIG url when None), shared per-provider limiter, metrics label
+        self.server_url = server_url
+        self.rate_limiter = rate_limiter
+        self.stage = stage
+        # Raw outputs are only needed for debugging; drop them once a case is done
+        self.keep_raw_outputs = keep_raw_outputs
+        # Self-consistency: k samples per claim chunk, majority-voted per claim
+        self.num_samples = num_samples
+        self.sample_temperature = sample_temperature
+        self.use_n = API_CONFIG['stanford'].get('supports_n', False)
+        # Sequential mode: stop verifying a case once its prediction at this support percentage is decided
+        self.early_stop_threshold = early_stop_threshold
+        self.early_stop_chunk_size = early_stop_chunk_size
+        # Optional duplicate requests for calls slower than the stage's usual latency
+        self.hedge = hedge
+        # Per-model pools of equivalent deployments, load balanced
+        self.endpoint_pools = endpoint_pools
+        # Pre-flight prompt size check; oversized references are split to fit
+        self.token_budget = token_budget
+        # Optional small/large model routing; the large model is this verifier's own
+        self.router = router
+        self.large_route = ModelRoute(LARGE, model_name, server_url)
+        if router is not None:
+            router.register(stage, model_name)
         if prompt_path is None:
             prompt_path = os.path.join(pathlib.Path(__file__).parent.parent, 'prompt', 'verifier_prompt.txt')
         with open(prompt_path, 'r', encoding='utf-8') as f:
             self.prompt_template = f.read()
+        self.prompt_hash = hash_text(self.prompt_template)
 
-    def __call__(self, decompositions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def __call__(self, decompositions: List[Dict[str, Any]]) -> List[ClaimVerification]:
         # Group decompositions by dav_id
         grouped = {}
         for d in decompositions:
@@ -49,53 +249,237 @@ class ProvidedEvidenceVerifier(object):
                 grouped[dav_id] = []
             grouped[dav_id].append(d)
         verification_output = []
-        for dav_id, claims in tqdm(grouped.items(), desc="Verify"):
-            reference = self.id_to_evidence[dav_id]
+        early_stopped_cases = skipped_claims = 0
+        progress = ProgressReporter("Verify", total=len(grouped), logger=logger)
+        for dav_id, claims in grouped.items():
+            case = CaseEvidence(dav_id, self.id_to_evidence[dav_id])
             claim_texts = [c['claim'] for c in claims]
+            case.provenance = self.case_provenance(case.reference, claim_texts)
             all_verdicts = []
-            for claim_chunk in chunker(claim_texts, 10):  # batch size 10
-                prompt = self.format_batched_prompt(reference, claim_chunk)
-                messages = [{"role": "user", "content": prompt}]
-                response = self.batch_response([messages])[0]
-                raw_output = inspect.cleandoc(response['choices'][0]['message']['content'])
-                #print(f"Prompt length (chars): {len(prompt)}")
-                #print(f"=== LLM RAW OUTPUT for dav_id: {dav_id} ===\n{raw_output}\n==============================\n")
-                # Robust parsing logic (removes code block markers, flexible JSON parsing, fallback)
-                if raw_output.strip().startswith("```"):
-                    raw_output = "\n".join(
-                        line for line in raw_output.splitlines() if not line.strip().startswith("```")
-                    ).strip()
-                raw_output = inspect.cleandoc(raw_output)
-                try:
-                    verdicts = json.loads(raw_output)
-                    if isinstance(verdicts, dict):
-                        verdicts = [verdicts for _ in range(len(claim_chunk))]
-                    print(f"dav_id: {dav_id} | Claims sent: {len(claim_chunk)} | Verdicts received (LLM): {len(verdicts)}")
-                    if not isinstance(verdicts, list) or len(verdicts) != len(claim_chunk):
-                        raise ValueError("Output JSON does not match number of claims")
-                except Exception as e:
-                    print(f"Parse error: {e}\nRaw output was:\n{raw_output}")
-                    verdicts = [{"verdict": "Not Supported", "reason": f"Parse error: {e}"} for _ in range(len(claim_chunk))]
-                all_verdicts.extend(verdicts)
-            print(f"dav_id: {dav_id} | Total claims sent: {len(claim_texts)} | Total verdicts received: {len(all_verdicts)}")
-            for c, v in zip(claims, all_verdicts):
-                output = {k: v for k, v in c.items()}
-                output["raw"] = raw_output
-                output["score"] = v.get("verdict", "")
-                output["reason"] = v.get("reason", "")
-                output["reference"] = reference
-                verification_output.append(output)
+            counts = {verdict: 0 for verdict in VERDICTS}
+            position = 0
+            while position < len(claim_texts):
+                size = CHUNK_SIZE if self.early_stop_threshold is None else self.early_stop_chunk_size
+                claim_chunk = claim_texts[position:position + size]
+                position += size
+                raw, verdicts = self.verify_chunk(case.reference, claim_chunk, dav_id)
+                chunk_index = len(case.raw_outputs)
+                case.raw_outputs.append(raw)
+                all_verdicts.extend((chunk_index, v) for v in verdicts)
+                if self.early_stop_threshold is None or position >= len(claim_texts):
+                    continue
+                for v in verdicts:
+                    if v.get("verdict") in counts:
+                        counts[v["verdict"]] += 1
+                remaining = len(claim_texts) - position
+                prediction = decided_prediction(counts['Supported'], counts['Not Supported'], remaining,
+                                                self.early_stop_threshold)
+                if prediction is not None:
+                    case.early_stop = {
+                        'threshold': self.early_stop_threshold,
+                        'predicted_concordant': prediction,
+                        'verified_claims': position,
+                        'skipped_claims': remaining,
+                    }
+                    reason = (f"Not verified: prediction at {self.early_stop_threshold}% support "
+                              f"was decided after {position} claims")
+                    all_verdicts.extend((None, {"verdict": SKIPPED_VERDICT, "reason": reason}) for _ in range(remaining))
+                    logger.debug("verify early stop", extra=dict(case.early_stop, dav_id=dav_id))
+                    early_stopped_cases += 1
+                    skipped_claims += remaining
+                    break
+            logger.debug("verify case", extra={'dav_id': dav_id, 'claims_sent': len(claim_texts),
+                                               'verdicts_received': len(all_verdicts)})
+            verification_output.extend(self.build_verifications(case, claims, all_verdicts))
+            progress.update()
+        progress.close()
+        if self.early_stop_threshold is not None:
+            logger.info("Early stop at %s%% support: skipped %d claims in %d of %d cases",
+                        self.early_stop_threshold, skipped_claims, early_stopped_cases, len(grouped))
         return verification_output
 
+    def verify_chunk(self, reference: str, claim_chunk: List[str],
+                     dav_id: str) -> Tuple[Union[str, List[str]], List[Dict[str, Any]]]:
+        """
+        Verify one chunk of a case's claims. Returns the raw output (a list
+        when several samples were taken) and one verdict per claim.
+        """
+        try:
+            prompts = self.chunk_prompts(reference, claim_chunk, dav_id)
+        except PromptTooLargeError as e:
+            logger.warning("Not verifying %d claims of dav_id %s: %s", len(claim_chunk), dav_id, e,
+                           extra={'dav_id': dav_id})
+            return None, [{"verdict": "Not Supported", "reason": f"Not verified: {e}"} for _ in claim_chunk]
+        results = [self._verify_prompt(prompt, claim_chunk, dav_id) for prompt in prompts]
+        if len(results) == 1:
+            raw_samples, verdicts, errors = results[0]
+        else:
+            raw_samples = [raw for samples, _, _ in results for raw in samples]
+            verdicts = merge_piece_verdicts([piece_verdicts for _, piece_verdicts, _ in results])
+            errors = [error for _, _, piece_errors in results for error in piece_errors if error is not None]
+        if not verdicts:
+            verdicts = [{"verdict": "Not Supported", "reason": f"Parse error: {errors[0]}"}
+                        for _ in range(len(claim_chunk))]
+        raw = raw_samples[0] if len(raw_samples) == 1 else raw_samples
+        return raw, verdicts
+
+    def chunk_prompts(self, reference: str, claim_chunk: List[str], dav_id: str) -> List[str]:
+        """
+        Prompts for one claim chunk: a single prompt, or with an enforced
+        token budget and a reference too large for it, one prompt per piece
+        of the reference.
+
+        Raises:
+            PromptTooLargeError: if the claims alone leave no room for the reference
+        """
+        prompt = self.format_batched_prompt(reference, claim_chunk)
+        budget = self.token_budget
+        if budget is None:
+            return [prompt]
+        tokens = budget.count(prompt)
+        if tokens <= budget.limit or not budget.enforce:
+            budget.record(self.stage, tokens, dav_id, None if tokens <= budget.limit else 'over_limit')
+            return [prompt]
+        room = budget.limit - budget.count(self.format_batched_prompt("", claim_chunk))
+        if room <= 0:
+            budget.record(self.stage, tokens, dav_id, 'over_limit')
+            raise PromptTooLargeError(f"{len(claim_chunk)} claims leave no room for the reference "
+                                      f"within {budget.limit} prompt tokens")
+        # The reference goes into the prompt JSON-encoded, so that is what is measured
+        pieces = split_text(reference, room, lambda text: budget.count(json.dumps(text)))
+        prompts = [self.format_batched_prompt(piece, claim_chunk) for piece in pieces]
+        logger.debug("verify reference split", extra={'dav_id': dav_id, 'tokens': tokens, 'pieces': len(pieces)})
+        for i, piece_prompt in enumerate(prompts):
+            budget.record(self.stage, budget.count(piece_prompt), dav_id, 'split' if i == 0 else None)
+        return prompts
+
+    def _verify_prompt(self, prompt: str, claim_chunk: List[str],
+                       dav_id: str) -> Tuple[List[str], Optional[List[Dict[str, Any]]], Tuple]:
+        messages = [{"role": "user", "content": prompt}]
+        if self.router is None:
+            return self._sample_verdicts(messages, claim_chunk, dav_id)
+        # Small model first; escalate if it could not answer or was not confident
+        raw_samples, verdicts, errors = self._sample_verdicts(messages, claim_chunk, dav_id, self.router.small)
+        escalated = self.router.needs_escalation(verdicts)
+        if escalated:
+            logger.debug("verify escalation", extra={'dav_id': dav_id, 'claims_sent': len(claim_chunk)})
+            raw_samples, verdicts, errors = self._sample_verdicts(messages, claim_chunk, dav_id, self.large_route)
+        self.router.record(self.stage, self.large_route if escalated else self.router.small, escalated=escalated)
+        return raw_samples, verdicts, errors
+
+    def _sample_verdicts(self, messages: List[Dict[str, str]], claim_chunk: List[str], dav_id: str,
+                         route: Optional[ModelRoute] = None) -> Tuple[List[str], Optional[List[Dict[str, Any]]], Tuple]:
+        raw_samples = [raw.strip() for raw in self.sample_outputs(messages, route)]
+        parsed, errors = zip(*(self.parse_verdicts(raw, claim_chunk, dav_id) for raw in raw_samples))
+        verdicts = aggregate_votes(parsed, len(claim_chunk)) if len(parsed) > 1 else parsed[0]
+        return raw_samples, verdicts, errors
+
+    def build_verifications(self, case: CaseEvidence, claims: List[Dict[str, Any]],
+                            verdicts: List[Tuple[Optional[int], Dict[str, Any]]]) -> List[ClaimVerification]:
+        """Pair each claim record with its (chunk_index, verdict); drops raw outputs unless kept."""
+        verifications = []
+        for c, (chunk_index, v) in zip(claims, verdicts):
+            verifications.append(ClaimVerification(
+                case=case,
+                chunk_index=chunk_index,
+                claim_id=c.get('claim_id'),
+                id=c.get('id'),
+                claim=c['claim'],
+                score=sys.intern(str(v.get("verdict", ""))),
+                reason=v.get("reason", ""),
+                confidence=v.get("confidence"),
+                entropy=v.get("entropy"),
+            ))
+        if not self.keep_raw_outputs:
+            case.raw_outputs = None
+        return verifications
+
+    def stream_case(self, dav_id: str, executor: Executor, chunk_size: int = CHUNK_SIZE) -> 'StreamedCase':
+        """Start verifying a case whose claims are still being decomposed; see StreamedCase."""
+        return StreamedCase(self, dav_id, executor, chunk_size)
+
+    def case_provenance(self, reference: str, claim_texts: List[str], chunk_size: int = CHUNK_SIZE) -> Dict[str, str]:
+        """What a case's verdicts depend on; stored with them for incremental runs"""
+        options = {'num_samples': self.num_samples, 'early_stop_threshold': self.early_stop_threshold}
+        if chunk_size != CHUNK_SIZE:
+            options['chunk_size'] = chunk_size
+        if self.num_samples > 1:
+            options['sample_temperature'] = self.sample_temperature
+        if self.early_stop_threshold is not None:
+            options['early_stop_chunk_size'] = self.early_stop_chunk_size
+        if self.token_budget is not None and self.token_budget.enforce and not self.token_budget.fits(self.format_batched_prompt(reference, claim_texts)):
+            # Some chunk of this case may have its reference split, which depends on the limit
+            options['prompt_token_limit'] = self.token_budget.limit
+        return {
+            'prompt': self.prompt_hash,
+            'model': self.model_name if self.router is None else self.router.describe(self.model_name),
+            'options': hash_json(options),
+            'input': hash_json([reference, claim_texts]),
+        }
+
+    def parse_verdicts(self, raw_output: str, claim_chunk: List[str],
+                       dav_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Exception]]:
+        """Parse one output into a verdict per claim; returns (None, error) if it does not match the chunk."""
+        try:
+            verdicts, repaired = parse_verdicts(raw_output, len(claim_chunk))
+        except StructuredOutputError as e:
+            logger.warning("Parse error for dav_id %s: %s", dav_id, e, extra={'dav_id': dav_id})
+            log_raw_output(logger, raw_output, dav_id=dav_id)
+            return None, e
+        logger.debug("verify chunk", extra={'dav_id': dav_id, 'claims_sent': len(claim_chunk),
+                                            'verdicts_received': len(verdicts), 'repaired': repaired})
+        return verdicts, None
+
+    def sample_outputs(self, messages: List[Dict[str, str]], route: Optional[ModelRoute] = None) -> List[str]:
+        """
+        Raw completion texts for one prompt: a single sample, or ``num_samples``
+        samples taken with one ``n`` request where the provider supports it and
+        concurrent single requests otherwise.
+        """
+        if self.num_samples <= 1:
+            response = self._query(messages, route)
+            return [response['choices'][0]['message']['content']]
+        contents = []
+        if self.use_n:
+            try:
+                response = self._query(messages, route, n=self.num_samples, temperature=self.sample_temperature)
+                contents = [choice['message']['content'] for choice in response['choices']]
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 400:
+                    raise
+            if len(contents) < self.num_samples:
+                # The endpoint rejected or ignored 'n'; use separate requests from now on
+                logger.info("Endpoint did not return %d samples per request; falling back to concurrent requests",
+                            self.num_samples)
+                self.use_n = False
+        missing = self.num_samples - len(contents)
+        if missing > 0:
+            with ThreadPoolExecutor(max_workers=missing) as executor:
+                responses = list(executor.map(
+                    lambda _: self._query(messages, route, temperature=self.sample_temperature), range(missing)))
+            contents.extend(response['choices'][0]['message']['content'] for response in responses)
+        return contents[:self.num_samples]
+
+    def _query(self, messages: List[Dict[str, str]], route: Optional[ModelRoute] = None, **kwargs) -> Dict[str, Any]:
+        query = dict(
+            messages=messages,
+            api_key=self.api_key,
+            model=self.model_name,
+            stage=self.stage,
+            url=self.server_url,
+            rate_limiter=self.rate_limiter,
+            hedge=self.hedge,
+            endpoint_pools=self.endpoint_pools,
+        )
+        if route is not None:
+            query.update(route.query_kwargs(), stage=f"{self.stage}/{route.name}")
+        query.update(kwargs)
+        return query_stanford_api(**query)
+
     def batch_response(self, batch: List[List[Dict[str, str]]]) -> List[Dict[str, Any]]:
         completions = []
         for msg in batch:
-            response = query_stanford_api(
-                messages=msg,
-                api_key=self.api_key,
-                model=self.model_name
-            )
-            completions.append(response)
+            completions.append(self._query(msg))
         return completions
 
     def format_batched_prompt(self, reference: str, claims: list) -> str:
@@ -104,3 +488,59 @@ class ProvidedEvidenceVerifier(object):
             claims=json.dumps(claims, ensure_ascii=False)
         )
         return prompt
+
+
+class StreamedCase(object):
+    """
+    Verification of one case whose claims arrive one at a time from a
+    streamed decomposition. Each claim is queued as it arrives; whenever
+    ``chunk_size`` claims are queued they are submitted to the executor, so
+    verification of the first claims runs while later ones are still being
+    generated. Call ``finish`` after the last claim and ``result`` to collect
+    the verdicts in claim order.
+    """
+    def __init__(self, verifier: ProvidedEvidenceVerifier, dav_id: str, executor: Executor, chunk_size: int):
+        self.verifier = verifier
+        self.case = CaseEvidence(dav_id, verifier.id_to_evidence[dav_id])
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.claims = []
+        self._pending = []
+        self._futures = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def add(self, claim: Dict[str, Any]) -> None:
+        self.claims.append(claim)
+        self._pending.append(claim['claim'])
+        if len(self._pending) >= self.chunk_size:
+            self._submit()
+
+    def finish(self) -> None:
+        if self._pending:
+            self._submit()
+
+    def _submit(self) -> None:
+        self._futures.append(self.executor.submit(self._verify, self._pending))
+        self._pending = []
+
+    def _verify(self, claim_chunk: List[str]) -> Tuple[Union[str, List[str]], List[Dict[str, Any]]]:
+        result = self.verifier.verify_chunk(self.case.reference, claim_chunk, self.case.dav_id)
+        now = time.perf_counter()
+        self.finished_at = max(self.finished_at or now, now)
+        return result
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds from the start of the case to its last verified chunk"""
+        return None if self.finished_at is None else self.finished_at - self.started_at
+
+    def result(self) -> List[ClaimVerification]:
+        verdicts = []
+        for chunk_index, future in enumerate(self._futures):
+            raw, chunk_verdicts = future.result()
+            self.case.raw_outputs.append(raw)
+            verdicts.extend((chunk_index, v) for v in chunk_verdicts)
+        self.case.provenance = self.verifier.case_provenance(
+            self.case.reference, [c['claim'] for c in self.claims], self.chunk_size)
+        return self.verifier.build_verifications(self.case, self.claims, verdicts)
@@ -1,13 +1,13 @@
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from results_reader import read_jsonl, predicted_concordant as medscore_prediction
 import matplotlib.pyplot as plt
 import numpy as np
 
 def load_data(jsonl_file):
-    data = []
-    with open(jsonl_file, 'r') as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
-    return data
+    return read_jsonl(jsonl_file)
 
 def analyze_concordance_prediction(jsonl_file, threshold=80.0):
     data = load_data(jsonl_file)
@@ -19,14 +19,18 @@ def analyze_concordance_prediction(jsonl_file, threshold=80.0):
     false_negatives = 0  # Predicted not concordant, actually concordant
     
     results = []
+    undecided = 0
     
     for entry in data:
         dav_id = entry['dav_id']
-        support_pct = float(entry['support_percentage'].rstrip('%'))
+        # Prediction based on threshold; early-stopped cases only have a call at their own threshold
+        predicted_concordant = medscore_prediction(entry, threshold)
+        if predicted_concordant is None:
+            undecided += 1
+            continue
+        support_pct = float(entry['support_percentage'].rstrip('%')) if 'support_percentage' in entry else None
         actual_concordance = float(entry['Concordance'])
         
-        # Prediction based on threshold
-        predicted_concordant = 1 if support_pct >= threshold else 0
         actual_concordant = int(actual_concordance)
         
         # Classify the prediction
@@ -51,6 +55,8 @@ def analyze_concordance_prediction(jsonl_file, threshold=80.0):
             'category': category
         })
     
+    if undecided:
+        print(f"Warning: Skipping {undecided} cases early-stopped at a threshold other than {threshold}%")
     return results, true_positives, true_negatives, false_positives, false_negatives
 
 def create_piechart(jsonl_file, threshold=80.0, output_file='concordance_prediction_piechart.png'):
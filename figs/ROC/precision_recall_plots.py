@@ -1,9 +1,12 @@
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.metrics import roc_curve, auc, precision_recall_curve, confusion_matrix, classification_report
 import pandas as pd
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from results_reader import read_jsonl, full_score_entries
 
 # Set publication-ready style
 plt.style.use('default')
@@ -24,15 +27,13 @@ results_path = os.path.join(os.path.dirname(__file__), '../test_results_gpt4.1/f
 # Load data
 scores = []
 y_true = []
-with open(results_path, 'r') as f:
-    for line in f:
-        entry = json.loads(line)
-        conc = entry.get('Concordance', None)
-        if conc in ['0', '1', 0, 1, '0.0', '1.0']:
-            y = int(float(conc))
-            score = float(str(entry['support_percentage']).strip('%'))
-            y_true.append(y)
-            scores.append(score)
+for entry in full_score_entries(read_jsonl(results_path)):
+    conc = entry.get('Concordance', None)
+    if conc in ['0', '1', 0, 1, '0.0', '1.0']:
+        y = int(float(conc))
+        score = float(str(entry['support_percentage']).strip('%'))
+        y_true.append(y)
+        scores.append(score)
 
 scores = np.array(scores)
 y_true = np.array(y_true)
@@ -1,8 +1,11 @@
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.metrics import roc_curve, auc, precision_recall_fscore_support, confusion_matrix, classification_report
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from results_reader import read_jsonl, full_score_entries
 
 # Path to the results file
 results_path = os.path.join(os.path.dirname(__file__), '../test_results_gpt4.1/final_output.jsonl')
@@ -15,21 +18,23 @@ raters = {
     'Jessica': 'Concordance_Jessica'
 }
 
+# Parse the results once and reuse them for every rater
+# Early-stopped cases have no full support percentage to sweep thresholds over
+entries = full_score_entries(read_jsonl(results_path))
+
 rater_data = {}
 for rater_name, conc_field in raters.items():
     scores = []
     y_true = []
     
-    with open(results_path, 'r') as f:
-        for line in f:
-            entry = json.loads(line)
-            conc = entry.get(conc_field, None)
-            # Only use rows with valid concordance (0 or 1, as string or float)
-            if conc in ['0', '1', 0, 1, '0.0', '1.0']:
-                y = int(float(conc))
-                score = float(str(entry['support_percentage']).strip('%'))
-                y_true.append(y)
-                scores.append(score)
+    for entry in entries:
+        conc = entry.get(conc_field, None)
+        # Only use rows with valid concordance (0 or 1, as string or float)
+        if conc in ['0', '1', 0, 1, '0.0', '1.0']:
+            y = int(float(conc))
+            score = float(str(entry['support_percentage']).strip('%'))
+            y_true.append(y)
+            scores.append(score)
     
     if len(scores) > 0:
         rater_data[rater_name] = {
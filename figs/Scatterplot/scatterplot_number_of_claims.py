@@ -1,13 +1,13 @@
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from results_reader import read_jsonl
 import matplotlib.pyplot as plt
 import numpy as np
 
 def load_data(jsonl_file):
-    data = []
-    with open(jsonl_file, 'r') as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
-    return data
+    return read_jsonl(jsonl_file)
 
 def create_scatter_plot_4panel(jsonl_file, output_file='scatterplot_4panel.png'):
     data = load_data(jsonl_file)
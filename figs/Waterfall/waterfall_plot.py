@@ -1,35 +1,36 @@
-import json
-import matplotlib.pyplot as plt
 import os
+import sys
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from results_reader import read_jsonl, full_score_entries
 
 # Path to the results file
 results_path = os.path.join(os.path.dirname(__file__), '../test_results_gpt4.1/final_output.jsonl')
 
 # Read the data
 raw_data = []
-with open(results_path, 'r') as f:
-    for line in f:
-        entry = json.loads(line)
-        # Convert support_percentage and not_addressed_percentage to float (strip % if present)
-        support_perc = entry['support_percentage']
-        if isinstance(support_perc, str) and support_perc.endswith('%'):
-            support_perc = float(support_perc.strip('%'))
-        else:
-            support_perc = float(support_perc)
-        not_addr_perc = entry['not_addressed_percentage']
-        if isinstance(not_addr_perc, str) and not_addr_perc.endswith('%'):
-            not_addr_perc = float(not_addr_perc.strip('%'))
-        else:
-            not_addr_perc = float(not_addr_perc)
-        concordance = entry.get('Concordance', None)
-        raw_data.append({
-            'dav_id': entry['dav_id'],
-            'support_percentage': support_perc,
-            'support_fraction': entry['support_fraction'],
-            'not_addressed_percentage': not_addr_perc,
-            'not_addressed_fraction': entry['not_addressed_fraction'],
-            'Concordance': concordance
-        })
+for entry in full_score_entries(read_jsonl(results_path)):
+    # Convert support_percentage and not_addressed_percentage to float (strip % if present)
+    support_perc = entry['support_percentage']
+    if isinstance(support_perc, str) and support_perc.endswith('%'):
+        support_perc = float(support_perc.strip('%'))
+    else:
+        support_perc = float(support_perc)
+    not_addr_perc = entry['not_addressed_percentage']
+    if isinstance(not_addr_perc, str) and not_addr_perc.endswith('%'):
+        not_addr_perc = float(not_addr_perc.strip('%'))
+    else:
+        not_addr_perc = float(not_addr_perc)
+    concordance = entry.get('Concordance', None)
+    raw_data.append({
+        'dav_id': entry['dav_id'],
+        'support_percentage': support_perc,
+        'support_fraction': entry['support_fraction'],
+        'not_addressed_percentage': not_addr_perc,
+        'not_addressed_fraction': entry['not_addressed_fraction'],
+        'Concordance': concordance
+    })
 
 # Sort by support_percentage ascending
 sorted_data = sorted(raw_data, key=lambda x: x['support_percentage'])
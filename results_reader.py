@@ -0,0 +1,368 @@
+"""
+Shared reader for pipeline results
+
+One place that loads the JSONL outputs of the decomposition concordance
+pipeline (final_output, decompositions, verifications) and the original
+concordance CSV. Used by the review web app and the figure scripts.
+
+JSON lines are parsed with orjson when it is installed. ResultsReader keeps
+each file in memory together with its lookup indexes and re-reads a file only
+when its modification time changes. While a run is in progress,
+read_jsonl_from and JournalTail follow the growing files by byte offset.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict, deque
+
+import pandas as pd
+
+try:
+    import orjson
+
+    def _loads(line):
+        return orjson.loads(line)
+except ImportError:
+    import json
+
+    def _loads(line):
+        return json.loads(line)
+
+
+def read_jsonl(filepath, missing_ok=False):
+    """
+    Load all records from a JSONL file.
+
+    Args:
+        filepath: Path to the JSONL file
+        missing_ok: Return an empty list instead of raising if the file does not exist
+
+    Returns:
+        List of parsed records (blank lines are skipped)
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        if not missing_ok:
+            raise
+        print(f"Warning: File not found: {filepath}")
+        return []
+    records = [_loads(line) for line in lines[:-1]]
+    if lines:
+        try:
+            records.append(_loads(lines[-1]))
+        except ValueError:
+            # A running pipeline may be part way through writing the last line
+            if lines[-1].endswith(b'\n'):
+                raise
+    return records
+
+
+def read_jsonl_from(filepath, offset=0):
+    """
+    Read the records appended to a JSONL file since a byte offset.
+
+    Only complete lines are consumed, so a line that is still being written is
+    returned by a later call. If the file is now shorter than ``offset`` it has
+    been rewritten (e.g. by a new run) and is read from the start.
+
+    Returns:
+        Tuple of (records, new_offset, restarted)
+    """
+    try:
+        size = os.path.getsize(filepath)
+    except OSError:
+        return [], 0, offset > 0
+    restarted = size < offset
+    if restarted:
+        offset = 0
+    if size == offset:
+        return [], offset, restarted
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b'\n') + 1
+    records = [_loads(line) for line in data[:end].splitlines() if line.strip()]
+    return records, offset + end, restarted
+
+
+# Human concordance ratings: the best-of-3 vote and the individual raters
+RATER_COLUMNS = ['Concordance', 'Concordance_Vishnu', 'Concordance_Saloni', 'Concordance_Jessica']
+ORIGINAL_COLUMNS = ['dav_id', 'question', 'answer', 'ai_answer'] + RATER_COLUMNS
+
+
+def has_full_scores(entry):
+    """
+    Whether a final_output entry has support / not-addressed percentages over
+    all its claims. Early-stopped cases (medscore --early_stop_threshold) only
+    have ``verified_*`` percentages over the claims verified before stopping.
+    """
+    return 'support_percentage' in entry
+
+
+def full_score_entries(entries):
+    """The entries with full percentages, warning about the early-stopped ones left out"""
+    kept = [entry for entry in entries if has_full_scores(entry)]
+    if len(kept) < len(entries):
+        print(f"Warning: Skipping {len(entries) - len(kept)} early-stopped cases without full support percentages")
+    return kept
+
+
+def predicted_concordant(entry, threshold):
+    """
+    MedScore's concordance call (1/0) for a final_output entry at a support
+    ``threshold``, or None for a case early-stopped at a different threshold.
+    """
+    early_stop = entry.get('early_stop')
+    if early_stop is not None:
+        if float(early_stop['threshold']) != float(threshold):
+            return None
+        return int(early_stop['predicted_concordant'])
+    return int(float(str(entry['support_percentage']).rstrip('%')) >= threshold)
+ORIGINAL_CACHE_SUFFIX = '.lookup.pkl'
+
+
+def _csv_signature(csv_file):
+    stat = os.stat(csv_file)
+    # The columns are part of the signature so a cache of an older layout is rebuilt
+    return (stat.st_mtime_ns, stat.st_size, tuple(ORIGINAL_COLUMNS))
+
+
+def _build_original_data(csv_file):
+    df = pd.read_csv(csv_file, encoding='latin1', usecols=lambda column: column in ORIGINAL_COLUMNS)
+    if 'Concordance' in df.columns:
+        concordance = df['Concordance'].tolist()
+    else:
+        concordance = [0] * len(df)
+    raters = [column for column in RATER_COLUMNS if column in df.columns]
+    ratings = [dict(zip(raters, values)) for values in zip(*(df[column].tolist() for column in raters))] \
+        if raters else [{} for _ in range(len(df))]
+    return {
+        dav_id: {'question': question, 'answer': answer, 'ai_answer': ai_answer, 'concordance': concordance_value,
+                 'ratings': case_ratings}
+        for dav_id, question, answer, ai_answer, concordance_value, case_ratings in zip(
+            df['dav_id'].astype(str).tolist(), df['question'].tolist(), df['answer'].tolist(),
+            df['ai_answer'].tolist(), concordance, ratings)
+    }
+
+
+def load_original_data(csv_file, use_cache=True):
+    """
+    Load original CSV data with questions, answers, and AI responses.
+
+    Only the needed columns are read and the mapping is built column-wise. The
+    result is pickled next to the CSV (``<csv>.lookup.pkl``) and reused until
+    the CSV's modification time or size changes.
+
+    Returns:
+        Dict mapping dav_id to question, answer (human physician answer), ai_answer, concordance and
+        ratings (the RATER_COLUMNS present in the CSV)
+    """
+    try:
+        signature = _csv_signature(csv_file)
+    except FileNotFoundError:
+        print(f"Warning: CSV file not found: {csv_file}")
+        return {}
+    cache_file = csv_file + ORIGINAL_CACHE_SUFFIX
+    if use_cache:
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('signature') == signature:
+                return cached['data']
+        except Exception:
+            # Missing, stale-format or corrupt cache (e.g. truncated by a crash); rebuild it
+            pass
+    data_dict = _build_original_data(csv_file)
+    if use_cache:
+        # Write beside the cache and rename, so concurrent workers never read a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({'signature': signature, 'data': data_dict}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not write lookup cache {cache_file}: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+    return data_dict
+
+
+class JournalTail:
+    """
+    Live state of a pipeline run, folded incrementally from its run journal.
+
+    Each refresh() reads only the journal lines appended since the previous
+    call. Throughput is measured over the most recent chunks so the ETA
+    follows the current rate rather than the run-wide average.
+    """
+    RATE_WINDOW = 10
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.run = {}
+        self.status = None
+        self.total_cases = None
+        self.cases_done = 0
+        self.chunks = 0
+        self.started = None
+        self.updated = None
+        self.error = None
+        self._recent = deque(maxlen=self.RATE_WINDOW)
+
+    def _apply(self, event):
+        kind = event.get('event')
+        if kind == 'start':
+            self._reset()
+            self.run = {key: event.get(key) for key in ('input_file', 'output_dir', 'chunk_size', 'mode')}
+            self.status = 'running'
+            self.total_cases = event.get('total_cases')
+            self.started = event.get('ts')
+            self._recent.append((event.get('ts'), 0))
+        elif kind == 'chunk':
+            self.chunks += 1
+            self.cases_done = event.get('cases_done', self.cases_done)
+            self._recent.append((event.get('ts'), self.cases_done))
+        elif kind == 'end':
+            self.status = event.get('status', 'finished')
+            self.error = event.get('error')
+        self.updated = event.get('ts', self.updated)
+
+    def refresh(self):
+        """Fold newly appended journal events into the state; returns them."""
+        with self._lock:
+            events, self.offset, restarted = read_jsonl_from(self.path, self.offset)
+            if restarted:
+                self._reset()
+                events, self.offset, _ = read_jsonl_from(self.path, 0)
+            for event in events:
+                self._apply(event)
+            return events
+
+    def snapshot(self, now=None):
+        """Current progress, throughput and ETA as a JSON-serialisable dict"""
+        with self._lock:
+            if self.status is None:
+                return {'status': None}
+            now = now or time.time()
+            end_ts = now if self.status == 'running' else self.updated
+            cases_per_second = None
+            if len(self._recent) >= 2 and self._recent[-1][0] > self._recent[0][0]:
+                (first_ts, first_done), (last_ts, last_done) = self._recent[0], self._recent[-1]
+                cases_per_second = (last_done - first_done) / (last_ts - first_ts)
+            eta_seconds = None
+            if self.status == 'running' and self.total_cases and cases_per_second:
+                eta_seconds = max(0.0, (self.total_cases - self.cases_done) / cases_per_second)
+            return {
+                'status': self.status,
+                'run': self.run,
+                'total_cases': self.total_cases,
+                'cases_done': self.cases_done,
+                'chunks': self.chunks,
+                'started_at': self.started,
+                'updated_at': self.updated,
+                'elapsed_seconds': round(end_ts - self.started, 1) if self.started and end_ts else None,
+                'cases_per_second': round(cases_per_second, 3) if cases_per_second is not None else None,
+                'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None,
+                'error': self.error,
+            }
+
+
+def _group_by_dav_id(records):
+    grouped = defaultdict(list)
+    for record in records:
+        grouped[str(record.get('dav_id'))].append(record)
+    return dict(grouped)
+
+
+class ResultsReader:
+    """
+    Loads a results directory once and keeps indexes over it.
+
+    Each file is re-read only when its modification time changes, so callers
+    can ask for data on every request without repeated parsing.
+    """
+    FILES = {
+        'final_output': 'final_output.jsonl',
+        'decompositions': 'decompositions.jsonl',
+        'verifications': 'verifications.jsonl',
+    }
+    # Written by medscore.py per chunk; tailed for live progress, not part of version()
+    JOURNAL_FILE = 'run_journal.jsonl'
+
+    def __init__(self, data_dir, csv_file=None):
+        self.data_dir = data_dir
+        self.csv_file = csv_file
+        # Re-entrant: building an index loads the underlying records first
+        self._lock = threading.RLock()
+        self._cache = {}
+
+    def path(self, name):
+        return os.path.join(self.data_dir, self.FILES[name])
+
+    def journal_path(self):
+        return os.path.join(self.data_dir, self.JOURNAL_FILE)
+
+    def mtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def version(self):
+        """Modification times of every source file, for cache validation"""
+        paths = [self.path(name) for name in self.FILES]
+        if self.csv_file:
+            paths.append(self.csv_file)
+        return tuple(self.mtime(path) or 0.0 for path in paths)
+
+    def _cached(self, key, path, build):
+        mtime = self.mtime(path)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == mtime and mtime is not None:
+            return entry[1]
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == mtime and mtime is not None:
+                return entry[1]
+            value = build()
+            self._cache[key] = (mtime, value)
+            return value
+
+    def _records(self, name):
+        path = self.path(name)
+        return self._cached(name, path, lambda: read_jsonl(path, missing_ok=True))
+
+    def final_output(self):
+        return self._records('final_output')
+
+    def decompositions(self):
+        return self._records('decompositions')
+
+    def verifications(self):
+        return self._records('verifications')
+
+    def decompositions_for(self, dav_id):
+        index = self._cached('decompositions_by_case', self.path('decompositions'),
+                             lambda: _group_by_dav_id(self.decompositions()))
+        return index.get(str(dav_id), [])
+
+    def verifications_for(self, dav_id):
+        index = self._cached('verifications_by_case', self.path('verifications'),
+                             lambda: _group_by_dav_id(self.verifications()))
+        return index.get(str(dav_id), [])
+
+    def original_data(self):
+        if not self.csv_file:
+            return {}
+        return self._cached('original_data', self.csv_file, lambda: load_original_data(self.csv_file))
@@ -0,0 +1,3 @@
+"""
+SAGE case review web app
+"""
@@ -4,53 +4,278 @@ SAGE Case Review Web Interface
 Medical student-friendly interface for reviewing AI concordance evaluation results
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import json
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, make_response, jsonify
 import os
+import sys
+import math
+import base64
+import hashlib
+import json
 import random
-import pandas as pd
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 from functools import wraps
 
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from results_reader import ResultsReader, JournalTail, read_jsonl_from, has_full_scores, RATER_COLUMNS
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'sage_medical_concordance_study_2025')
+# Static assets change only on deploy; let browsers cache them for a day
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.environ.get('STATIC_MAX_AGE', 86400))
+
+# gzip/brotli compression of HTML, JSON and static responses when available
+try:
+    from flask_compress import Compress
+    Compress(app)
+except ImportError:
+    pass
 
 # Password for access
 REVIEW_PASSWORD = os.environ.get('REVIEW_PASSWORD', "djhwu")
 
-# Data directories
-DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'test_results_gpt4.1')
-CSV_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+# Data locations; set SAGE_DATA_DIR / SAGE_CSV_DATA_DIR / SAGE_CSV_FILE to serve another cohort
+DATA_DIR = os.environ.get('SAGE_DATA_DIR', os.path.join(REPO_ROOT, 'test_results_gpt4.1'))
+CSV_DATA_DIR = os.environ.get('SAGE_CSV_DATA_DIR', os.path.join(REPO_ROOT, 'data'))
+CSV_FILE = os.path.join(CSV_DATA_DIR, os.environ.get('SAGE_CSV_FILE', 'GPT-4.1_Concordance_Eval_Saloni.csv'))
+
+RESULTS = ResultsReader(DATA_DIR, CSV_FILE)
+# Live progress of a pipeline run writing into DATA_DIR
+JOURNAL = JournalTail(RESULTS.journal_path())
+PROGRESS_POLL_INTERVAL = float(os.environ.get('PROGRESS_POLL_INTERVAL', 2.0))
+PROGRESS_HEARTBEAT = 15.0
+# The dashboard polls /api/progress this often while a run is active
+DASHBOARD_POLL_INTERVAL = float(os.environ.get('DASHBOARD_POLL_INTERVAL', 5.0))
+# A stream holds a worker thread, so it is closed after this long; clients reconnect with Last-Event-ID
+PROGRESS_STREAM_MAX_SECONDS = float(os.environ.get('PROGRESS_STREAM_MAX_SECONDS', 120))
+PROGRESS_STREAM_RETRY_MS = 5000
+# A 'running' journal with no event for this long is taken to be a crashed run
+PROGRESS_STALE_AFTER = float(os.environ.get('PROGRESS_STALE_AFTER', 3600))
+
+SORT_FIELDS = {
+    'dav_id': lambda case: dav_id_sort_key(case.get('dav_id')),
+    'support': lambda case: parse_percentage(case.get('support_percentage')),
+    'not_addressed': lambda case: parse_percentage(case.get('not_addressed_percentage')),
+}
+VERDICTS = ['Supported', 'Not Supported', 'Not Addressed']
+DEFAULT_PER_PAGE = 24
+MAX_PER_PAGE = 200
+
+def dav_id_sort_key(dav_id):
+    """Sort numeric ids numerically and any others after them as text"""
+    try:
+        return (0, int(dav_id), '')
+    except (TypeError, ValueError):
+        return (1, 0, str(dav_id))
 
-def load_jsonl(filepath):
-    """Load data from JSONL file"""
-    data = []
+def parse_percentage(value):
+    """Parse a '87.5%' style string from final_output.jsonl into a float"""
     try:
-        with open(filepath, 'r') as f:
-            for line in f:
-                if line.strip():
-                    data.append(json.loads(line))
-    except FileNotFoundError:
-        print(f"Warning: File not found: {filepath}")
-    return data
-
-def load_original_data():
-    """Load original CSV data with questions, answers, and AI responses"""
-    csv_file = os.path.join(CSV_DATA_DIR, 'GPT-4.1_Concordance_Eval_Saloni.csv')
+        return float(str(value).rstrip('%'))
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_rating(value):
+    """Return a rater's concordance as a float, or None if missing"""
     try:
-        df = pd.read_csv(csv_file, encoding='latin1')
-        # Convert to dict with dav_id as key
-        data_dict = {}
-        for _, row in df.iterrows():
-            data_dict[str(row['dav_id'])] = {
-                'question': row['question'],
-                'answer': row['answer'],  # Human physician answer
-                'ai_answer': row['ai_answer'],
-                'concordance': row.get('Concordance', 0)
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(rating) else rating
+
+class ResultsIndex:
+    """
+    In-memory index over final_output.jsonl.
+
+    The pipeline does not write the human ratings, so the RATER_COLUMNS a
+    case lacks are joined from the concordance CSV by dav_id. The shared
+    ResultsReader re-reads either file only when it changes; the index is
+    rebuilt whenever the reader hands back a new one. Cases are
+    addressable by dav_id, and each sort/filter combination is computed
+    once per load and reused for every page.
+    """
+    def __init__(self, reader):
+        self.reader = reader
+        self._lock = threading.Lock()
+        self._source = None
+        self.cases = []
+        self.by_id = {}
+        self.stats = {}
+        self._orderings = {}
+
+    def refresh(self):
+        """Rebuild the index if the results file or the concordance CSV changed since the last load"""
+        source = (self.reader.final_output(), self.reader.original_data())
+        if self._is_current(source):
+            return
+        with self._lock:
+            if self._is_current(source):
+                return
+            cases, original = source
+            for case in cases:
+                joined = original.get(str(case.get('dav_id')), {}).get('ratings', {})
+                for col, value in joined.items():
+                    if case.get(col) is None:
+                        case[col] = parse_rating(value)
+                ratings = [parse_rating(case.get(col)) for col in RATER_COLUMNS]
+                ratings = [r for r in ratings if r is not None]
+                case['rater_disagreement'] = len(set(ratings)) > 1
+            self.by_id = {str(case['dav_id']): case for case in cases}
+            self.stats = self._compute_stats(cases)
+            self._orderings = {}
+            self.cases = cases
+            self._source = source
+
+    def _is_current(self, source):
+        return self._source is not None and all(new is old for new, old in zip(source, self._source))
+
+    def _compute_stats(self, cases):
+        total_cases = len(cases)
+        rater_counts = {}
+        for col in RATER_COLUMNS:
+            ratings = [parse_rating(c.get(col)) for c in cases]
+            rated = [r for r in ratings if r is not None]
+            if not rated:
+                continue
+            rater_counts[col.replace('Concordance_', '') if col != 'Concordance' else 'Reference'] = {
+                'concordant': sum(1 for r in rated if r == 1.0),
+                'discordant': sum(1 for r in rated if r != 1.0),
+                'rated': len(rated),
             }
-        return data_dict
-    except FileNotFoundError:
-        print(f"Warning: CSV file not found: {csv_file}")
-        return {}
+        verdict_counts = {verdict: sum(c.get(verdict, 0) or 0 for c in cases) for verdict in VERDICTS}
+        scored = [c for c in cases if has_full_scores(c)]
+        return {
+            'total_cases': total_cases,
+            # Early-stopped cases have no percentages over all their claims
+            'avg_support': sum(parse_percentage(c['support_percentage']) for c in scored) / len(scored) if scored else 0,
+            'avg_not_addressed': sum(parse_percentage(c['not_addressed_percentage']) for c in scored) / len(scored) if scored else 0,
+            'concordant_cases': sum(1 for c in cases if c.get('Concordance', 0) == 1.0),
+            'disagreement_cases': sum(1 for c in cases if c['rater_disagreement']),
+            'rater_counts': rater_counts,
+            'verdict_counts': verdict_counts,
+            'total_claims': sum(verdict_counts.values()),
+        }
+
+    def get(self, dav_id):
+        self.refresh()
+        return self.by_id.get(str(dav_id))
+
+    def query(self, sort='dav_id', descending=False, concordance=None, disagreement=None):
+        """
+        Return the cases matching the filters in the requested order.
+
+        Args:
+            sort: One of SORT_FIELDS
+            descending: Reverse the sort order
+            concordance: 'concordant', 'discordant' or None for all
+            disagreement: True/False to keep only cases where raters do/don't disagree
+        """
+        self.refresh()
+        key = (sort, descending, concordance, disagreement)
+        ordering = self._orderings.get(key)
+        if ordering is None:
+            cases = self.cases
+            if concordance == 'concordant':
+                cases = [c for c in cases if c.get('Concordance', 0) == 1.0]
+            elif concordance == 'discordant':
+                cases = [c for c in cases if c.get('Concordance', 0) != 1.0]
+            if disagreement is not None:
+                cases = [c for c in cases if c['rater_disagreement'] == disagreement]
+            ordering = sorted(cases, key=SORT_FIELDS.get(sort, SORT_FIELDS['dav_id']), reverse=descending)
+            self._orderings[key] = ordering
+        return ordering
+
+RESULTS_INDEX = ResultsIndex(RESULTS)
+
+class FragmentCache:
+    """Small thread-safe LRU cache of rendered template fragments"""
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        html = render()
+        with self._lock:
+            self._items[key] = html
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return html
+
+FRAGMENT_CACHE = FragmentCache()
+
+def cached_response(render):
+    """
+    Build a response with ETag/Last-Modified derived from the result-file
+    mtimes and the request URL; answer 304 without rendering if the client
+    already has the current version.
+    """
+    version = RESULTS.version()
+    # Pages only open the progress stream while a run is active
+    etag = hashlib.md5(f"{version}|{run_active()}|{request.full_path}".encode()).hexdigest()
+    last_modified = datetime.fromtimestamp(int(max(version)), tz=timezone.utc) if max(version) else None
+    # Pending flash messages are only shown by a full render
+    if '_flashes' not in session and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render(version))
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def parse_case_query(args):
+    """Read sort/filter options from request args"""
+    sort = args.get('sort', 'dav_id')
+    if sort not in SORT_FIELDS:
+        sort = 'dav_id'
+    concordance = args.get('concordance')
+    if concordance not in ('concordant', 'discordant'):
+        concordance = None
+    disagreement = {'yes': True, 'no': False}.get(args.get('disagreement'))
+    return {
+        'sort': sort,
+        'descending': args.get('order') == 'desc',
+        'concordance': concordance,
+        'disagreement': disagreement,
+    }
+
+def case_query_args(query, per_page):
+    """Request args equivalent to a parsed query, for filter widgets and page links"""
+    args = {'sort': query['sort'], 'order': 'desc' if query['descending'] else 'asc'}
+    if query['concordance'] is not None:
+        args['concordance'] = query['concordance']
+    if query['disagreement'] is not None:
+        args['disagreement'] = 'yes' if query['disagreement'] else 'no'
+    if per_page != DEFAULT_PER_PAGE:
+        args['per_page'] = per_page
+    return args
+
+def parse_per_page(args):
+    try:
+        per_page = int(args.get('per_page', DEFAULT_PER_PAGE))
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return max(0, int(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except (ValueError, UnicodeDecodeError):
+        return 0
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -92,48 +317,64 @@ def logout():
 @require_auth
 def dashboard():
     """Main dashboard with case overview"""
-    # Load final output data for case statistics
-    final_output = load_jsonl(os.path.join(DATA_DIR, 'final_output.jsonl'))
-    
-    # Get first 10 cases for review
-    cases = final_output[:10]
+    return cached_response(render_dashboard)
+
+def render_dashboard(version):
+    query = parse_case_query(request.args)
+    matching = RESULTS_INDEX.query(**query)
+    per_page = parse_per_page(request.args)
+    total_pages = max(1, math.ceil(len(matching) / per_page))
+    try:
+        page = min(max(1, int(request.args.get('page', 1))), total_pages)
+    except ValueError:
+        page = 1
     
-    # Calculate overall statistics
-    total_cases = len(cases)
-    avg_support = sum(float(case['support_percentage'].rstrip('%')) for case in cases) / total_cases if cases else 0
-    concordant_cases = sum(1 for case in cases if case.get('Concordance', 0) == 1.0)
+    # Cohort statistics are computed once per load of the results file;
+    # the rendered fragments are reused until any result file changes.
+    # The fragment is keyed by the normalized query, so it must only show the normalized args
+    query_args = case_query_args(query, per_page)
+    stats_html = FRAGMENT_CACHE.get_or_render(
+        ('stats', version),
+        lambda: render_template('_dashboard_stats.html', stats=RESULTS_INDEX.stats))
+    case_list_html = FRAGMENT_CACHE.get_or_render(
+        ('cases', version, tuple(sorted(query.items())), page, per_page),
+        lambda: render_template('_case_list.html',
+                                cases=matching[(page - 1) * per_page:page * per_page],
+                                matching_cases=len(matching),
+                                page=page,
+                                per_page=per_page,
+                                total_pages=total_pages,
+                                filters=query_args,
+                                base_args=query_args))
     
     return render_template('dashboard.html', 
-                         cases=cases,
-                         total_cases=total_cases,
-                         avg_support=avg_support,
-                         concordant_cases=concordant_cases)
+                         stats_html=stats_html,
+                         case_list_html=case_list_html,
+                         run_active=run_active(),
+                         poll_interval_ms=int(DASHBOARD_POLL_INTERVAL * 1000))
 
 @app.route('/case/<case_id>')
 @require_auth
 def case_detail(case_id):
     """Detailed view of a specific case"""
-    # Load all data files
-    decompositions = load_jsonl(os.path.join(DATA_DIR, 'decompositions.jsonl'))
-    verifications = load_jsonl(os.path.join(DATA_DIR, 'verifications.jsonl'))
-    final_output = load_jsonl(os.path.join(DATA_DIR, 'final_output.jsonl'))
-    original_data = load_original_data()
-    
-    # Filter data for specific case
-    case_decomps = [d for d in decompositions if d['dav_id'] == case_id]
-    case_verifs = [v for v in verifications if v['dav_id'] == case_id]
-    case_summary = next((c for c in final_output if c['dav_id'] == case_id), None)
-    case_original = original_data.get(case_id, {})
-    
+    case_summary = RESULTS_INDEX.get(case_id)
     if not case_summary:
         flash(f'Case {case_id} not found.', 'error')
         return redirect(url_for('dashboard'))
+    return cached_response(lambda version: render_case_detail(case_id, case_summary))
+
+def render_case_detail(case_id, case_summary):
+    # Per-case lookups into the shared, once-loaded result files
+    case_decomps = RESULTS.decompositions_for(case_id)
+    case_verifs = RESULTS.verifications_for(case_id)
+    case_original = RESULTS.original_data().get(case_id, {})
     
     # Combine decomposition and verification data
     case_claims = []
+    verifs_by_id = {v['id']: v for v in case_verifs}
     for decomp in case_decomps:
         # Find matching verification
-        verif = next((v for v in case_verifs if v['id'] == decomp['id']), None)
+        verif = verifs_by_id.get(decomp['id'])
         
         claim_data = {
             'claim_id': decomp['claim_id'],
@@ -156,11 +397,126 @@ def case_detail(case_id):
 @app.route('/api/cases')
 @require_auth
 def api_cases():
-    """API endpoint for case data"""
-    final_output = load_jsonl(os.path.join(DATA_DIR, 'final_output.jsonl'))
-    return {'cases': final_output[:10]}
+    """
+    API endpoint for case data.
+    
+    Supports the dashboard's sort/filter arguments plus cursor pagination:
+    pass the returned next_cursor back as ?cursor= to fetch the next page.
+    """
+    return cached_response(lambda version: render_api_cases())
 
-if __name__ == '__main__':
+def render_api_cases():
+    matching = RESULTS_INDEX.query(**parse_case_query(request.args))
+    limit = parse_per_page(request.args)
+    offset = decode_cursor(request.args.get('cursor', ''))
+    end = offset + limit
+    return {
+        'cases': matching[offset:end],
+        'total': len(matching),
+        'next_cursor': encode_cursor(end) if end < len(matching) else None,
+        'stats': RESULTS_INDEX.stats,
+    }
+
+def read_new_cases(offset):
+    """Final-output records appended after ``offset`` (None starts at the current end)"""
+    path = RESULTS.path('final_output')
+    if offset is None:
+        return [], os.path.getsize(path) if os.path.exists(path) else 0, False
+    return read_jsonl_from(path, offset)
+
+def parse_offset(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+def is_active(progress, now=None):
+    """True while the journal shows a run that is still making progress"""
+    if progress.get('status') != 'running':
+        return False
+    updated = progress.get('updated_at')
+    return updated is None or (now or time.time()) - updated < PROGRESS_STALE_AFTER
+
+def run_active():
+    JOURNAL.refresh()
+    return is_active(JOURNAL.snapshot())
+
+def progress_payload(offset):
+    JOURNAL.refresh()
+    cases, next_offset, restarted = read_new_cases(offset)
+    progress = JOURNAL.snapshot()
+    return {
+        'progress': progress,
+        'active': is_active(progress),
+        'cases': cases,
+        'next_offset': next_offset,
+        'restarted': restarted,
+    }
+
+@app.route('/api/progress')
+@require_auth
+def api_progress():
+    """
+    Polling endpoint for a running pipeline.
+
+    Returns progress, throughput and ETA from the run journal plus the cases
+    finished since ?since=<offset>; pass next_offset back as ?since= on the
+    next poll. Without ?since= only cases finished from now on are returned.
+    "active" turns false once the run ends or its journal goes stale.
+    """
+    response = jsonify(progress_payload(parse_offset(request.args.get('since'))))
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/api/progress/stream')
+@require_auth
+def api_progress_stream():
+    """
+    Server-sent events version of /api/progress.
+
+    Sends a "progress" event whenever the journal or final output grows, with
+    the output offset as the event id so a reconnecting EventSource resumes
+    where it left off. The stream sends "done" and ends once no run is active:
+    the run finished or failed, there is no journal, or a running journal has
+    gone stale (PROGRESS_STALE_AFTER). Each stream holds a worker thread, so
+    it also ends after PROGRESS_STREAM_MAX_SECONDS with a retry hint, and the
+    EventSource reconnects from its last event id. The dashboard itself polls
+    /api/progress instead.
+    """
+    offset = parse_offset(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    def events():
+        nonlocal offset
+        last_sent = 0.0
+        last_updated = None
+        deadline = time.monotonic() + PROGRESS_STREAM_MAX_SECONDS
+        yield f"retry: {PROGRESS_STREAM_RETRY_MS}\n\n"
+        while True:
+            payload = progress_payload(offset)
+            offset = payload['next_offset']
+            progress = payload['progress']
+            if payload['cases'] or payload['restarted'] or progress.get('updated_at') != last_updated:
+                last_updated = progress.get('updated_at')
+                last_sent = time.monotonic()
+                yield f"id: {offset}\nevent: progress\ndata: {json.dumps(payload)}\n\n"
+            elif time.monotonic() - last_sent >= PROGRESS_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if not is_active(progress):
+                yield f"id: {offset}\nevent: done\ndata: {json.dumps(progress)}\n\n"
+                return
+            if time.monotonic() >= deadline:
+                # Free the thread; the client reconnects after the retry delay
+                return
+            time.sleep(PROGRESS_POLL_INTERVAL)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def main():
+    """Run the development server"""
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
     os.makedirs('static', exist_ok=True)
@@ -168,10 +524,14 @@ if __name__ == '__main__':
     print("Starting SAGE Case Review Web Interface...")
     print("Access the interface at: http://localhost:5001")
     print(f"Password: {REVIEW_PASSWORD}")
+    print(f"Serving results from: {DATA_DIR}")
     
     # Use environment variables for production
-    debug_mode = os.environ.get('FLASK_ENV') != 'production'
+    debug_mode = os.environ.get('SAGE_DEBUG', '1' if os.environ.get('FLASK_ENV') != 'production' else '0') == '1'
     port = int(os.environ.get('PORT', 5001))
     host = '0.0.0.0' if os.environ.get('FLASK_ENV') == 'production' else '127.0.0.1'
     
-    app.run(debug=debug_mode, host=host, port=port)
\ No newline at end of file
+    app.run(debug=debug_mode, host=host, port=port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for serving the SAGE review app
+
+Threaded workers keep one slow case page from blocking a whole worker, and
+the app is preloaded so the results index is built once in the master and
+shared copy-on-write by every forked worker. All values can be overridden
+through the environment.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+# Recycle workers occasionally so memory growth from reloaded results stays bounded
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+preload_app = True
+accesslog = '-'
+
+
+def when_ready(server):
+    # Move everything loaded during preload into the permanent generation so
+    # the garbage collector does not touch (and copy) those pages in workers
+    gc.freeze()
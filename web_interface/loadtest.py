@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Load test for the SAGE review app
+
+Logs in once per client thread, then requests /dashboard and /case/<id> in a
+closed loop for a fixed duration and reports requests/sec and latency
+percentiles per endpoint. Uses only the standard library so it can run next
+to the server without extra installs.
+
+    python loadtest.py --base_url http://127.0.0.1:5001 --concurrency 32 --duration 30
+"""
+
+import argparse
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+
+def make_client(base_url, password):
+    """Return an opener carrying an authenticated session cookie"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'password': password}).encode()
+    opener.open(f"{base_url}/login", data=data, timeout=30).read()
+    return opener
+
+
+def fetch_case_ids(opener, base_url, limit):
+    with opener.open(f"{base_url}/api/cases?per_page={limit}", timeout=30) as response:
+        return [str(case['dav_id']) for case in json.load(response)['cases']]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+def worker(base_url, password, case_ids, deadline, results, lock, case_ratio):
+    opener = make_client(base_url, password)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    while time.perf_counter() < deadline:
+        if case_ids and random.random() < case_ratio:
+            endpoint, path = '/case/<id>', f"/case/{random.choice(case_ids)}"
+        else:
+            endpoint, path = '/dashboard', '/dashboard'
+        start = time.perf_counter()
+        try:
+            with opener.open(f"{base_url}{path}", timeout=60) as response:
+                response.read()
+            latencies[endpoint].append(time.perf_counter() - start)
+        except (urllib.error.URLError, OSError):
+            errors[endpoint] += 1
+    with lock:
+        for endpoint, values in latencies.items():
+            results['latencies'][endpoint].extend(values)
+        for endpoint, count in errors.items():
+            results['errors'][endpoint] += count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SAGE review app")
+    parser.add_argument('--base_url', default='http://127.0.0.1:5001', help='Server to test')
+    parser.add_argument('--password', default='djhwu', help='Review password')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--case_ratio', type=float, default=0.5, help='Fraction of requests that hit /case/<id>')
+    parser.add_argument('--case_pool', type=int, default=100, help='Number of case ids to sample from')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    case_ids = fetch_case_ids(make_client(base_url, args.password), base_url, args.case_pool)
+    results = {'latencies': defaultdict(list), 'errors': defaultdict(int)}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(base_url, args.password, case_ids, deadline, results, lock, args.case_ratio))
+        for _ in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.concurrency} clients, {elapsed:.1f}s")
+    print(f"{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for endpoint in ('/dashboard', '/case/<id>'):
+        values = results['latencies'].get(endpoint, [])
+        print(f"{endpoint:<12} {len(values):>9} {results['errors'].get(endpoint, 0):>7} {len(values) / elapsed:>9.1f} "
+              f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
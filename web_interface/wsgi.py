@@ -1,4 +1,8 @@
-from app import app
+from app import app, RESULTS_INDEX
+
+# Build the results index at import time; with gunicorn's preload_app this
+# happens once in the master before the workers are forked
+RESULTS_INDEX.refresh()
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()